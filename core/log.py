@@ -0,0 +1,150 @@
+"""
+Logging helpers: a bounded queue handler drained by a background thread,
+a JSON formatter and a sampling filter
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line
+    """
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'process': record.process,
+            'thread': record.thread,
+        }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(data, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a random ``rate`` share of the records below WARNING
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records instead of blocking when the writer
+    falls behind, and counts what it dropped
+    """
+
+    def __init__(self, queue, listener):
+        super().__init__(queue)
+        self.listener = listener
+        self.dropped = 0
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def close(self):
+        self.closed = True
+        stop_listener(self)
+        super().close()
+
+
+def stop_listener(handler):
+    listener = handler.listener
+    if listener._thread is None:
+        return
+    # QueueListener.stop() would fail on a full queue; wait for room instead
+    listener.queue.put(listener._sentinel)
+    listener._thread.join()
+    listener._thread = None
+    if handler.dropped:
+        record = logging.LogRecord(
+            'core.log', logging.WARNING, __file__, 0,
+            'Dropped %d log records, the log queue was full', (handler.dropped,), None
+        )
+        record = handler.prepare(record)
+        for target in listener.handlers:
+            target.handle(record)
+    for target in listener.handlers:
+        target.close()
+
+
+def log_target(filename=None, max_bytes=10 * 1024 * 1024, backup_count=5):
+    """
+    The handler the listener writes with: stderr without a filename, else
+    a file every process appends to and an external tool such as
+    logrotate rotates, reopened when it is moved away. A ``{pid}`` in
+    ``filename`` opts into a file per process instead, which only that
+    process writes to and so rotates itself at ``max_bytes``.
+    """
+    if not filename:
+        return logging.StreamHandler(sys.stderr)
+    per_process = '{pid}' in filename
+    filename = filename.replace('{pid}', str(os.getpid()))
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    if not per_process:
+        return logging.handlers.WatchedFileHandler(filename, encoding='utf-8')
+    return logging.handlers.RotatingFileHandler(
+        filename, maxBytes=int(max_bytes), backupCount=int(backup_count), encoding='utf-8'
+    )
+
+
+def queue_handler(filename=None, max_bytes=10 * 1024 * 1024, backup_count=5, queue_size=10_000):
+    """
+    Build a BoundedQueueHandler whose background listener writes to
+    ``filename``, or to stderr when no filename is given, see
+    ``log_target``.
+
+    Records are formatted on the calling thread by the formatter set on the
+    returned handler; only the write happens in the background.
+    """
+    records = queue.Queue(int(queue_size))
+    listener = logging.handlers.QueueListener(records, log_target(filename, max_bytes, backup_count))
+    handler = BoundedQueueHandler(records, listener)
+    handler.target = (filename, max_bytes, backup_count)
+    listener.start()
+    atexit.register(stop_listener, handler)
+    # The listener thread does not survive a fork, e.g. a preloading server
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: restart_listener(handler))
+    return handler
+
+
+def restart_listener(handler):
+    if handler.closed:
+        return
+    # The inherited queue's lock may have been held by the parent's listener
+    handler.queue = handler.listener.queue = queue.Queue(handler.queue.maxsize)
+    handler.dropped = 0
+    handler.listener._thread = None
+    if handler.target[0]:
+        # The child appends through its own descriptor, or to its own file
+        handler.listener.handlers = (log_target(*handler.target),)
+    handler.listener.start()
@@ -12,7 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
-from datetime import datetime
+
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -22,12 +23,14 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = "django-insecure-p1nhs!^vpcj=m0s-db%ggyy(eo42-3ct(mw--h%hnwb4aq89aw"
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY', "django-insecure-p1nhs!^vpcj=m0s-db%ggyy(eo42-3ct(mw--h%hnwb4aq89aw"
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1').lower() in ('1', 'true', 'yes', 'on')
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
 
 
 # Application definition
@@ -57,6 +60,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "inventory.middleware.ReplicaPinningMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -84,12 +88,88 @@ WSGI_APPLICATION = "core.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+#
+# DJANGO_DB_PROFILE picks the database profile:
+#
+#   sqlite          the default: SQLite in WAL mode, tuned for concurrent
+#                   writers by the PRAGMAs in INVENTORY_SQLITE_PRAGMAS
+#                   (applied to every new connection by inventory.db)
+#   sqlite-untuned  SQLite as Django opens it, for comparison
+#   postgres        PostgreSQL, configured from POSTGRES_DB, POSTGRES_USER,
+#                   POSTGRES_PASSWORD, POSTGRES_HOST and POSTGRES_PORT;
+#                   needs psycopg (pip install -r requirements-postgres.txt)
+#
+#   DJANGO_DB_NAME              SQLite database file
+#   DJANGO_DB_CONN_MAX_AGE      seconds a connection is kept between
+#                               requests (60; 0 closes it after each one)
+#   DJANGO_DB_SERVER_SIDE_CURSORS
+#                               0 to disable PostgreSQL server-side cursors,
+#                               needed behind a transaction-pooling
+#                               PgBouncer (on by default; the exports and
+#                               snapshots stream through them)
+
+DB_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'sqlite')
+CONN_MAX_AGE = int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', 60))
+
+if DB_PROFILE == 'postgres':
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get('POSTGRES_DB', 'inventory'),
+            "USER": os.environ.get('POSTGRES_USER', ''),
+            "PASSWORD": os.environ.get('POSTGRES_PASSWORD', ''),
+            "HOST": os.environ.get('POSTGRES_HOST', ''),
+            "PORT": os.environ.get('POSTGRES_PORT', ''),
+            "CONN_MAX_AGE": CONN_MAX_AGE,
+            # Reused connections are checked before each request, so a
+            # database restart costs one reconnect instead of a 500
+            "CONN_HEALTH_CHECKS": True,
+            "DISABLE_SERVER_SIDE_CURSORS": os.environ.get('DJANGO_DB_SERVER_SIDE_CURSORS', '1') == '0',
+            "OPTIONS": {"connect_timeout": 5},
+        }
     }
-}
+elif DB_PROFILE in ('sqlite', 'sqlite-untuned'):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get('DJANGO_DB_NAME', BASE_DIR / "db.sqlite3"),
+            "CONN_MAX_AGE": CONN_MAX_AGE if DB_PROFILE == 'sqlite' else 0,
+            # Writers take the lock when their transaction starts, and wait
+            # for it, instead of failing with "database is locked" when a
+            # read lock cannot be upgraded
+            "OPTIONS": {"transaction_mode": "IMMEDIATE"} if DB_PROFILE == 'sqlite' else {},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'Unknown DJANGO_DB_PROFILE {DB_PROFILE!r}')
+
+# Read replica
+#
+# Admin changelists, exports and the stock API read from a "replica"
+# alias when one is configured; writes, transactions and sessions that
+# wrote in the last INVENTORY_REPLICA_PIN_SECONDS stay on the primary
+# (inventory.routers):
+#
+#   DJANGO_DB_REPLICA_NAME  SQLite file standing in for the replica, e.g. a
+#                           copy of the primary kept up to date with
+#                           "sqlite3 db.sqlite3 '.backup replica.sqlite3'"
+#   POSTGRES_REPLICA_HOST   host of a PostgreSQL streaming replica, with
+#                           the primary's name and credentials
+
+if DB_PROFILE == 'postgres' and os.environ.get('POSTGRES_REPLICA_HOST'):
+    DATABASES["replica"] = {**DATABASES["default"], "HOST": os.environ['POSTGRES_REPLICA_HOST']}
+elif DB_PROFILE != 'postgres' and os.environ.get('DJANGO_DB_REPLICA_NAME'):
+    DATABASES["replica"] = {**DATABASES["default"], "NAME": os.environ['DJANGO_DB_REPLICA_NAME']}
+
+DATABASE_ROUTERS = ['inventory.routers.ReplicaRouter']
+INVENTORY_REPLICA_PIN_SECONDS = int(os.environ.get('DJANGO_DB_REPLICA_PIN_SECONDS', 10))
+
+INVENTORY_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+} if DB_PROFILE == 'sqlite' else {}
 
 
 # Password validation
@@ -111,11 +191,95 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Cache
+#
+# Also backs the stockard lookup cache of the stock engine
+# (inventory.services.lookups). The default is per process; point every
+# worker at a shared backend to share entries and invalidations:
+#
+#   DJANGO_CACHE_BACKEND   cache backend class
+#   DJANGO_CACHE_LOCATION  backend location, e.g. a directory for the
+#                          file based cache or a server address
+#
+# Within a process, lookups are kept in memory for up to
+# INVENTORY_LOOKUP_LOCAL_TTL seconds (30), which bounds how long another
+# process's invalidations take to be seen.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": os.environ.get('DJANGO_CACHE_LOCATION', ''),
+        "OPTIONS": {"MAX_ENTRIES": 50_000},
+    }
+}
+
+
+# Stock availability API (/api/stock/availability/)
+#
+# Open to users with the "view stock" permission, and to services sending
+# "Authorization: Bearer <token>" when INVENTORY_API_TOKEN is set.
+
+INVENTORY_API_TOKEN = os.environ.get('INVENTORY_API_TOKEN', '')
+
+
+# Outbox
+#
+# Movements saved in the admin with at least INVENTORY_DEFERRED_POSTING_LINES
+# new lines, or saved behind such a movement in the same warehouse, are
+# posted by "manage.py process_outbox" workers after the request commits.
+# Unset, every movement is posted in its request.
+
+INVENTORY_DEFERRED_POSTING_LINES = (
+    int(os.environ['INVENTORY_DEFERRED_POSTING_LINES']) if os.environ.get('INVENTORY_DEFERRED_POSTING_LINES') else None
+)
+
+
+# Stock alerts
+#
+# Summaries crossing their reorder point queue a StockAlert as the stock
+# changes; "manage.py send_stock_alerts" hands them to INVENTORY_ALERT_DIGEST
+# (a dotted path taking the alerts), by default mailed to ADMINS.
+
+ADMINS = [
+    ('Inventory', address) for address in os.environ.get('DJANGO_ADMINS', '').split(',') if address
+]
+
+
+# Movement archive
+#
+# "manage.py archive_movements" moves closed movements older than
+# INVENTORY_ARCHIVE_AFTER_MONTHS into the archive tables, so the hot
+# movement tables and their indexes stay the size of that window. The
+# admin lists the archive under its own changelist.
+
+INVENTORY_ARCHIVE_AFTER_MONTHS = int(os.environ.get('INVENTORY_ARCHIVE_AFTER_MONTHS', 12))
+
+
 # Logging configuration
+#
+# Records are formatted on the calling thread, then a background thread
+# writes them to the log file, so requests never wait on disk. When
+# the bounded queue is full new records are dropped and counted; the count
+# is logged at shutdown. Tuned from the environment:
+#
+#   DJANGO_LOG_LEVEL         level of the root and django loggers
+#                            (DEBUG when DEBUG is on, INFO otherwise)
+#   DJANGO_LOG_FORMAT        text or json
+#   DJANGO_LOG_FILE          log file path, or "-" for stderr. Every
+#                            process appends to the one file, which is
+#                            left to logrotate or the like to rotate; a
+#                            "{pid}" in the path gives each process a file
+#                            of its own that it rotates itself
+#   DJANGO_LOG_MAX_BYTES     size at which a per-process file rotates
+#   DJANGO_LOG_BACKUP_COUNT  rotated per-process files kept
+#   DJANGO_LOG_QUEUE_SIZE    records buffered before dropping
+#   DJANGO_LOG_SQL_LEVEL     level of django.db.backends (INFO); DEBUG
+#                            logs every query when DEBUG is on
+#   DJANGO_LOG_SQL_SAMPLE    share of django.db.backends records kept, 0-1
 
 LOG_DIR = os.path.join(BASE_DIR, 'DEBUG')
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
+LOG_LEVEL = os.environ.get('DJANGO_LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO').upper()
+LOG_FILE = os.environ.get('DJANGO_LOG_FILE', os.path.join(LOG_DIR, 'django.log'))
 
 LOGGING = {
     'version': 1,
@@ -129,13 +293,25 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'core.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sql_sample': {
+            '()': 'core.log.SamplingFilter',
+            'rate': os.environ.get('DJANGO_LOG_SQL_SAMPLE', '1' if DEBUG else '0'),
+        },
     },
     'handlers': {
         'file': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(LOG_DIR, f'django_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log'),
-            'formatter': 'verbose',
+            'level': LOG_LEVEL,
+            '()': 'core.log.queue_handler',
+            'filename': None if LOG_FILE == '-' else LOG_FILE,
+            'max_bytes': os.environ.get('DJANGO_LOG_MAX_BYTES', 10 * 1024 * 1024),
+            'backup_count': os.environ.get('DJANGO_LOG_BACKUP_COUNT', 5),
+            'queue_size': os.environ.get('DJANGO_LOG_QUEUE_SIZE', 10_000),
+            'formatter': 'json' if os.environ.get('DJANGO_LOG_FORMAT') == 'json' else 'verbose',
         },
         'console': {
             'level': 'ERROR',
@@ -145,12 +321,25 @@ LOGGING = {
     },
     'root': {
         'handlers': ['file', 'console'],
-        'level': 'DEBUG',
+        'level': LOG_LEVEL,
     },
     'loggers': {
         'django': {
             'handlers': ['file', 'console'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        # Missing-variable debug records repr the whole template context,
+        # which evaluates every queryset in it
+        'django.template': {
+            'handlers': ['file', 'console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'django.db.backends': {
+            'handlers': ['file', 'console'],
+            'level': os.environ.get('DJANGO_LOG_SQL_LEVEL', 'INFO').upper(),
+            'filters': ['sql_sample'],
             'propagate': False,
         },
     },
@@ -1,9 +1,18 @@
-from .models import StockMovementAdmin, WarehouseAdmin, StockardAdmin, ProductAdmin, StockAdmin
+from .models import (
+    StockMovementAdmin, WarehouseAdmin, StockardAdmin, ProductAdmin, StockAdmin, StockSummaryAdmin, StockSnapshotAdmin,
+    StockAlertAdmin, StockReservationAdmin, OutboxEventAdmin, ArchivedStockMovementAdmin
+)
 
 __all__ = [
     'StockMovementAdmin',
     'WarehouseAdmin',
     'StockardAdmin',
     'ProductAdmin',
-    'StockAdmin'
+    'StockAdmin',
+    'StockSummaryAdmin',
+    'StockSnapshotAdmin',
+    'StockAlertAdmin',
+    'StockReservationAdmin',
+    'OutboxEventAdmin',
+    'ArchivedStockMovementAdmin'
 ]
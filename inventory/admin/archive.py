@@ -0,0 +1,41 @@
+from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from django.utils.translation import gettext_lazy as _
+from .pagination import AFTER_VAR, BEFORE_VAR
+
+TIER_VAR = 'tier'
+
+
+class ArchiveFilter(admin.SimpleListFilter):
+    """
+    Offer the archived rows next to the hot ones. The archive lives in
+    other tables, so picking it is turned into the archive changelist by
+    ``ArchiveTierMixin`` rather than filtering this queryset.
+    """
+    title = _('history')
+    parameter_name = TIER_VAR
+
+    def lookups(self, request, model_admin):
+        return (('archive', _('Archived')),)
+
+    def queryset(self, request, queryset):
+        return queryset
+
+
+class ArchiveTierMixin:
+    """
+    Send changelist requests for the archive to ``archive_changelist``
+    (a URL name), keeping the filters and search the two share
+    """
+    archive_changelist = None
+
+    def changelist_view(self, request, extra_context=None):
+        if request.GET.get(TIER_VAR) != 'archive':
+            return super().changelist_view(request, extra_context)
+        params = request.GET.copy()
+        for name in (TIER_VAR, PAGE_VAR, AFTER_VAR, BEFORE_VAR):
+            params.pop(name, None)
+        url = reverse(self.archive_changelist, current_app=self.admin_site.name)
+        return HttpResponseRedirect(f'{url}?{params.urlencode()}' if params else url)
@@ -0,0 +1,132 @@
+import hashlib
+from django import forms
+from django.conf import settings
+from django.contrib.admin.views.autocomplete import AutocompleteJsonView
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.cache import cache
+from django.db import connections
+from ..functions import PrefixKey, fold_prefix
+
+CACHE_PREFIX = 'inventory:autocomplete'
+
+
+def prefix_bounds(term):
+    """
+    Return the ``[low, high)`` range holding every string that starts with
+    ``term``, or ``None`` for an empty term
+    """
+    if not term:
+        return None
+    last = ord(term[-1])
+    if last == 0x10FFFF:
+        return term, None
+    return term, term[:-1] + chr(last + 1)
+
+
+def version_key(model):
+    return f'{CACHE_PREFIX}:{model._meta.label_lower}:version'
+
+
+def invalidate(model):
+    """
+    Drop every cached autocomplete result for ``model``
+    """
+    try:
+        cache.incr(version_key(model))
+    except ValueError:
+        cache.set(version_key(model), 1, None)
+
+
+class PrefixAutocompleteMixin:
+    """
+    Answer the admin autocomplete view with a prefix match on
+    ``autocomplete_field`` instead of ``search_fields``.
+
+    The match is a range over the lower-cased field in code point order,
+    ``PrefixKey``, so the functional index on it serves both the filter and
+    the ordering whatever the size of the table. Other databases than
+    PostgreSQL and SQLite match with ``istartswith`` instead. The first ``autocomplete_limit`` matching primary keys
+    are cached per search term, which covers the first pages of results;
+    pages past them are read from the database, through the same index.
+    Changelist searches are left alone.
+    """
+    autocomplete_field = 'name'
+    autocomplete_limit = 100
+
+    def get_search_results(self, request, queryset, search_term):
+        match = request.resolver_match
+        if match is None or match.url_name != 'autocomplete':
+            return super().get_search_results(request, queryset, search_term)
+
+        term = fold_prefix(search_term.strip(), connections[queryset.db].vendor)
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        if page * AutocompleteJsonView.paginate_by > self.autocomplete_limit:
+            return self.prefix_search(queryset, term), False
+
+        key = self.get_autocomplete_cache_key(request, term)
+        pks = cache.get(key)
+        if pks is None:
+            # One more than the limit, so the last cached page knows more follow
+            pks = list(self.prefix_search(queryset, term).values_list('pk', flat=True)[:self.autocomplete_limit + 1])
+            cache.set(key, pks, getattr(settings, 'INVENTORY_AUTOCOMPLETE_CACHE_TIMEOUT', 300))
+        # In the order the uncached pages continue from
+        return self.prefix_search(queryset.filter(pk__in=pks), ''), False
+
+    def prefix_search(self, queryset, term):
+        queryset = queryset.alias(autocomplete_key=PrefixKey(self.autocomplete_field))
+        bounds = prefix_bounds(term)
+        if bounds is not None and connections[queryset.db].vendor not in ('postgresql', 'sqlite'):
+            queryset = queryset.filter(**{f'{self.autocomplete_field}__istartswith': term})
+        elif bounds is not None:
+            low, high = bounds
+            queryset = queryset.filter(autocomplete_key__gte=low)
+            if high is not None:
+                queryset = queryset.filter(autocomplete_key__lt=high)
+        return queryset.order_by('autocomplete_key', 'pk')
+
+    def get_autocomplete_cache_key(self, request, term):
+        # The source field decides limit_choices_to, so it is part of the key
+        version = cache.get_or_set(version_key(self.model), 1, None)
+        source = f'{request.GET.get("app_label")}.{request.GET.get("model_name")}.{request.GET.get("field_name")}'
+        digest = hashlib.md5(f'{source}:{term}'.encode()).hexdigest()
+        return f'{CACHE_PREFIX}:{self.model._meta.label_lower}:{version}:{digest}'
+
+
+class PreloadedAutocompleteSelect(AutocompleteSelect):
+    """
+    AutocompleteSelect that labels its selected option from a related object
+    the form has already loaded instead of querying for it on every row
+    """
+    preloaded = None
+
+    def optgroups(self, name, value, attr=None):
+        selected = [str(v) for v in value if str(v) not in self.choices.field.empty_values]
+        obj = self.preloaded
+        if obj is None or selected != [str(obj.pk)]:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        label = self.choices.field.label_from_instance(obj)
+        options.append(self.create_option(name, obj.pk, label, set(selected), len(options)))
+        return [(None, options, 0)]
+
+
+class PreloadedAutocompleteForm(forms.ModelForm):
+    """
+    Hand related objects already cached on the instance, e.g. through
+    ``select_related``, to its ``PreloadedAutocompleteSelect`` widgets
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name, field in self.fields.items():
+            widget = getattr(field.widget, 'widget', field.widget)
+            if not isinstance(widget, PreloadedAutocompleteSelect):
+                continue
+            model_field = self._meta.model._meta.get_field(name)
+            if model_field.is_cached(self.instance):
+                widget.preloaded = getattr(self.instance, name)
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.contrib import admin
+from django.db import router
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from ..exports import CONTENT_TYPES, stream_csv, stream_xlsx
+from ..routers import replica_reads
+
+
+class StreamingExportMixin:
+    """
+    Admin actions streaming the selected rows as CSV or XLSX.
+
+    ``export_fields`` lists ``(header, lookup)`` pairs read with
+    ``values_list`` and ``iterator()``, so no model instances are built and
+    only one chunk of rows is held in memory while the response is sent.
+    The rows are read from the replica when one is configured.
+    """
+    export_fields = ()
+    actions = ('export_csv', 'export_xlsx')
+
+    def get_export_queryset(self, request, queryset):
+        return queryset
+
+    def stream_export(self, request, queryset, format):
+        queryset = self.get_export_queryset(request, queryset)
+        # The rows are read while the response streams, after the request
+        # has left the block, so the database is chosen now
+        with replica_reads():
+            queryset = queryset.using(router.db_for_read(queryset.model))
+        headers = [header for header, _lookup in self.export_fields]
+        rows = queryset.values_list(*[lookup for _header, lookup in self.export_fields]).iterator(
+            chunk_size=getattr(settings, 'INVENTORY_EXPORT_CHUNK_SIZE', 2000)
+        )
+        name = queryset.model._meta.verbose_name_plural.title()
+        if format == 'csv':
+            content = stream_csv(headers, rows)
+        else:
+            content = stream_xlsx(headers, rows, title=name)
+        response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[format])
+        filename = f'{queryset.model._meta.model_name}-{timezone.now():%Y%m%d-%H%M%S}.{format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.action(description=_('Export selected rows as CSV'))
+    def export_csv(self, request, queryset):
+        return self.stream_export(request, queryset, 'csv')
+
+    @admin.action(description=_('Export selected rows as XLSX'))
+    def export_xlsx(self, request, queryset):
+        return self.stream_export(request, queryset, 'xlsx')
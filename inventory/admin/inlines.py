@@ -1,56 +1,142 @@
+from collections import defaultdict
+from django.contrib import messages
 from django.core.exceptions import ValidationError
+from django.forms.models import BaseInlineFormSet
 from django.utils.translation import gettext_lazy as _
 from unfold.admin import TabularInline
-from ..models import Stock, StockMovementItem, Stockard
+from .autocomplete import PreloadedAutocompleteForm, PreloadedAutocompleteSelect
+from ..models import ArchivedStockMovementItem, Stock, StockMovementItem, StockSummary
+from ..services import save_movement_items
+from ..services.outbox import defer_post, is_queued, should_defer
 
-class StockInline(TabularInline):
+# Request attribute carrying an InsufficientStock raised while saving
+STOCK_ERROR = '_inventory_stock_error'
+
+class SharedChoicesMixin:
+    """
+    Evaluate foreign key choices once per formset instead of once per row.
+    Autocomplete fields reuse the related object each row already loaded.
+    """
+    form = PreloadedAutocompleteForm
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        autocomplete = db_field.name in self.get_autocomplete_fields(request)
+        if autocomplete and 'widget' not in kwargs:
+            kwargs['widget'] = PreloadedAutocompleteSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if formfield is not None and not autocomplete:
+            formfield.choices = list(formfield.choices)
+        return formfield
+
+class StockInline(SharedChoicesMixin, TabularInline):
     model = Stock
     extra = 1
     fields = ('product', 'quantity')
     readonly_fields = ()
+    autocomplete_fields = ('product',)
     ordering = ('product__name',)
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related('product')
+        return qs.select_related('product', 'stockard__warehouse')
+
+class StockMovementItemFormSet(BaseInlineFormSet):
+    """
+    Check that the source warehouse can cover the net quantity each product
+    takes out, with one query for the whole formset
+    """
+    # Set by StockMovementItemInline when saving failed for lack of stock
+    stock_error = None
 
-class StockMovementItemInline(TabularInline):
+    def clean(self):
+        super().clean()
+        if self.stock_error is not None:
+            raise ValidationError(self.stock_error.messages)
+        movement = self.instance
+        if movement.pk is not None and is_queued(movement):
+            raise ValidationError(_('The lines of this movement are still being posted; try again shortly'))
+        if movement.movement_type not in ('OUT', 'TRANSFER') or not movement.from_warehouse_id:
+            return
+        needed = defaultdict(int)
+        forms = defaultdict(list)
+        for form in self.forms:
+            cleaned = getattr(form, 'cleaned_data', None) or {}
+            loaded = getattr(form.instance, '_loaded_values', None)
+            # A saved line hands back what it took before taking again
+            if form.instance.pk is not None and loaded and loaded.get('from_stockard_id'):
+                needed[loaded['product_id']] -= loaded['quantity']
+            if cleaned.get('product') and cleaned.get('quantity') and not self._should_delete_form(form):
+                needed[cleaned['product'].pk] += cleaned['quantity']
+                forms[cleaned['product'].pk].append(form)
+        needed = {product_id: quantity for product_id, quantity in needed.items() if quantity > 0}
+        if not needed:
+            return
+
+        # The stock engine picks from every bin, but never the units held by
+        # reservations
+        available = {
+            product_id: max(0, quantity - reserved)
+            for product_id, quantity, reserved in StockSummary.objects.filter(
+                product_id__in=needed, warehouse_id=movement.from_warehouse_id, quantity__gt=0
+            ).values_list('product_id', 'quantity', 'reserved_quantity')
+        }
+        for product_id, quantity in needed.items():
+            if product_id not in available:
+                message = _('No stock available for this product in the selected warehouse')
+            elif available[product_id] < quantity:
+                message = _('Not enough stock available. Only {} more units can be taken').format(available[product_id])
+            else:
+                continue
+            for form in forms[product_id]:
+                form.add_error('quantity', message)
+
+
+class StockMovementItemInline(SharedChoicesMixin, TabularInline):
     model = StockMovementItem
+    formset = StockMovementItemFormSet
     extra = 1
     fields = (
         'product',
         'quantity'
     )
     readonly_fields = ()
+    autocomplete_fields = ('product',)
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.select_related('product')
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.stock_error = getattr(request, STOCK_ERROR, None)
+        return formset
 
     def save_formset(self, request, formset, change):
         instances = formset.save(commit=False)
-        for instance in instances:
-            # Create stockards before validation
-            if instance.movement.movement_type == 'IN':
-                instance.to_stockard = Stockard.objects.get_or_create(
-                    warehouse=instance.movement.to_warehouse,
-                    name=f"{instance.product.name} Stock"
-                )[0]
-            elif instance.movement.movement_type == 'OUT':
-                instance.from_stockard = Stock.objects.filter(
-                    product=instance.product,
-                    stockard__warehouse=instance.movement.from_warehouse
-                ).order_by('stockard__name').first()
-                if not instance.from_stockard:
-                    raise ValidationError(_('No stock available for this product in the selected warehouse'))
-                instance.from_stockard = instance.from_stockard.stockard
-            elif instance.movement.movement_type == 'TRANSFER':
-                instance.from_stockard = Stock.objects.filter(
-                    product=instance.product,
-                    stockard__warehouse=instance.movement.from_warehouse
-                ).order_by('stockard__name').first()
-                if not instance.from_stockard:
-                    raise ValidationError(_('No stock available for this product in the selected warehouse'))
-                instance.from_stockard = instance.from_stockard.stockard
-                instance.to_stockard = Stockard.objects.get_or_create(
-                    warehouse=instance.movement.to_warehouse,
-                    name=f"{instance.product.name} Transfer Stock"
-                )[0]
-            instance.save()
+        created = [instance for instance in instances if instance.pk is None]
+        changed = [instance for instance, _fields in formset.changed_objects]
+        if created and not (changed or formset.deleted_objects) and should_defer(formset.instance, created):
+            # Large or queued-behind posts go to the process_outbox worker,
+            # queued in the transaction that saves the movement
+            defer_post(formset.instance, created)
+            messages.info(request, _('The lines are being posted in the background'))
+        else:
+            # New, edited and deleted lines are written together, applying
+            # only the net change in stock
+            save_movement_items(formset.instance, created=created, changed=changed, deleted=formset.deleted_objects)
         formset.save_m2m()
+
+class ArchivedStockMovementItemInline(TabularInline):
+    model = ArchivedStockMovementItem
+    fields = ('product', 'from_stockard', 'to_stockard', 'quantity')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'product', 'from_stockard__warehouse', 'to_stockard__warehouse'
+        )
+
+    def has_add_permission(self, request, obj=None):
+        return False
@@ -1,12 +1,35 @@
 from django.contrib import admin
+from django.db import router, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from .inlines import StockInline, StockMovementItemInline
+from .archive import ArchiveFilter, ArchiveTierMixin
+from .autocomplete import PrefixAutocompleteMixin
+from .exports import StreamingExportMixin
+from .inlines import STOCK_ERROR, ArchivedStockMovementItemInline, StockInline, StockMovementItemInline
+from .pagination import KeysetPaginationMixin
+from .replicas import ReplicaReadsMixin
+from .search import SearchBackendMixin
+from import_export.admin import ImportExportModelAdmin
 from unfold.admin import ModelAdmin
-from ..models import Warehouse, Stockard, Product, Stock, StockMovement
+from unfold.contrib.import_export.forms import ExportForm, ImportForm
+from ..models import (
+    ArchivedStockMovement, OutboxEvent, Warehouse, Stockard, Product, Stock, StockAlert, StockMovement,
+    StockMovementItem, StockReservation, StockSnapshot, StockSummary
+)
+from ..resources import ProductResource, StockMovementResource, StockResource
+from ..services import unpost_movements
+from ..services.alerts import set_reorder_point
+from ..services.reservations import release_reservations
+from ..services.stock import InsufficientStock
 
 @admin.register(StockMovement)
-class StockMovementAdmin(ModelAdmin):
+class StockMovementAdmin(ArchiveTierMixin, ReplicaReadsMixin, StreamingExportMixin, SearchBackendMixin, KeysetPaginationMixin, ModelAdmin, ImportExportModelAdmin):
+    resource_classes = [StockMovementResource]
+    import_form_class = ImportForm
+    export_form_class = ExportForm
     ordering = ('-created_at',)
+    archive_changelist = 'admin:inventory_archivedstockmovement_changelist'
     fieldsets = (
         (None, {
             'fields': (
@@ -33,22 +56,97 @@ class StockMovementAdmin(ModelAdmin):
         'created_at',
         'created_by'
     )
+    list_select_related = ('from_warehouse', 'to_warehouse', 'created_by')
+    # Movements past INVENTORY_ARCHIVE_AFTER_MONTHS are only listed with
+    # the archive filter
     list_filter = (
         'movement_type',
         'created_at',
         'from_warehouse',
-        'to_warehouse'
+        'to_warehouse',
+        ArchiveFilter
     )
     search_fields = (
         'reference_number',
         'notes',
         'items__product__name'
     )
+    search_exact_fields = ('reference_number',)
     readonly_fields = ('created_at', 'created_by')
+    autocomplete_fields = ('from_warehouse', 'to_warehouse')
     inlines = [StockMovementItemInline]
+    # One row per item, so a year of movements exports as its full history
+    export_fields = (
+        ('reference_number', 'movement__reference_number'),
+        ('movement_type', 'movement__movement_type'),
+        ('created_at', 'movement__created_at'),
+        ('from_warehouse', 'movement__from_warehouse__name'),
+        ('to_warehouse', 'movement__to_warehouse__name'),
+        ('product', 'product__name'),
+        ('from_stockard', 'from_stockard__name'),
+        ('to_stockard', 'to_stockard__name'),
+        ('quantity', 'quantity'),
+    )
+
+    def get_export_queryset(self, request, queryset):
+        return StockMovementItem.objects.filter(
+            movement__in=queryset.order_by().values('pk')
+        ).order_by('movement__created_at', 'movement_id', 'pk')
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except InsufficientStock as error:
+            # Picking can still come up short of what the formset check
+            # counted, e.g. when another movement took the stock meanwhile.
+            # The save was rolled back; show the form again with the error
+            setattr(request, STOCK_ERROR, error)
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def delete_queryset(self, request, queryset):
+        # The bulk delete action skips StockMovement.delete(), which hands
+        # back the stock of the lines
+        with transaction.atomic(using=router.db_for_write(StockMovement)):
+            unpost_movements(queryset)
+            super().delete_queryset(request, queryset)
+
+    def save_formset(self, request, form, formset, change):
+        # Inline admins have no save hook of their own, so hand the item
+        # formset to StockMovementItemInline.save_formset
+        if formset.model is StockMovementItem:
+            inline = StockMovementItemInline(self.model, self.admin_site)
+            return inline.save_formset(request, formset, change)
+        super().save_formset(request, form, formset, change)
+
+@admin.register(ArchivedStockMovement)
+class ArchivedStockMovementAdmin(ReplicaReadsMixin, KeysetPaginationMixin, ModelAdmin):
+    list_display = (
+        'reference_number', 'movement_type', 'from_warehouse', 'to_warehouse', 'created_at', 'created_by', 'archived_at'
+    )
+    list_select_related = ('from_warehouse', 'to_warehouse', 'created_by')
+    # The same filters as the StockMovement changelist, which links here
+    list_filter = ('movement_type', 'created_at', 'from_warehouse', 'to_warehouse')
+    search_fields = ('reference_number', 'notes')
+    ordering = ('-created_at',)
+    fields = (
+        'movement_type', 'from_warehouse', 'to_warehouse', 'reference_number', 'notes', 'created_at', 'created_by',
+        'archived_at'
+    )
+    readonly_fields = fields
+    inlines = [ArchivedStockMovementItemInline]
+
+    # Written by archive_movements only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 @admin.register(Warehouse)
-class WarehouseAdmin(ModelAdmin):
+class WarehouseAdmin(PrefixAutocompleteMixin, ModelAdmin):
     list_display = ('name', 'created_at')
     search_fields = ('name', 'description')
     ordering = ('name',)
@@ -64,8 +162,9 @@ class WarehouseAdmin(ModelAdmin):
     readonly_fields = ('created_at',)
 
 @admin.register(Stockard)
-class StockardAdmin(ModelAdmin):
+class StockardAdmin(PrefixAutocompleteMixin, ModelAdmin):
     list_display = ('name', 'warehouse', 'created_at')
+    list_select_related = ('warehouse',)
     list_filter = ('warehouse',)
     search_fields = ('name', 'description', 'warehouse__name')
     ordering = ('warehouse__name', 'name')
@@ -82,7 +181,10 @@ class StockardAdmin(ModelAdmin):
     inlines = [StockInline]
 
 @admin.register(Product)
-class ProductAdmin(ModelAdmin):
+class ProductAdmin(PrefixAutocompleteMixin, ModelAdmin, ImportExportModelAdmin):
+    resource_classes = [ProductResource]
+    import_form_class = ImportForm
+    export_form_class = ExportForm
     list_display = ('name', 'created_at')
     search_fields = ('name', 'description')
     ordering = ('name',)
@@ -99,8 +201,12 @@ class ProductAdmin(ModelAdmin):
     inlines = [StockInline]
 
 @admin.register(Stock)
-class StockAdmin(ModelAdmin):
+class StockAdmin(ReplicaReadsMixin, StreamingExportMixin, SearchBackendMixin, KeysetPaginationMixin, ModelAdmin, ImportExportModelAdmin):
+    resource_classes = [StockResource]
+    import_form_class = ImportForm
+    export_form_class = ExportForm
     list_display = ('product', 'stockard', 'quantity', 'is_in_stock', 'created_at')
+    list_select_related = ('product', 'stockard__warehouse')
     list_filter = ('stockard__warehouse', 'stockard')
     search_fields = (
         'product__name',
@@ -120,8 +226,142 @@ class StockAdmin(ModelAdmin):
         }),
     )
     readonly_fields = ('created_at', 'updated_at')
+    autocomplete_fields = ('product', 'stockard')
+    # The columns StockResource imports
+    export_fields = (
+        ('product', 'product__name'),
+        ('warehouse', 'stockard__warehouse__name'),
+        ('stockard', 'stockard__name'),
+        ('quantity', 'quantity'),
+        ('updated_at', 'updated_at'),
+    )
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product', 'stockard__warehouse')
 
     def is_in_stock(self, obj):
         return obj.quantity > 0
     is_in_stock.boolean = True
     is_in_stock.short_description = _('In Stock')
+
+class ShortageFilter(admin.SimpleListFilter):
+    title = _('reorder point')
+    parameter_name = 'short'
+
+    def lookups(self, request, model_admin):
+        return (('1', _('Below reorder point')),)
+
+    def queryset(self, request, queryset):
+        if self.value() == '1':
+            # Same condition as the partial index of open shortages
+            return queryset.filter(quantity__lt=F('reorder_point'))
+        return queryset
+
+@admin.register(StockSummary)
+class StockSummaryAdmin(ReplicaReadsMixin, ModelAdmin):
+    list_display = ('product', 'warehouse', 'quantity', 'reserved_quantity', 'reorder_point', 'updated_at')
+    list_select_related = ('product', 'warehouse')
+    list_filter = (ShortageFilter, 'warehouse')
+    search_fields = ('product__name', 'warehouse__name')
+    ordering = ('warehouse__name', 'product__name')
+    fields = ('product', 'warehouse', 'quantity', 'reserved_quantity', 'reorder_point', 'updated_at')
+    readonly_fields = ('product', 'warehouse', 'quantity', 'reserved_quantity', 'updated_at')
+
+    # Maintained by the stock engine and rebuild_stock_summary; only the
+    # reorder point is set here
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        set_reorder_point(obj.product_id, obj.warehouse_id, obj.reorder_point)
+
+@admin.register(StockAlert)
+class StockAlertAdmin(ModelAdmin):
+    list_display = ('created_at', 'kind', 'product', 'warehouse', 'quantity', 'reorder_point', 'sent_at')
+    list_select_related = ('product', 'warehouse')
+    list_filter = ('kind', 'warehouse')
+    search_fields = ('product__name', 'warehouse__name')
+    ordering = ('-id',)
+    fields = ('kind', 'product', 'warehouse', 'quantity', 'reorder_point', 'created_at', 'sent_at')
+    readonly_fields = fields
+
+    # Recorded by the stock engine and sent by send_stock_alerts
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(ReplicaReadsMixin, ModelAdmin):
+    list_display = ('taken_at', 'period', 'product', 'warehouse', 'quantity')
+    list_select_related = ('product', 'warehouse')
+    list_filter = ('period', 'warehouse')
+    search_fields = ('product__name', 'warehouse__name')
+    ordering = ('-taken_at', 'warehouse__name', 'product__name')
+    fields = ('taken_at', 'period', 'product', 'warehouse', 'quantity')
+    readonly_fields = ('taken_at', 'period', 'product', 'warehouse', 'quantity')
+
+    # Written by take_stock_snapshot
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(StockReservation)
+class StockReservationAdmin(ModelAdmin):
+    list_display = ('reference', 'product', 'warehouse', 'quantity', 'status', 'expires_at', 'movement')
+    list_select_related = ('product', 'warehouse', 'movement')
+    list_filter = ('status', 'warehouse')
+    search_fields = ('reference', 'product__name')
+    ordering = ('-created_at',)
+    fields = (
+        'reference', 'product', 'warehouse', 'quantity', 'status', 'expires_at', 'created_at', 'closed_at', 'movement'
+    )
+    readonly_fields = fields
+    actions = ('release',)
+
+    # Holds are placed, committed and expired by services.reservations and
+    # can only be released here; deleting an active one would leave its
+    # units held
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description=_('Release selected reservations'), permissions=['change'])
+    def release(self, request, queryset):
+        released = release_reservations(queryset.values_list('pk', flat=True))
+        self.message_user(request, _('Released {} reservations').format(released))
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(ModelAdmin):
+    list_display = ('id', 'kind', 'movement', 'status', 'attempts', 'available_at', 'processed_at')
+    list_select_related = ('movement',)
+    list_filter = ('status', 'kind')
+    search_fields = ('movement__reference_number',)
+    ordering = ('-id',)
+    fields = (
+        'kind', 'movement', 'status', 'attempts', 'payload', 'last_error', 'created_at', 'available_at', 'processed_at'
+    )
+    readonly_fields = fields
+    actions = ('retry',)
+
+    # Queued with the work that caused them and run by process_outbox
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description=_('Retry selected failed events'), permissions=['change'])
+    def retry(self, request, queryset):
+        retried = queryset.filter(status='FAILED').update(
+            status='PENDING', attempts=0, available_at=timezone.now(), processed_at=None
+        )
+        self.message_user(request, _('Queued {} events again').format(retried))
@@ -0,0 +1,208 @@
+import base64
+import datetime
+import json
+from functools import reduce
+from operator import or_
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.functional import cached_property
+from unfold.views import ChangeList
+
+AFTER_VAR = 'after'
+BEFORE_VAR = 'before'
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never runs an exact ``COUNT(*)`` over a large table.
+
+    Unfiltered PostgreSQL querysets use the planner's ``reltuples`` estimate;
+    everything else is counted up to ``count_cap`` rows.
+    """
+    count_cap = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.has_filters():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            # reltuples is -1 until the table has been analyzed
+            if row and row[0] >= 0:
+                return row[0]
+        return queryset[:self.count_cap].count()
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder truncates to milliseconds, which breaks seeking
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    data = json.dumps(values, cls=CursorEncoder).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(token):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def seek_filter(ordering, values, reverse=False):
+    """
+    Build the filter selecting the rows after ``values`` in ``ordering``.
+
+    ``(a, b) > (x, y)`` is expanded to ``a > x OR (a = x AND b > y)`` so
+    mixed sort directions work on every backend, and the first key is also
+    bounded on its own so the database can seek into its index.
+    """
+    clauses = []
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+        clauses.append(Q(**equal, **{f'{name}__{lookup}': value}))
+        equal[name] = value
+    first = ordering[0]
+    bound = 'lte' if first.startswith('-') != reverse else 'gte'
+    return Q(**{f'{first.lstrip("-")}__{bound}': values[0]}) & reduce(or_, clauses)
+
+
+def seekable(model, entry):
+    """
+    Whether the cursor can seek on an ordering entry: a path to a plain
+    column that is never NULL. A relation sorts by its model's ordering
+    rather than its id, and NULL compares as neither before nor after.
+    """
+    opts = model._meta
+    path = entry.lstrip('-').split(LOOKUP_SEP)
+    for index, name in enumerate(path):
+        if name == 'pk':
+            name = opts.pk.name
+        try:
+            field = opts.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        if not getattr(field, 'concrete', False) or field.null:
+            return False
+        if index < len(path) - 1:
+            if not field.is_relation:
+                return False
+            opts = field.related_model._meta
+        elif field.is_relation:
+            return False
+    return True
+
+
+class KeysetChangeList(ChangeList):
+    """
+    ChangeList that seeks on the sort key instead of using OFFSET.
+
+    Pages are addressed by an opaque cursor holding the sort key of the
+    last (or first) row shown, so every page costs the same as the first.
+    Orderings that cannot be expressed as plain field paths fall back to
+    regular page numbers.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        lookup_params.pop(BEFORE_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Filter, search and sort links always start again from the top
+        new_params = {AFTER_VAR: None, BEFORE_VAR: None, **(new_params or {})}
+        return super().get_query_string(new_params, remove)
+
+    def get_keyset_ordering(self):
+        ordering = list(dict.fromkeys(self.queryset.query.order_by))
+        if not ordering or not all(isinstance(field, str) and seekable(self.model, field) for field in ordering):
+            return None
+        return ordering
+
+    def get_results(self, request):
+        ordering = self.get_keyset_ordering()
+        # An explicit page number keeps the classic OFFSET behaviour
+        if ordering is None or self.show_all or PAGE_VAR in request.GET:
+            return super().get_results(request)
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        per_page = self.list_per_page
+        after = decode_cursor(request.GET.get(AFTER_VAR, ''))
+        before = decode_cursor(request.GET.get(BEFORE_VAR, ''))
+
+        queryset = self.queryset
+        if before:
+            reversed_ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+            rows = list(queryset.filter(seek_filter(ordering, before, reverse=True))
+                        .order_by(*reversed_ordering)[:per_page + 1])
+            has_previous = len(rows) > per_page
+            rows = rows[:per_page][::-1]
+            has_next = True
+        else:
+            if after:
+                queryset = queryset.filter(seek_filter(ordering, after))
+            rows = list(queryset[:per_page + 1])
+            has_next = len(rows) > per_page
+            rows = rows[:per_page]
+            has_previous = bool(after)
+
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = has_next or has_previous
+        paginator.template_name = 'admin/inventory/pagination_keyset.html'
+        self.paginator = paginator
+
+        keys = self.cursor_values(ordering, rows)
+        self.previous_url = (
+            self.get_query_string({BEFORE_VAR: encode_cursor(keys[0])}) if has_previous and rows else None
+        )
+        self.next_url = (
+            self.get_query_string({AFTER_VAR: encode_cursor(keys[-1])}) if has_next and rows else None
+        )
+
+    def cursor_values(self, ordering, rows):
+        """
+        Return the sort key values of the first and last rows
+        """
+        if not rows:
+            return []
+        names = [field.lstrip('-') for field in ordering]
+        pks = {rows[0].pk, rows[-1].pk}
+        values = {
+            row[0]: list(row[1:])
+            for row in self.model._default_manager.filter(pk__in=pks).values_list('pk', *names)
+        }
+        return [values[rows[0].pk], values[rows[-1].pk]]
+
+
+class KeysetPaginationMixin:
+    """
+    Use keyset pagination and estimated counts on a ModelAdmin changelist
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
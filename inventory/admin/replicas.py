@@ -0,0 +1,20 @@
+from ..routers import replica_reads
+
+
+class ReplicaReadsMixin:
+    """
+    Serve changelist pages from the read replica.
+
+    Only GET requests, so bulk actions read the rows they change from the
+    primary. The response is rendered inside the block, so the filter
+    choices and lazy columns read from the replica too.
+    """
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with replica_reads():
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
@@ -0,0 +1,62 @@
+from functools import reduce
+from operator import and_, or_
+from django.db import router
+from django.db.models import Q
+from django.utils.text import smart_split, unescape_string_literal
+from ..search import get_search_backend
+
+
+def split_path(model, path):
+    """
+    Split a ``search_fields`` entry into the relation prefix, the model it
+    leads to, the field name and whether the relation is multi-valued
+    """
+    *relations, field = path.split('__')
+    multi_valued = False
+    for name in relations:
+        relation = model._meta.get_field(name)
+        multi_valued |= relation.many_to_many or relation.one_to_many
+        model = relation.related_model
+    return '__'.join(relations), model, field, multi_valued
+
+
+class SearchBackendMixin:
+    """
+    Run changelist searches through the search backend.
+
+    ``search_fields`` are grouped per related model and each group is matched
+    on its own table, then joined back with ``IN`` subqueries. The fan-out
+    over multi-valued relations and the ``DISTINCT`` it needs go away.
+    A term equal to one of ``search_exact_fields`` returns that row alone.
+    """
+    search_exact_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        search_fields = self.get_search_fields(request)
+        search_term = search_term.strip()
+        if not search_term or any(field[0] in '^=@' for field in search_fields):
+            return super().get_search_results(request, queryset, search_term)
+
+        for field in self.search_exact_fields:
+            exact = queryset.filter(**{field: search_term})
+            if exact.exists():
+                return exact, False
+
+        groups = {}
+        for path in search_fields:
+            prefix, model, field, multi_valued = split_path(self.model, path)
+            groups.setdefault((prefix, model, multi_valued), []).append(field)
+
+        backend = get_search_backend(router.db_for_read(self.model))
+        conditions = []
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            matches = []
+            for (prefix, model, multi_valued), fields in groups.items():
+                match = Q(**{f'{prefix}__in' if prefix else 'pk__in': backend.match(model, fields, bit)})
+                if multi_valued:
+                    match = Q(pk__in=self.model._default_manager.filter(match).values('pk'))
+                matches.append(match)
+            conditions.append(reduce(or_, matches))
+        return queryset.filter(reduce(and_, conditions)), False
@@ -0,0 +1,21 @@
+"""
+Database connection tuning, applied as connections are opened
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_connection(sender, connection, **kwargs):
+    # PRAGMAs are per connection, except journal_mode which the file keeps;
+    # setting it again is a no-op once the database is in WAL mode
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'INVENTORY_SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,33 @@
+"""
+Database functions with vendor-specific SQL
+"""
+
+from django.db.models.functions import Lower
+
+
+class PrefixKey(Lower):
+    """
+    ``LOWER(expression)`` compared in code point order, so the strings
+    starting with a prefix form one range, ``prefix_bounds``, that an index
+    on the expression serves. PostgreSQL would otherwise compare under the
+    column's collation, which can ignore punctuation and order accents
+    apart; it compares the key with the "C" collation. SQLite's BINARY
+    collation already compares code points, but its ``LOWER`` only folds
+    ASCII letters, so terms are folded to match with ``fold_prefix``.
+    """
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        sql, params = self.as_sql(compiler, connection, **extra_context)
+        return f'({sql}) COLLATE "C"', params
+
+
+ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+def fold_prefix(term, vendor):
+    """
+    Lower-case ``term`` the way ``PrefixKey`` does on ``vendor``
+    """
+    if vendor == 'sqlite':
+        return term.translate(ASCII_LOWER)
+    return term.lower()
@@ -0,0 +1,70 @@
+import csv
+import io
+from itertools import islice
+import tablib
+
+FORMATS = ('csv', 'xlsx')
+
+
+def read_rows(file, format='csv'):
+    """
+    Yield the rows of a CSV or XLSX file one at a time, header row first
+    """
+    if format == 'csv':
+        if isinstance(file, io.TextIOBase):
+            text = file
+        else:
+            text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        yield from csv.reader(text)
+    elif format == 'xlsx':
+        try:
+            import openpyxl
+        except ImportError:
+            raise ValueError('Reading xlsx files requires openpyxl')
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f'Unsupported format "{format}", expected one of {", ".join(FORMATS)}')
+
+
+def read_chunks(file, format='csv', chunk_size=5000):
+    """
+    Yield ``(numbers, dataset)`` for the file in ``tablib.Dataset`` chunks
+    of at most ``chunk_size`` rows, so only one chunk is held in memory at
+    a time. Blank rows are dropped; ``numbers`` holds the file row number
+    of each row kept, the header being row 1.
+    """
+    rows = read_rows(file, format)
+    headers = [str(header).strip() for header in next(rows, None) or ()]
+    width = len(headers)
+    read = 1
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            return
+        numbers, chunk = [], []
+        for number, row in enumerate(batch, read + 1):
+            if any(value not in (None, '') for value in row):
+                numbers.append(number)
+                chunk.append((list(row) + [''] * width)[:width])
+        read += len(batch)
+        if chunk:
+            yield numbers, tablib.Dataset(*chunk, headers=headers)
+
+
+def stream_import(resource, file, format='csv', chunk_size=5000, dry_run=False, **kwargs):
+    """
+    Import ``file`` through ``resource`` one chunk at a time.
+
+    Each chunk is imported in its own transaction with the resource's bulk
+    writes, and its ``Result`` is yielded with the file row numbers of its
+    rows, see ``read_chunks``: row ``n`` of the result is file row
+    ``numbers[n - 1]``. A failing chunk is rolled back without affecting
+    the others.
+    """
+    for numbers, dataset in read_chunks(file, format, chunk_size):
+        result = resource.import_data(dataset, dry_run=dry_run, use_transactions=True, **kwargs)
+        yield numbers, result
@@ -0,0 +1,40 @@
+import datetime
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+from ...services.archive import archive_horizon, archive_movements, months_ago
+from ...services.snapshot import cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        'Move closed movements older than INVENTORY_ARCHIVE_AFTER_MONTHS into the archive tables in '
+        'batches; safe to interrupt and run again, schedule it nightly'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, help='Archive movements older than this many months')
+        parser.add_argument('--before', help='Archive movements created before this date or datetime')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Movements moved per transaction')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            before = parse_datetime(options['before']) or parse_date(options['before'])
+            if before is None:
+                raise CommandError(f'Cannot parse --before "{options["before"]}"')
+            if not isinstance(before, datetime.datetime):
+                # Up to the start of the day, the close of the day before
+                before -= datetime.timedelta(days=1)
+            before = cutoff(before)
+        elif options['months'] is not None:
+            before = months_ago(options['months'])
+        else:
+            before = archive_horizon()
+
+        started = time.perf_counter()
+        archived = archive_movements(before, options['batch_size'], options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} movements created before {before:%Y-%m-%d %H:%M} '
+            f'in {time.perf_counter() - started:.2f}s'
+        ))
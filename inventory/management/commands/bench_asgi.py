@@ -0,0 +1,142 @@
+import asyncio
+import io
+import secrets
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from ...models import StockMovement, StockSummary
+
+HOST = 'testserver'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent-request throughput of the ASGI and WSGI entry points on the stock API, '
+        'driving both handlers in process'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per run')
+        parser.add_argument('--concurrency', default='1,10,100', help='Comma separated in-flight request counts')
+        parser.add_argument('--products', type=int, default=100, help='Product ids per availability request')
+
+    def handle(self, *args, **options):
+        product_ids = list(
+            StockSummary.objects.order_by('product_id').values_list('product_id', flat=True).distinct()[
+                :options['products']
+            ]
+        )
+        reference_number = StockMovement.objects.values_list('reference_number', flat=True).first()
+        if not product_ids or reference_number is None:
+            raise CommandError('No stock to request; post some movements first')
+        levels = [int(level) for level in options['concurrency'].split(',')]
+
+        targets = (
+            (f'availability x{len(product_ids)}', reverse('inventory:stock-availability'),
+             urlencode({'products': ','.join(map(str, product_ids))})),
+            ('movement status', reverse('inventory:movement-status', args=[reference_number]), ''),
+        )
+        token = secrets.token_hex(16)
+        setup_test_environment()
+        try:
+            # As deployed: no SQL logging or query recording
+            with override_settings(DEBUG=False, INVENTORY_API_TOKEN=token):
+                wsgi, asgi = get_wsgi_application(), get_asgi_application()
+                for name, path, query in targets:
+                    for concurrency in levels:
+                        for entry_point, run in (('WSGI', self.run_wsgi), ('ASGI', self.run_asgi)):
+                            elapsed, timings = run(
+                                wsgi if entry_point == 'WSGI' else asgi,
+                                path, query, token, concurrency, options['requests']
+                            )
+                            self.stdout.write(
+                                f'{name:<18} {entry_point} x{concurrency:<4} '
+                                f'{len(timings) / elapsed:8.0f} req/s  '
+                                f'p50 {statistics.median(timings):8.2f} ms  '
+                                f'p99 {statistics.quantiles(timings, n=100)[-1]:8.2f} ms'
+                            )
+        finally:
+            teardown_test_environment()
+
+    def run_wsgi(self, application, path, query, token, concurrency, requests):
+        """
+        Call the WSGI handler from ``concurrency`` threads, as a threaded
+        WSGI server would
+        """
+        def request(_index):
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': HOST, 'HTTP_AUTHORIZATION': f'Bearer {token}', 'REMOTE_ADDR': '127.0.0.1',
+                'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+                'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+                'wsgi.run_once': False,
+            }
+            statuses = []
+            started = time.perf_counter()
+            response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            try:
+                b''.join(response)
+            finally:
+                response.close()
+            elapsed = (time.perf_counter() - started) * 1000
+            if not statuses[0].startswith('200'):
+                raise CommandError(f'WSGI request failed with {statuses[0]}')
+            return elapsed
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            started = time.perf_counter()
+            timings = list(pool.map(request, range(requests)))
+            return time.perf_counter() - started, timings
+
+    def run_asgi(self, application, path, query, token, concurrency, requests):
+        """
+        Run ``requests`` ASGI requests on one event loop, ``concurrency`` at
+        a time, as a single ASGI worker would
+        """
+        async def request(semaphore):
+            async with semaphore:
+                scope = {
+                    'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                    'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+                    'query_string': query.encode(), 'server': (HOST, 80), 'client': ('127.0.0.1', 0),
+                    'headers': [(b'host', HOST.encode()), (b'authorization', f'Bearer {token}'.encode())],
+                }
+                received = False
+                finished = asyncio.Event()
+                messages = []
+
+                async def receive():
+                    nonlocal received
+                    if not received:
+                        received = True
+                        return {'type': 'http.request', 'body': b'', 'more_body': False}
+                    # The client stays connected until the response is sent
+                    await finished.wait()
+                    return {'type': 'http.disconnect'}
+
+                async def send(message):
+                    messages.append(message)
+
+                started = time.perf_counter()
+                await application(scope, receive, send)
+                finished.set()
+                elapsed = (time.perf_counter() - started) * 1000
+                if messages[0]['status'] != 200:
+                    raise CommandError(f'ASGI request failed with {messages[0]["status"]}')
+                return elapsed
+
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+            started = time.perf_counter()
+            timings = await asyncio.gather(*(request(semaphore) for _ in range(requests)))
+            return time.perf_counter() - started, timings
+
+        return asyncio.run(run())
@@ -0,0 +1,64 @@
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from ...models import StockSummary
+
+
+class Command(BaseCommand):
+    help = 'Measure requests per second and p50/p99 latency of the stock availability API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--products', type=int, default=1000, help='Largest batch of product ids to request')
+        parser.add_argument('--username', help='Superuser to request as (default: the first one)')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(is_superuser=True)
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No superuser to request as')
+        product_ids = list(
+            StockSummary.objects.order_by('product_id').values_list('product_id', flat=True).distinct()[
+                :options['products']
+            ]
+        )
+        if not product_ids:
+            raise CommandError('No stock to request; post some movements first')
+
+        setup_test_environment()
+        client = Client()
+        client.force_login(user)
+        url = reverse('inventory:stock-availability')
+        try:
+            for size in sorted({1, min(100, len(product_ids)), len(product_ids)}):
+                products = ','.join(str(product_id) for product_id in product_ids[:size])
+                response = client.get(url, {'products': products})
+                if response.status_code != 200:
+                    raise CommandError(f'Request failed with {response.status_code}: {response.content[:200]!r}')
+                revalidate = {'HTTP_IF_NONE_MATCH': response.headers['ETag']}
+                for name, headers, status in (('full', {}, 200), ('revalidated', revalidate, 304)):
+                    timings = self.measure(client, url, {'products': products}, headers, status, options['requests'])
+                    p50 = statistics.median(timings)
+                    p99 = statistics.quantiles(timings, n=100)[-1]
+                    self.stdout.write(
+                        f'{size:>5} products {name:<12} {1000 / statistics.mean(timings):8.0f} req/s  '
+                        f'p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  {len(response.content) if status == 200 else 0:>8} bytes'
+                    )
+        finally:
+            teardown_test_environment()
+
+    def measure(self, client, url, params, headers, status, requests):
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get(url, params, **headers)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != status:
+                raise CommandError(f'Expected {status}, got {response.status_code}')
+        return timings
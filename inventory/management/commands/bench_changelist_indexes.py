@@ -0,0 +1,147 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from ...models import Warehouse, Stockard, Product, Stock, StockMovement, StockMovementItem
+
+INDEXED_MODELS = (Stock, StockMovement, StockMovementItem)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed movements and print EXPLAIN output and latency of the changelist queries with and without indexes. '
+        'The indexes are dropped while it runs, so point it at a scratch database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--movements', type=int, default=1_000_000)
+        parser.add_argument('--warehouses', type=int, default=20)
+        parser.add_argument('--products', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows')
+        parser.add_argument('--database', help='Alias of a scratch database to run on')
+        parser.add_argument(
+            '--yes-drop-indexes', action='store_true',
+            help='Run on the default database, dropping its indexes while it runs'
+        )
+
+    def handle(self, *args, **options):
+        if options['database'] is None and not options['yes_drop_indexes']:
+            raise CommandError(
+                'This drops the indexes of the stock and movement tables while it runs; pass --database with a '
+                'scratch database, or --yes-drop-indexes to run on the default database'
+            )
+        self.using = options['database'] or 'default'
+        if self.using not in connections:
+            raise CommandError(f'Unknown database "{self.using}"')
+        connection = connections[self.using]
+        self.tag = f'bench-{uuid.uuid4().hex[:12]}'
+        self.seed(options)
+        try:
+            queries = self.queries()
+            with connection.schema_editor() as editor:
+                for model in INDEXED_MODELS:
+                    for index in model._meta.indexes:
+                        editor.remove_index(model, index)
+            try:
+                self.stdout.write(self.style.MIGRATE_HEADING('Without indexes'))
+                self.measure(queries, options['repeat'])
+            finally:
+                with connection.schema_editor() as editor:
+                    for model in INDEXED_MODELS:
+                        for index in model._meta.indexes:
+                            editor.add_index(model, index)
+            self.stdout.write(self.style.MIGRATE_HEADING('With indexes'))
+            self.measure(queries, options['repeat'])
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+    def seed(self, options):
+        batch = 5000
+        warehouses = Warehouse.objects.using(self.using).bulk_create([
+            Warehouse(name=f'{self.tag}-{i}') for i in range(options['warehouses'])
+        ])
+        stockards = Stockard.objects.using(self.using).bulk_create([
+            Stockard(warehouse=warehouse, name=f'{self.tag}-{i}')
+            for warehouse in warehouses for i in range(5)
+        ])
+        products = Product.objects.using(self.using).bulk_create(
+            [Product(name=f'{self.tag}-{i}') for i in range(options['products'])],
+            batch_size=batch
+        )
+        Stock.objects.using(self.using).bulk_create(
+            [
+                Stock(product=product, stockard=random.choice(stockards), quantity=random.randint(0, 500))
+                for product in products
+            ],
+            batch_size=batch,
+            ignore_conflicts=True
+        )
+
+        now = timezone.now()
+        for start in range(0, options['movements'], batch):
+            movements = []
+            for i in range(start, min(start + batch, options['movements'])):
+                movement_type = random.choice(('IN', 'OUT', 'TRANSFER'))
+                source, target = random.sample(warehouses, 2)
+                movements.append(StockMovement(
+                    movement_type=movement_type,
+                    from_warehouse=source if movement_type != 'IN' else None,
+                    to_warehouse=target if movement_type != 'OUT' else None,
+                    reference_number=f'{self.tag}-{i}'
+                ))
+            movements = StockMovement.objects.using(self.using).bulk_create(movements)
+            # Spread the movements over two years instead of stamping them
+            # all now; bulk_update leaves auto_now_add alone
+            for movement in movements:
+                movement.created_at = now - timedelta(minutes=random.randint(0, 60 * 24 * 730))
+            StockMovement.objects.using(self.using).bulk_update(movements, ['created_at'], batch_size=500)
+            StockMovementItem.objects.using(self.using).bulk_create([
+                StockMovementItem(movement=movement, product=random.choice(products), quantity=1)
+                for movement in movements[::10]
+            ])
+        self.stdout.write(f'Seeded {options["movements"]} movements')
+        self.warehouse = warehouses[0]
+        self.product = products[0]
+
+    def queries(self):
+        movements = StockMovement.objects.using(self.using).order_by('-created_at', '-pk')
+        movement = movements.filter(reference_number__startswith=self.tag).first()
+        stock = Stock.objects.using(self.using)
+        items = StockMovementItem.objects.using(self.using)
+        return [
+            ('movements', movements[:100]),
+            ('movements by type', movements.filter(movement_type='OUT')[:100]),
+            ('movements from warehouse', movements.filter(from_warehouse=self.warehouse)[:100]),
+            ('movements to warehouse', movements.filter(to_warehouse=self.warehouse)[:100]),
+            ('stock by product', stock.filter(product=self.product).order_by().values('stockard', 'quantity')),
+            ('items by movement', items.filter(movement=movement).order_by('movement', 'product')),
+        ]
+
+    def measure(self, queries, repeat):
+        for name, queryset in queries:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            elapsed = (time.perf_counter() - started) / repeat
+            self.stdout.write(f'{name}: {elapsed * 1000:.2f} ms')
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'    {line}')
+
+    def cleanup(self):
+        # Raw deletes skip the stock signals, which write to the default
+        # database's summaries and ledger
+        for queryset in (
+            StockMovementItem.objects.filter(movement__reference_number__startswith=self.tag),
+            StockMovement.objects.filter(reference_number__startswith=self.tag),
+            Stock.objects.filter(product__name__startswith=self.tag),
+            Stockard.objects.filter(name__startswith=self.tag),
+        ):
+            queryset = queryset.using(self.using)
+            queryset._raw_delete(queryset.db)
+        Product.objects.using(self.using).filter(name__startswith=self.tag).delete()
+        Warehouse.objects.using(self.using).filter(name__startswith=self.tag).delete()
@@ -0,0 +1,99 @@
+import statistics
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import DatabaseError, connection
+from django.db.backends.signals import connection_created
+from ...models import Product, StockMovement, StockMovementItem, Warehouse
+from ...services import post_movement
+from ...services.stock import InsufficientStock
+
+
+class Command(BaseCommand):
+    help = (
+        'Post movements from concurrent threads, each post in its own request cycle, and report '
+        'throughput, latency, lock errors and connections opened under the active DJANGO_DB_PROFILE'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--movements', type=int, default=100, help='Movements per thread')
+        parser.add_argument('--lines', type=int, default=10, help='Lines per movement')
+
+    def handle(self, *args, **options):
+        database = settings.DATABASES['default']
+        self.stdout.write(
+            f'profile {settings.DB_PROFILE}: {database["ENGINE"].rsplit(".", 1)[-1]}, '
+            f'CONN_MAX_AGE {database.get("CONN_MAX_AGE", 0)}, '
+            f'transaction mode {database.get("OPTIONS", {}).get("transaction_mode", "default")}'
+        )
+        tag = uuid.uuid4().hex[:12]
+        warehouse = Warehouse.objects.create(name=f'bench-{tag}')
+        # Every thread posts the same products, so the movements contend
+        # for the same stock rows
+        products = Product.objects.bulk_create(
+            [Product(name=f'bench {tag} {i}') for i in range(options['lines'])]
+        )
+        try:
+            self.run(warehouse, products, tag, options)
+        finally:
+            StockMovement.objects.filter(reference_number__startswith=f'BENCH-{tag}-').delete()
+            Product.objects.filter(pk__in=[product.pk for product in products]).delete()
+            warehouse.delete()
+
+    def run(self, warehouse, products, tag, options):
+        timings = []
+        errors = []
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        def worker(index):
+            for number in range(options['movements']):
+                # As a request would: old connections are closed or reused
+                # on the way in and out, according to CONN_MAX_AGE
+                request_started.send(sender=self.__class__)
+                try:
+                    started = time.perf_counter()
+                    # Receipts and issues alternate so stock stays positive
+                    movement_type = 'IN' if number % 2 == 0 else 'OUT'
+                    movement = StockMovement.objects.create(
+                        movement_type=movement_type,
+                        from_warehouse=warehouse if movement_type == 'OUT' else None,
+                        to_warehouse=warehouse if movement_type == 'IN' else None,
+                        reference_number=f'BENCH-{tag}-{index}-{number}'
+                    )
+                    post_movement(movement, [
+                        StockMovementItem(product=product, quantity=1) for product in products
+                    ])
+                    timings.append((time.perf_counter() - started) * 1000)
+                except (DatabaseError, InsufficientStock) as exc:
+                    errors.append(str(exc))
+                finally:
+                    request_finished.send(sender=self.__class__)
+            connection.close()
+
+        connection_created.connect(count_connection)
+        try:
+            threads = [threading.Thread(target=worker, args=(index,)) for index in range(options['threads'])]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(count_connection)
+
+        self.stdout.write(
+            f'{len(timings) / elapsed:8.1f} movements/s  '
+            f'p50 {statistics.median(timings) if timings else 0:8.2f} ms  '
+            f'p99 {statistics.quantiles(timings, n=100)[-1] if len(timings) > 1 else 0:8.2f} ms  '
+            f'{len(errors)} failed  {len(opened)} connections opened'
+        )
+        for message in sorted(set(errors)):
+            self.stdout.write(f'  {errors.count(message)} x {message}')
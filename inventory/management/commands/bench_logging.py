@@ -0,0 +1,114 @@
+import copy
+import logging.config
+import os
+import statistics
+import tempfile
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+# The per-process synchronous configuration this project used to ship
+SYNC_LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'verbose': {
+            'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'file': {'level': 'DEBUG', 'class': 'logging.FileHandler', 'formatter': 'verbose'},
+    },
+    'root': {'handlers': ['file'], 'level': 'DEBUG'},
+    'loggers': {
+        'django': {'handlers': ['file'], 'level': 'DEBUG', 'propagate': False},
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of each logging configuration on an admin changelist'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--username', help='Superuser to request as (default: the first one)')
+        parser.add_argument('--url', default=reverse('admin:inventory_stockmovement_changelist'))
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(is_superuser=True)
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No superuser to request as')
+
+        setup_test_environment()
+        # Log SQL as a DEBUG server would
+        connection.force_debug_cursor = True
+        client = Client()
+        client.force_login(user)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                baseline = None
+                for name, config in self.configurations(directory):
+                    logging.config.dictConfig(config)
+                    timings = self.measure(client, options['url'], options['requests'])
+                    handler = logging.getLogger('django').handlers[0]
+                    dropped = getattr(handler, 'dropped', 0)
+                    logging.config.dictConfig({'version': 1, 'disable_existing_loggers': False})
+
+                    median = statistics.median(timings)
+                    p95 = statistics.quantiles(timings, n=20)[-1]
+                    baseline = median if baseline is None else baseline
+                    self.stdout.write(
+                        f'{name:<24} median {median:7.2f} ms  p95 {p95:7.2f} ms  '
+                        f'overhead {median - baseline:+6.2f} ms  dropped {dropped}'
+                    )
+        finally:
+            connection.force_debug_cursor = False
+            teardown_test_environment()
+            logging.config.dictConfig(settings.LOGGING)
+
+    def configurations(self, directory):
+        silent = copy.deepcopy(SYNC_LOGGING)
+        silent['handlers']['file'] = {'class': 'logging.NullHandler'}
+        yield 'no logging', silent
+
+        sync = copy.deepcopy(SYNC_LOGGING)
+        sync['handlers']['file']['filename'] = os.path.join(directory, 'sync.log')
+        yield 'sync file, DEBUG', sync
+
+        variants = (
+            ('queue, DEBUG', 'DEBUG', 'verbose', '1'),
+            ('queue, DEBUG, json', 'DEBUG', 'json', '1'),
+            ('queue, DEBUG, SQL 1%', 'DEBUG', 'verbose', '0.01'),
+            ('queue, INFO', 'INFO', 'verbose', '1'),
+        )
+        for name, level, formatter, sample in variants:
+            config = copy.deepcopy(settings.LOGGING)
+            config['handlers']['file'].update(
+                level=level, formatter=formatter, filename=os.path.join(directory, f'{name}.log')
+            )
+            config['filters']['sql_sample']['rate'] = sample
+            config['root']['level'] = level
+            for logger in ('django', 'django.db.backends'):
+                config['loggers'][logger]['level'] = level
+            yield name, config
+
+    def measure(self, client, url, requests):
+        # One warm-up request fills the caches
+        client.get(url)
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{url} returned {response.status_code}')
+        return timings
@@ -0,0 +1,96 @@
+import datetime
+import random
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from ...models import Product, Stock, Stockard, StockMovement, StockMovementItem, Warehouse
+from ...services import post_movement
+from ...services.picking import STRATEGIES
+from ...services.stock import InsufficientStock, apply_stock_deltas
+from .bench_post_movement import QueryCounter
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a warehouse with thousands of bins and compare the pick strategies on the same '
+        'outbound movements; everything is rolled back'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bins', type=int, default=5000)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--bins-per-product', type=int, default=25)
+        parser.add_argument('--movements', type=int, default=20)
+        parser.add_argument('--lines', type=int, default=100, help='Lines per movement')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            warehouse, products, total = self.seed(rng, options)
+            self.stdout.write(
+                f'{options["bins"]} bins, {len(products)} products, {total} units; '
+                f'{options["movements"]} movements of {options["lines"]} lines'
+            )
+            orders = [
+                [(rng.choice(products), rng.randint(1, 60)) for _ in range(options['lines'])]
+                for _ in range(options['movements'])
+            ]
+            for name in STRATEGIES:
+                savepoint = transaction.savepoint()
+                self.run(warehouse, name, orders)
+                transaction.savepoint_rollback(savepoint)
+            transaction.set_rollback(True)
+
+    def seed(self, rng, options):
+        tag = uuid.uuid4().hex[:12]
+        warehouse = Warehouse.objects.create(name=f'bench-{tag}')
+        stockards = Stockard.objects.bulk_create(
+            [Stockard(warehouse=warehouse, name=f'BIN-{i:06d}') for i in range(options['bins'])]
+        )
+        products = Product.objects.bulk_create(
+            [Product(name=f'bench {tag} {i}') for i in range(options['products'])]
+        )
+        deltas = {}
+        for product in products:
+            for stockard in rng.sample(stockards, min(options['bins_per_product'], len(stockards))):
+                deltas[product.pk, stockard.pk] = rng.randint(1, 120)
+        apply_stock_deltas(deltas, {stockard.pk: warehouse.pk for stockard in stockards})
+
+        # Spread the stocking dates so FIFO has an order to follow
+        now = timezone.now()
+        stocks = list(Stock.objects.filter(stockard__warehouse=warehouse).only('pk'))
+        for stock in stocks:
+            stock.created_at = now - datetime.timedelta(minutes=rng.randint(0, 90 * 24 * 60))
+        Stock.objects.bulk_update(stocks, ['created_at'], batch_size=1000)
+        return warehouse, products, sum(deltas.values())
+
+    def run(self, warehouse, name, orders):
+        queries = QueryCounter()
+        elapsed = 0
+        lines = items = failed = 0
+        for index, order in enumerate(orders):
+            movement = StockMovement.objects.create(
+                movement_type='OUT', from_warehouse=warehouse, reference_number=f'BENCH-PICK-{name}-{index}'
+            )
+            try:
+                with transaction.atomic(), connection.execute_wrapper(queries):
+                    started = time.perf_counter()
+                    created = post_movement(movement, [
+                        StockMovementItem(product=product, quantity=quantity) for product, quantity in order
+                    ], strategy=name)
+                    elapsed += time.perf_counter() - started
+            except InsufficientStock:
+                failed += 1
+                continue
+            lines += len(order)
+            items += len(created)
+        touched = Stock.objects.filter(stockard__warehouse=warehouse, quantity__gt=0).count()
+        self.stdout.write(
+            f'{name:<8} {elapsed * 1000 / max(lines, 1):7.3f} ms/line  '
+            f'{queries.count / max(len(orders) - failed, 1):6.1f} queries/movement  '
+            f'{items / max(lines, 1):5.2f} bins/line  '
+            f'{failed:>3} failed movements  {touched:>6} stocked bins left'
+        )
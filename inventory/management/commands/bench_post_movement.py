@@ -0,0 +1,86 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import connection
+from ...models import Warehouse, Product, StockMovement, StockMovementItem
+from ...services import post_movement
+from ...services.lookups import invalidate_warehouse, stockard_cache
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def post_per_item(movement, items):
+    # The pre-batch behaviour: every line resolves and applies its own stock
+    for item in items:
+        item.movement = movement
+        item.save()
+
+
+class Command(BaseCommand):
+    help = 'Report queries and wall time per 1k lines for posting stock movements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=500)
+
+    def handle(self, *args, **options):
+        lines = options['lines']
+        tag = uuid.uuid4().hex[:12]
+        source = Warehouse.objects.create(name=f'bench-{tag}-a')
+        target = Warehouse.objects.create(name=f'bench-{tag}-b')
+        products = Product.objects.bulk_create(
+            [Product(name=f'bench {tag} {i}') for i in range(lines)]
+        )
+        try:
+            # Warm passes repeat the products and warehouses of the pass
+            # before, with the stockards in the lookup cache
+            passes = (
+                ('per-item save', post_per_item, False),
+                ('per-item save, warm lookups', post_per_item, True),
+                ('post_movement', post_movement, False),
+                ('post_movement, warm lookups', post_movement, True)
+            )
+            for index, (name, post, warm) in enumerate(passes):
+                if not warm:
+                    invalidate_warehouse(source.pk)
+                    invalidate_warehouse(target.pk)
+                stockard_cache.reset_stats()
+                self.stdout.write(f'{name}:')
+                for movement_type, quantity in (('IN', 10), ('OUT', 2), ('TRANSFER', 3)):
+                    movement = StockMovement.objects.create(
+                        movement_type=movement_type,
+                        from_warehouse=source if movement_type != 'IN' else None,
+                        to_warehouse=target if movement_type == 'TRANSFER' else source
+                        if movement_type == 'IN' else None,
+                        reference_number=f'BENCH-{tag}-{index}-{movement_type}'
+                    )
+                    items = [
+                        StockMovementItem(product=product, quantity=quantity)
+                        for product in products
+                    ]
+                    queries = QueryCounter()
+                    with connection.execute_wrapper(queries):
+                        started = time.perf_counter()
+                        post(movement, items)
+                        elapsed = time.perf_counter() - started
+                    scale = 1000 / lines
+                    self.stdout.write(
+                        f'  {movement_type:<8} {queries.count * scale:8.0f} queries/1k lines '
+                        f'{elapsed * scale * 1000:8.1f} ms/1k lines'
+                    )
+                stats = stockard_cache.stats()
+                self.stdout.write(
+                    f'  lookups: {stats["local_hits"]} local hits, {stats["shared_hits"]} shared hits, '
+                    f'{stats["misses"]} misses'
+                )
+        finally:
+            StockMovement.objects.filter(reference_number__startswith=f'BENCH-{tag}-').delete()
+            Product.objects.filter(pk__in=[product.pk for product in products]).delete()
+            source.delete()
+            target.delete()
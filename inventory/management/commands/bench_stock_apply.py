@@ -0,0 +1,81 @@
+import threading
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import connection, OperationalError
+from ...models import Warehouse, Stockard, Product, Stock
+from ...services import add_stock, remove_stock
+
+
+def read_modify_write(product_id, stockard_id, delta):
+    # The pre-engine behaviour of StockMovementItem.save, kept for comparison
+    stock = Stock.objects.get(product_id=product_id, stockard_id=stockard_id)
+    stock.quantity += delta
+    stock.save()
+
+
+def atomic(product_id, stockard_id, delta):
+    if delta > 0:
+        add_stock(product_id, stockard_id, delta)
+    else:
+        remove_stock(product_id, stockard_id, -delta)
+
+
+class Command(BaseCommand):
+    help = 'Hammer the same Stock rows from many threads and check that no update is lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--ops', type=int, default=200, help='Operations per thread')
+        parser.add_argument('--rows', type=int, default=4, help='Number of contended Stock rows')
+
+    def handle(self, *args, **options):
+        warehouse = Warehouse.objects.create(name=f'bench-{uuid.uuid4().hex[:12]}')
+        try:
+            for name, apply in (('read-modify-write', read_modify_write), ('atomic update', atomic)):
+                self.run(name, apply, warehouse, options)
+        finally:
+            Product.objects.filter(stocks__stockard__warehouse=warehouse).delete()
+            warehouse.delete()
+
+    def run(self, name, apply, warehouse, options):
+        initial = options['threads'] * options['ops']
+        stocks = []
+        for i in range(options['rows']):
+            stockard = Stockard.objects.create(warehouse=warehouse, name=f'{name} {i}')
+            product = Product.objects.create(name=f'bench {name} {i}')
+            stocks.append(Stock.objects.create(product=product, stockard=stockard, quantity=initial))
+
+        applied = []
+        errors = []
+
+        def worker(offset):
+            try:
+                for op in range(options['ops']):
+                    stock = stocks[(offset + op) % len(stocks)]
+                    # Every pair of operations nets +1 unit
+                    delta = 2 if op % 2 == 0 else -1
+                    try:
+                        apply(stock.product_id, stock.stockard_id, delta)
+                        applied.append(delta)
+                    except OperationalError as exc:
+                        errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total_ops = len(applied)
+        expected = initial * len(stocks) + sum(applied)
+        actual = sum(Stock.objects.filter(pk__in=[s.pk for s in stocks]).values_list('quantity', flat=True))
+
+        style = self.style.SUCCESS if actual == expected else self.style.ERROR
+        self.stdout.write(f'{name}:')
+        self.stdout.write(f'  {total_ops} ops in {elapsed:.2f}s ({total_ops / elapsed:.0f} ops/s), {len(errors)} errors')
+        self.stdout.write(style(f'  expected {expected} units, found {actual} ({expected - actual} lost)'))
@@ -0,0 +1,17 @@
+import time
+from django.core.management.base import BaseCommand
+from ...services import expire_reservations
+
+
+class Command(BaseCommand):
+    help = 'Expire the stock reservations past their expiry and give their units back; schedule it every minute'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Reservations expired per transaction')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        expired = expire_reservations(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {expired} reservations in {time.perf_counter() - started:.2f}s'
+        ))
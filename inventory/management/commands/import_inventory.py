@@ -0,0 +1,79 @@
+import time
+from collections import Counter
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from ...imports import FORMATS, stream_import
+from ...resources import ProductResource, StockMovementItemResource, StockMovementResource, StockResource
+
+try:
+    import resource as rusage
+except ImportError:  # Windows
+    rusage = None
+
+RESOURCES = {
+    'products': ProductResource,
+    'stock': StockResource,
+    'movements': StockMovementResource,
+    'movement-items': StockMovementItemResource,
+}
+
+
+class Command(BaseCommand):
+    help = 'Import products, stock or movements from a CSV or XLSX file in chunks, reporting rows per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=RESOURCES)
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help='Validate every chunk, then roll it back')
+        parser.add_argument('--max-errors', type=int, default=20, help='Errors to print before going quiet')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        format = options['format'] or path.suffix.lstrip('.').lower()
+        if format not in FORMATS:
+            raise CommandError(f'Cannot tell the format of {path}, pass --format')
+        resource = RESOURCES[options['kind']]()
+
+        totals = Counter()
+        errors = 0
+        rows = 0
+        started = time.perf_counter()
+        with path.open('rb') as file:
+            chunks = stream_import(
+                resource, file, format, options['chunk_size'], dry_run=options['dry_run']
+            )
+            try:
+                for numbers, result in chunks:
+                    rows += result.total_rows
+                    totals.update(result.totals)
+                    for message in self.errors(numbers, result):
+                        errors += 1
+                        if errors <= options['max_errors']:
+                            self.stderr.write(message)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f'{rows} rows, {rows / elapsed:.0f} rows/s')
+            except ValueError as error:
+                raise CommandError(error)
+
+        elapsed = time.perf_counter() - started
+        summary = ', '.join(f'{count} {kind}' for kind, count in totals.items() if count)
+        self.stdout.write(f'{rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s): {summary}')
+        if rusage is not None:
+            # ru_maxrss is in kilobytes on Linux
+            peak = rusage.getrusage(rusage.RUSAGE_SELF).ru_maxrss / 1024
+            self.stdout.write(f'Peak memory {peak:.0f} MB')
+        if errors:
+            raise CommandError(f'{errors} rows or chunks failed')
+        self.stdout.write(self.style.SUCCESS('Dry run finished' if options['dry_run'] else 'Import finished'))
+
+    def errors(self, numbers, result):
+        for error in result.base_errors:
+            yield f'Rows {numbers[0]}-{numbers[-1]} rolled back: {error.error}'
+        for number, row_errors in result.row_errors():
+            for error in row_errors:
+                yield f'Row {numbers[number - 1]}: {error.error}'
+        for row in result.invalid_rows:
+            messages = '; '.join(f'{field}: {", ".join(errors)}' for field, errors in row.error_dict.items())
+            yield f'Row {numbers[row.number - 1]}: {messages}'
@@ -0,0 +1,49 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from ...services.outbox import process_outbox, wait_for_events
+from .verify_stock_ledger import setup_worker
+
+
+def work(batch_size, poll, once):
+    """
+    Process batches until the outbox is empty, then wait for more, or
+    return the number processed with ``once``
+    """
+    processed = 0
+    while True:
+        count = process_outbox(batch_size)
+        processed += count
+        if count:
+            continue
+        if once:
+            return processed
+        # An event queued before the wait starts is picked up by the next
+        # poll at the latest
+        wait_for_events(poll)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued outbox events, such as deferred movement posts, in batches; '
+        'any number of workers can run at once'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Events per transaction')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes to start')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the outbox is empty')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        arguments = options['batch_size'], options['poll'], options['once']
+        if options['processes'] > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(options['processes'], initializer=setup_worker) as pool:
+                processed = sum(pool.map(work, *[[argument] * options['processes'] for argument in arguments]))
+        else:
+            processed = work(*arguments)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Processed {processed} events in {elapsed:.2f}s')
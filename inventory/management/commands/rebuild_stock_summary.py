@@ -0,0 +1,73 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.db.models import Max, Min, Sum
+from ...models import Product, ProductStockTotal, Stock, StockReservation, StockSummary
+from ...services.summary import summarize
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stock summaries and per-product totals from the Stock table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Products per chunk')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        bounds = Product.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            StockSummary.objects.all().delete()
+            ProductStockTotal.objects.all().delete()
+            return
+
+        summaries = totals = 0
+        for low in range(bounds['low'], bounds['high'] + 1, chunk_size):
+            products = {'product_id__gte': low, 'product_id__lt': low + chunk_size}
+            # Each chunk is replaced in its own transaction so writers are
+            # only blocked for one chunk at a time
+            with transaction.atomic(using=router.db_for_write(StockSummary)):
+                stocks = Stock.objects.filter(**products)
+                # Hold the chunk's stock rows so concurrent movements wait.
+                # Taken first, in the order posting takes its locks, so a
+                # movement never holds stock this waits for while waiting
+                # on the summaries deleted below
+                list(stocks.select_for_update().values_list('pk'))
+                # Reorder points are settings, not derived from stock
+                thresholds = {
+                    (product_id, warehouse_id): reorder_point
+                    for product_id, warehouse_id, reorder_point in StockSummary.objects.filter(
+                        reorder_point__isnull=False, **products
+                    ).values_list('product_id', 'warehouse_id', 'reorder_point')
+                }
+                StockSummary.objects.filter(**products).delete()
+                ProductStockTotal.objects.filter(**products).delete()
+
+                per_product = defaultdict(int)
+                rows = {}
+                for row in summarize(stocks):
+                    key = row['product_id'], row['stockard__warehouse_id']
+                    rows[key] = StockSummary(product_id=key[0], warehouse_id=key[1], quantity=row['quantity'])
+                    per_product[row['product_id']] += row['quantity']
+                # Active reservations hold their units through the rebuild
+                holds = StockReservation.objects.filter(status='ACTIVE', **products).order_by().values(
+                    'product_id', 'warehouse_id'
+                ).annotate(quantity=Sum('quantity'))
+                for hold in holds:
+                    key = hold['product_id'], hold['warehouse_id']
+                    rows.setdefault(key, StockSummary(product_id=key[0], warehouse_id=key[1], quantity=0))
+                    rows[key].reserved_quantity = hold['quantity']
+                for key, reorder_point in thresholds.items():
+                    rows.setdefault(key, StockSummary(product_id=key[0], warehouse_id=key[1], quantity=0))
+                    rows[key].reorder_point = reorder_point
+                rows = list(rows.values())
+                StockSummary.objects.bulk_create(rows)
+                ProductStockTotal.objects.bulk_create([
+                    ProductStockTotal(product_id=product_id, quantity=quantity)
+                    for product_id, quantity in per_product.items()
+                ])
+            summaries += len(rows)
+            totals += len(per_product)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {summaries} stock summaries and {totals} product totals'
+        ))
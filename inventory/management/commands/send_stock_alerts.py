@@ -0,0 +1,17 @@
+import time
+from django.core.management.base import BaseCommand
+from ...services.alerts import send_digest
+
+
+class Command(BaseCommand):
+    help = 'Send the stock alerts recorded since the last run as one digest; schedule it as often as wanted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10_000, help='Alerts per digest')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        sent = send_digest(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {sent} stock alerts in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,42 @@
+import multiprocessing
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from ...utils import generate_reference_number
+
+
+def generate(count):
+    try:
+        return [generate_reference_number() for _ in range(count)]
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Generate reference numbers from parallel processes and check for collisions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--count', type=int, default=100_000, help='Total references to generate')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        per_process = -(-options['count'] // processes)
+
+        # Children are forked, so they must not inherit open connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        started = time.perf_counter()
+        with context.Pool(processes) as pool:
+            results = pool.map(generate, [per_process] * processes)
+        elapsed = time.perf_counter() - started
+
+        references = [reference for result in results for reference in result]
+        duplicates = len(references) - len(set(references))
+        self.stdout.write(
+            f'{len(references)} references from {processes} processes in {elapsed:.2f}s '
+            f'({len(references) / elapsed:.0f}/s)'
+        )
+        if duplicates:
+            raise CommandError(f'{duplicates} duplicate reference numbers')
+        self.stdout.write(self.style.SUCCESS('No collisions'))
@@ -0,0 +1,42 @@
+import datetime
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from ...models import StockSnapshot
+from ...services import take_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Snapshot the per-warehouse stock at a day or month close; schedule it '
+        'shortly after midnight with --period month on the first of the month'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--at',
+            help='Date (its close) or datetime to rebuild from the movement ledger; default: now, from the summaries'
+        )
+        parser.add_argument('--period', choices=['day', 'month'], default='day')
+        parser.add_argument(
+            '--keep-days', type=int,
+            help='Delete day snapshots older than this many days; month snapshots are kept'
+        )
+
+    def handle(self, *args, **options):
+        at = None
+        if options['at']:
+            at = parse_datetime(options['at']) or parse_date(options['at'])
+            if at is None:
+                raise CommandError(f'Cannot parse --at "{options["at"]}"')
+
+        started = time.perf_counter()
+        rows = take_snapshot(at, period=options['period'].upper())
+        self.stdout.write(f'Wrote {rows} snapshot rows in {time.perf_counter() - started:.2f}s')
+
+        if options['keep_days'] is not None:
+            horizon = timezone.now() - datetime.timedelta(days=options['keep_days'])
+            deleted, _counts = StockSnapshot.objects.filter(period='DAY', taken_at__lt=horizon).delete()
+            self.stdout.write(f'Deleted {deleted} day snapshot rows taken before {horizon:%Y-%m-%d}')
+        self.stdout.write(self.style.SUCCESS('Snapshot taken'))
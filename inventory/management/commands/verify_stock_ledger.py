@@ -0,0 +1,86 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+from ...models import Product, Stock, Stockard, StockMovementItem, Warehouse
+from ...services.ledger import find_drift, repair_drift
+
+
+def check(warehouse_id, chunk_size, repair):
+    """
+    Diff one warehouse, or everything when ``warehouse_id`` is None, in
+    stockard id chunks, repairing each chunk as it goes
+    """
+    ranges = [None]
+    if chunk_size:
+        stockards = Stockard.objects.all()
+        if warehouse_id is not None:
+            stockards = stockards.filter(warehouse_id=warehouse_id)
+        bounds = stockards.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            ranges = []
+        else:
+            ranges = [(low, low + chunk_size) for low in range(bounds['low'], bounds['high'] + 1, chunk_size)]
+    drift = []
+    for stockards in ranges:
+        found = find_drift(warehouse_id, stockards)
+        if found and repair:
+            repair_drift(found)
+        drift.extend(found)
+    return drift
+
+
+def setup_worker():
+    # Spawned workers start without Django; forked ones only need their
+    # own connections, which the parent closed before forking
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Diff Stock quantities against the movement ledger, report the drift and optionally repair it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Add the drift back to the stock rows and summaries')
+        parser.add_argument(
+            '--chunk-size', type=int, default=0,
+            help='Stockards per pass; 0 diffs each warehouse, or everything, in a single grouped statement'
+        )
+        parser.add_argument('--workers', type=int, default=1, help='Processes to split the warehouses across')
+        parser.add_argument('--show', type=int, default=20, help='Drifted rows to print')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        chunk_size, repair = options['chunk_size'], options['repair']
+        if options['workers'] > 1:
+            warehouses = list(Warehouse.objects.values_list('pk', flat=True))
+            connections.close_all()
+            with ProcessPoolExecutor(options['workers'], initializer=setup_worker) as pool:
+                results = pool.map(check, warehouses, [chunk_size] * len(warehouses), [repair] * len(warehouses))
+                drift = [row for rows in results for row in rows]
+        else:
+            drift = check(None, chunk_size, repair)
+        elapsed = time.perf_counter() - started
+
+        self.show(drift[:options['show']])
+        total = sum(abs(expected - actual) for _product, _stockard, expected, actual in drift)
+        self.stdout.write(f'Checked the ledger in {elapsed:.2f}s: {len(drift)} stock rows drifted by {total} units')
+        if drift and not repair:
+            raise CommandError('Stock has drifted from the movement ledger, run again with --repair to fix it')
+        if drift:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {len(drift)} stock rows'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Stock matches the ledger ({StockMovementItem.objects.count()} items, {Stock.objects.count()} stock rows)'
+            ))
+
+    def show(self, drift):
+        if not drift:
+            return
+        products = Product.objects.in_bulk({product_id for product_id, *_rest in drift})
+        stockards = Stockard.objects.in_bulk({stockard_id for _product_id, stockard_id, *_rest in drift})
+        for product_id, stockard_id, expected, actual in drift:
+            product = products.get(product_id, f'product #{product_id}')
+            stockard = stockards.get(stockard_id, f'stockard #{stockard_id}')
+            self.stdout.write(f'{product} in {stockard}: ledger {expected}, stock {actual} ({actual - expected:+d})')
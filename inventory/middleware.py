@@ -0,0 +1,46 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from .routers import request_state
+
+PINNED_UNTIL = '_inventory_pinned_until'
+
+
+def pin_seconds():
+    return getattr(settings, 'INVENTORY_REPLICA_PIN_SECONDS', 10)
+
+
+class ReplicaPinningMiddleware:
+    """
+    Read-your-writes for ``ReplicaRouter``: a session that wrote to the
+    inventory tables reads from the primary for
+    ``INVENTORY_REPLICA_PIN_SECONDS`` (10) afterwards, longer than the
+    replica takes to catch up. Goes after SessionMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        session = getattr(request, 'session', None)
+        pinned_until = session.get(PINNED_UNTIL, 0) if session is not None else 0
+        with request_state(pinned=pinned_until > time.time()) as state:
+            response = self.get_response(request)
+        if state.wrote and session is not None:
+            session[PINNED_UNTIL] = time.time() + pin_seconds()
+        return response
+
+    async def __acall__(self, request):
+        session = getattr(request, 'session', None)
+        pinned_until = await session.aget(PINNED_UNTIL, 0) if session is not None else 0
+        with request_state(pinned=pinned_until > time.time()) as state:
+            response = await self.get_response(request)
+        if state.wrote and session is not None:
+            await session.aset(PINNED_UNTIL, time.time() + pin_seconds())
+        return response
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0007_remove_stockmovement_warehouse_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReferenceSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "prefix",
+                    models.CharField(max_length=50, unique=True, verbose_name="Prefix"),
+                ),
+                (
+                    "last_value",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Last Value"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Reference Sequence",
+                "verbose_name_plural": "Reference Sequences",
+            },
+        ),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_summaries(apps, schema_editor):
+    Stock = apps.get_model("inventory", "Stock")
+    StockSummary = apps.get_model("inventory", "StockSummary")
+    ProductStockTotal = apps.get_model("inventory", "ProductStockTotal")
+
+    rows = (
+        Stock.objects.order_by()
+        .values("product_id", "stockard__warehouse_id")
+        .annotate(quantity=Sum("quantity"))
+    )
+    StockSummary.objects.bulk_create(
+        [
+            StockSummary(
+                product_id=row["product_id"],
+                warehouse_id=row["stockard__warehouse_id"],
+                quantity=row["quantity"],
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+    totals = (
+        Stock.objects.order_by().values("product_id").annotate(quantity=Sum("quantity"))
+    )
+    ProductStockTotal.objects.bulk_create(
+        [
+            ProductStockTotal(product_id=row["product_id"], quantity=row["quantity"])
+            for row in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0008_reference_sequence"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductStockTotal",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stock_total",
+                        serialize=False,
+                        to="inventory.product",
+                    ),
+                ),
+                ("quantity", models.IntegerField(default=0, verbose_name="Quantity")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Updated At"),
+                ),
+            ],
+            options={
+                "verbose_name": "Product Stock Total",
+                "verbose_name_plural": "Product Stock Totals",
+                "ordering": ["product__name"],
+            },
+        ),
+        migrations.CreateModel(
+            name="StockSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.IntegerField(default=0, verbose_name="Quantity")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Updated At"),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_summaries",
+                        to="inventory.product",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_summaries",
+                        to="inventory.warehouse",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Stock Summary",
+                "verbose_name_plural": "Stock Summaries",
+                "ordering": ["warehouse__name", "product__name"],
+                "unique_together": {("product", "warehouse")},
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0009_stock_summary"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="stock",
+            index=models.Index(
+                fields=["product", "stockard", "quantity"],
+                name="inv_stock_prod_stkd_qty_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="inv_move_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["movement_type", "-created_at", "-id"],
+                name="inv_move_type_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["from_warehouse", "-created_at", "-id"],
+                name="inv_move_from_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovement",
+            index=models.Index(
+                fields=["to_warehouse", "-created_at", "-id"],
+                name="inv_move_to_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovementitem",
+            index=models.Index(
+                fields=["movement", "product"], name="inv_item_move_prod_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:40
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0010_changelist_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"),
+                name="inv_product_name_lower_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockard",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"),
+                name="inv_stockard_name_lower_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="warehouse",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"),
+                name="inv_warehouse_name_lower_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from inventory.search import get_search_backend
+
+    get_search_backend(schema_editor.connection.alias).install(schema_editor, apps)
+
+
+def uninstall(apps, schema_editor):
+    from inventory.search import get_search_backend
+
+    get_search_backend(schema_editor.connection.alias).uninstall(schema_editor, apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0011_autocomplete_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
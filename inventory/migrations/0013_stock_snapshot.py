@@ -0,0 +1,61 @@
+# Generated by Django 5.2.3 on 2026-10-17 21:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0012_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.IntegerField(verbose_name="Quantity")),
+                ("taken_at", models.DateTimeField(verbose_name="Taken At")),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("DAY", "Day"), ("MONTH", "Month")],
+                        default="DAY",
+                        max_length=10,
+                        verbose_name="Period",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_snapshots",
+                        to="inventory.product",
+                    ),
+                ),
+                (
+                    "warehouse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_snapshots",
+                        to="inventory.warehouse",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Stock Snapshot",
+                "verbose_name_plural": "Stock Snapshots",
+                "ordering": ["-taken_at", "warehouse__name", "product__name"],
+                "unique_together": {("taken_at", "warehouse", "product")},
+            },
+        ),
+    ]
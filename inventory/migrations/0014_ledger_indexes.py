@@ -0,0 +1,54 @@
+# Generated by Django 5.2.3 on 2026-10-17 21:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0013_stock_snapshot"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="stockmovementitem",
+            name="from_stockard",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="outbound_movement_items",
+                to="inventory.stockard",
+                verbose_name="From Stockard",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="stockmovementitem",
+            name="to_stockard",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="inbound_movement_items",
+                to="inventory.stockard",
+                verbose_name="To Stockard",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovementitem",
+            index=models.Index(
+                fields=["to_stockard", "product", "quantity"],
+                name="inv_item_to_ledger_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovementitem",
+            index=models.Index(
+                fields=["from_stockard", "product", "quantity"],
+                name="inv_item_from_ledger_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0016_outbox_event"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockAlert",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("LOW", "Below reorder point"),
+                            ("RECOVERED", "Back at reorder point"),
+                        ],
+                        max_length=10,
+                        verbose_name="Kind",
+                    ),
+                ),
+                ("quantity", models.IntegerField(verbose_name="Quantity")),
+                (
+                    "reorder_point",
+                    models.PositiveIntegerField(verbose_name="Reorder Point"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created At"),
+                ),
+                (
+                    "sent_at",
+                    models.DateTimeField(blank=True, null=True, verbose_name="Sent At"),
+                ),
+            ],
+            options={
+                "verbose_name": "Stock Alert",
+                "verbose_name_plural": "Stock Alerts",
+                "ordering": ("-id",),
+            },
+        ),
+        migrations.AddField(
+            model_name="stocksummary",
+            name="reorder_point",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Alert when the quantity falls below this; empty for no alerts",
+                null=True,
+                verbose_name="Reorder Point",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stocksummary",
+            index=models.Index(
+                condition=models.Q(("quantity__lt", models.F("reorder_point"))),
+                fields=["warehouse", "product"],
+                name="inv_summary_shortage_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stockalert",
+            name="product",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="stock_alerts",
+                to="inventory.product",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stockalert",
+            name="warehouse",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="stock_alerts",
+                to="inventory.warehouse",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockalert",
+            index=models.Index(
+                condition=models.Q(("sent_at__isnull", True)),
+                fields=["id"],
+                name="inv_alert_unsent_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,194 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0017_reorder_alerts"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedStockMovement",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                (
+                    "movement_type",
+                    models.CharField(
+                        choices=[
+                            ("IN", "Inbound"),
+                            ("OUT", "Outbound"),
+                            ("TRANSFER", "Transfer"),
+                        ],
+                        max_length=10,
+                        verbose_name="Movement Type",
+                    ),
+                ),
+                (
+                    "reference_number",
+                    models.CharField(
+                        max_length=50, unique=True, verbose_name="Reference Number"
+                    ),
+                ),
+                ("notes", models.TextField(blank=True, verbose_name="Notes")),
+                ("created_at", models.DateTimeField(verbose_name="Created At")),
+                (
+                    "archived_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Archived At"),
+                ),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Created By",
+                    ),
+                ),
+                (
+                    "from_warehouse",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="inventory.warehouse",
+                        verbose_name="From Warehouse",
+                    ),
+                ),
+                (
+                    "to_warehouse",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="inventory.warehouse",
+                        verbose_name="To Warehouse",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Archived Stock Movement",
+                "verbose_name_plural": "Archived Stock Movements",
+                "ordering": ("-created_at",),
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedStockMovementItem",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("quantity", models.IntegerField(verbose_name="Quantity")),
+                (
+                    "from_stockard",
+                    models.ForeignKey(
+                        blank=True,
+                        db_index=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="inventory.stockard",
+                        verbose_name="From Stockard",
+                    ),
+                ),
+                (
+                    "movement",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="inventory.archivedstockmovement",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="inventory.product",
+                        verbose_name="Product",
+                    ),
+                ),
+                (
+                    "to_stockard",
+                    models.ForeignKey(
+                        blank=True,
+                        db_index=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="inventory.stockard",
+                        verbose_name="To Stockard",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Archived Stock Movement Item",
+                "verbose_name_plural": "Archived Stock Movement Items",
+                "ordering": ("movement", "product"),
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedStockBalance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.IntegerField(default=0, verbose_name="Quantity")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Updated At"),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="inventory.product",
+                    ),
+                ),
+                (
+                    "stockard",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="inventory.stockard",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Archived Stock Balance",
+                "verbose_name_plural": "Archived Stock Balances",
+                "indexes": [
+                    models.Index(
+                        fields=["stockard", "product", "quantity"],
+                        name="inv_archive_balance_idx",
+                    )
+                ],
+                "unique_together": {("product", "stockard")},
+            },
+        ),
+        migrations.AddIndex(
+            model_name="archivedstockmovement",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="inv_archive_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedstockmovementitem",
+            index=models.Index(
+                fields=["movement", "product"], name="inv_archive_item_move_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,117 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_posted_at(apps, schema_editor):
+    # Lines saved so far took effect with their movement
+    for item_name, movement_name in (
+        ("StockMovementItem", "StockMovement"),
+        ("ArchivedStockMovementItem", "ArchivedStockMovement"),
+    ):
+        Item = apps.get_model("inventory", item_name)
+        Movement = apps.get_model("inventory", movement_name)
+        Item.objects.update(
+            posted_at=Subquery(
+                Movement.objects.filter(pk=OuterRef("movement_id")).values("created_at")
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0018_movement_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockLineRevision",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.IntegerField(
+                        help_text="Negative when the line took stock out",
+                        verbose_name="Quantity",
+                    ),
+                ),
+                ("posted_at", models.DateTimeField(verbose_name="Posted At")),
+                (
+                    "superseded_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Superseded At"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Stock Line Revision",
+                "verbose_name_plural": "Stock Line Revisions",
+            },
+        ),
+        migrations.AddField(
+            model_name="archivedstockmovementitem",
+            name="posted_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, verbose_name="Posted At"
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="stockmovementitem",
+            name="posted_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, verbose_name="Posted At"
+            ),
+        ),
+        migrations.RunPython(backfill_posted_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="archivedstockmovementitem",
+            index=models.Index(
+                fields=["posted_at"], name="inv_archive_item_posted_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockmovementitem",
+            index=models.Index(fields=["posted_at"], name="inv_item_posted_idx"),
+        ),
+        migrations.AddField(
+            model_name="stocklinerevision",
+            name="product",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="inventory.product",
+            ),
+        ),
+        migrations.AddField(
+            model_name="stocklinerevision",
+            name="warehouse",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="inventory.warehouse",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stocklinerevision",
+            index=models.Index(fields=["posted_at"], name="inv_revision_posted_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="stocklinerevision",
+            index=models.Index(
+                fields=["superseded_at"], name="inv_revision_superseded_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:33
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0019_line_revisions"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="stockmovementitem",
+            options={
+                "ordering": ("movement_id", "product_id"),
+                "verbose_name": "Stock Movement Item",
+                "verbose_name_plural": "Stock Movement Items",
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:01
+
+import inventory.functions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0020_item_ordering"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="product",
+            name="inv_product_name_lower_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="stockard",
+            name="inv_stockard_name_lower_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="warehouse",
+            name="inv_warehouse_name_lower_idx",
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                inventory.functions.PrefixKey("name"),
+                name="inv_product_name_prefix_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockard",
+            index=models.Index(
+                inventory.functions.PrefixKey("name"),
+                name="inv_stockard_name_prefix_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="warehouse",
+            index=models.Index(
+                inventory.functions.PrefixKey("name"),
+                name="inv_warehouse_name_prefix_idx",
+            ),
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, router, transaction
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
+from .functions import PrefixKey
 from .utils import generate_reference_number
 
 User = settings.AUTH_USER_MODEL
@@ -15,21 +17,35 @@ class Warehouse(models.Model):
         verbose_name = _('Warehouse')
         verbose_name_plural = _('Warehouses')
         ordering = ['name']
+        indexes = [
+            # Prefix lookups from the admin autocomplete
+            models.Index(PrefixKey('name'), name='inv_warehouse_name_prefix_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+class StockardManager(models.Manager):
+    # __str__ needs the warehouse, and the default ordering joins it anyway
+    def get_queryset(self):
+        return super().get_queryset().select_related('warehouse')
+
 class Stockard(models.Model):
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='stockards')
     name = models.CharField(_('Stockard Name'), max_length=100)
     description = models.TextField(_('Description'), blank=True)
     created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
 
+    objects = StockardManager()
+
     class Meta:
         verbose_name = _('Stockard')
         verbose_name_plural = _('Stockards')
         ordering = ['warehouse__name', 'name']
         unique_together = ['warehouse', 'name']
+        indexes = [
+            models.Index(PrefixKey('name'), name='inv_stockard_name_prefix_idx'),
+        ]
 
     def __str__(self):
         return f"{self.warehouse.name} - {self.name}"
@@ -43,6 +59,9 @@ class Product(models.Model):
     class Meta:
         verbose_name = _('Product')
         verbose_name_plural = _('Products')
+        indexes = [
+            models.Index(PrefixKey('name'), name='inv_product_name_prefix_idx'),
+        ]
         ordering = ['name']
 
     def __str__(self):
@@ -60,14 +79,200 @@ class Stock(models.Model):
         verbose_name_plural = _('Stocks')
         ordering = ['stockard__warehouse__name', 'stockard__name', 'product__name']
         unique_together = ['product', 'stockard']
+        indexes = [
+            # Covers product lookups that only need the stockard and quantity
+            models.Index(fields=['product', 'stockard', 'quantity'], name='inv_stock_prod_stkd_qty_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} in {self.stockard}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted state so direct edits can update the summaries
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     @property
     def is_in_stock(self):
         return self.quantity > 0
 
+class StockSummary(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_summaries')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='stock_summaries')
+    quantity = models.IntegerField(_('Quantity'), default=0)
+    # Held by active reservations; kept in step by services.reservations.
+    # Defaulted in the database too, as increment() inserts rows without it
+    reserved_quantity = models.IntegerField(_('Reserved Quantity'), default=0, db_default=0)
+    reorder_point = models.PositiveIntegerField(
+        _('Reorder Point'),
+        null=True,
+        blank=True,
+        help_text=_('Alert when the quantity falls below this; empty for no alerts')
+    )
+    updated_at = models.DateTimeField(_('Updated At'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('Stock Summary')
+        verbose_name_plural = _('Stock Summaries')
+        ordering = ['warehouse__name', 'product__name']
+        unique_together = ['product', 'warehouse']
+        indexes = [
+            # Only the open shortages, however many summaries there are
+            models.Index(
+                fields=['warehouse', 'product'],
+                condition=models.Q(quantity__lt=models.F('reorder_point')),
+                name='inv_summary_shortage_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} in {self.warehouse.name}"
+
+    @property
+    def available_quantity(self):
+        return self.quantity - self.reserved_quantity
+
+    @property
+    def is_short(self):
+        return self.reorder_point is not None and self.quantity < self.reorder_point
+
+class ProductStockTotal(models.Model):
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stock_total'
+    )
+    quantity = models.IntegerField(_('Quantity'), default=0)
+    updated_at = models.DateTimeField(_('Updated At'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('Product Stock Total')
+        verbose_name_plural = _('Product Stock Totals')
+        ordering = ['product__name']
+
+    def __str__(self):
+        return f"{self.product.name}: {self.quantity}"
+
+class StockSnapshot(models.Model):
+    """
+    Per-warehouse quantity of a product at a day or month close. Only
+    non-zero quantities are stored; a product missing from a snapshot had
+    none in that warehouse.
+    """
+    PERIODS = [
+        ('DAY', _('Day')),
+        ('MONTH', _('Month')),
+    ]
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='stock_snapshots')
+    quantity = models.IntegerField(_('Quantity'))
+    taken_at = models.DateTimeField(_('Taken At'))
+    period = models.CharField(_('Period'), max_length=10, choices=PERIODS, default='DAY')
+
+    class Meta:
+        verbose_name = _('Stock Snapshot')
+        verbose_name_plural = _('Stock Snapshots')
+        ordering = ['-taken_at', 'warehouse__name', 'product__name']
+        # Also serves the "latest snapshot before" lookup
+        unique_together = ['taken_at', 'warehouse', 'product']
+
+    def __str__(self):
+        return f"{self.product.name} in {self.warehouse.name} at {self.taken_at:%Y-%m-%d %H:%M}"
+
+class StockReservation(models.Model):
+    """
+    A hold on units of a product in a warehouse until ``expires_at``.
+
+    Active holds are counted in ``StockSummary.reserved_quantity``, which
+    movements cannot issue. A hold ends committed into a movement, released
+    or expired; ended holds are kept for reference.
+    """
+    STATUSES = [
+        ('ACTIVE', _('Active')),
+        ('COMMITTED', _('Committed')),
+        ('RELEASED', _('Released')),
+        ('EXPIRED', _('Expired')),
+    ]
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.IntegerField(_('Quantity'))
+    reference = models.CharField(
+        _('Reference'),
+        max_length=100,
+        blank=True,
+        help_text=_('The order or cart holding the stock')
+    )
+    status = models.CharField(_('Status'), max_length=10, choices=STATUSES, default='ACTIVE')
+    expires_at = models.DateTimeField(_('Expires At'))
+    created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+    closed_at = models.DateTimeField(_('Closed At'), null=True, blank=True)
+    movement = models.ForeignKey(
+        'StockMovement',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='reservations',
+        verbose_name=_('Movement')
+    )
+
+    class Meta:
+        verbose_name = _('Stock Reservation')
+        verbose_name_plural = _('Stock Reservations')
+        ordering = ('-created_at',)
+        indexes = [
+            # The sweeper only walks the active holds, oldest expiry first
+            models.Index(
+                fields=['expires_at'], condition=models.Q(status='ACTIVE'), name='inv_resv_active_expiry_idx'
+            ),
+            models.Index(fields=['reference'], name='inv_resv_reference_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name} in {self.warehouse.name} ({self.get_status_display()})"
+
+class ReferenceSequence(models.Model):
+    prefix = models.CharField(_('Prefix'), max_length=50, unique=True)
+    last_value = models.PositiveBigIntegerField(_('Last Value'), default=0)
+
+    class Meta:
+        verbose_name = _('Reference Sequence')
+        verbose_name_plural = _('Reference Sequences')
+
+    def __str__(self):
+        return f"{self.prefix} ({self.last_value})"
+
+class StockAlert(models.Model):
+    """
+    A stock summary crossing its reorder point, recorded as the stock
+    changes and sent out with the next digest
+    """
+    KINDS = [
+        ('LOW', _('Below reorder point')),
+        ('RECOVERED', _('Back at reorder point')),
+    ]
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_alerts')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='stock_alerts')
+    kind = models.CharField(_('Kind'), max_length=10, choices=KINDS)
+    quantity = models.IntegerField(_('Quantity'))
+    reorder_point = models.PositiveIntegerField(_('Reorder Point'))
+    created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+    sent_at = models.DateTimeField(_('Sent At'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('Stock Alert')
+        verbose_name_plural = _('Stock Alerts')
+        ordering = ('-id',)
+        indexes = [
+            # The digest only walks the alerts not sent yet
+            models.Index(fields=['id'], condition=models.Q(sent_at__isnull=True), name='inv_alert_unsent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product} in {self.warehouse}: {self.get_kind_display()}"
+
 class StockMovement(models.Model):
     from_warehouse = models.ForeignKey(
         Warehouse,
@@ -121,6 +326,14 @@ class StockMovement(models.Model):
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
+    def delete(self, *args, **kwargs):
+        from .services import unpost_movements
+
+        # The lines cascade with the movement; their stock goes back first
+        with transaction.atomic(using=router.db_for_write(type(self))):
+            unpost_movements([self])
+            return super().delete(*args, **kwargs)
+
     notes = models.TextField(
         verbose_name=_('Notes'),
         blank=True
@@ -140,6 +353,12 @@ class StockMovement(models.Model):
         verbose_name = _('Stock Movement')
         verbose_name_plural = _('Stock Movements')
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='inv_move_created_idx'),
+            models.Index(fields=['movement_type', '-created_at', '-id'], name='inv_move_type_created_idx'),
+            models.Index(fields=['from_warehouse', '-created_at', '-id'], name='inv_move_from_created_idx'),
+            models.Index(fields=['to_warehouse', '-created_at', '-id'], name='inv_move_to_created_idx'),
+        ]
 
     def __str__(self):
         return f"#{self.reference_number} - {self.get_movement_type_display()}"
@@ -161,7 +380,8 @@ class StockMovementItem(models.Model):
         related_name='outbound_movement_items',
         verbose_name=_('From Stockard'),
         null=True,
-        blank=True
+        blank=True,
+        db_index=False
     )
     to_stockard = models.ForeignKey(
         Stockard,
@@ -169,106 +389,242 @@ class StockMovementItem(models.Model):
         related_name='inbound_movement_items',
         verbose_name=_('To Stockard'),
         null=True,
-        blank=True
+        blank=True,
+        db_index=False
     )
 
     quantity = models.IntegerField(
         verbose_name=_('Quantity')
     )
+    # When the line's current state was applied to the stock, which may be
+    # later than the movement for edited and deferred lines
+    posted_at = models.DateTimeField(_('Posted At'), default=timezone.now)
 
     class Meta:
         verbose_name = _('Stock Movement Item')
         verbose_name_plural = _('Stock Movement Items')
-        ordering = ('movement', 'product')
+        # By the columns themselves; ordering by the relations would sort on
+        # the movement's date and the product's name, which the index below
+        # cannot serve
+        ordering = ('movement_id', 'product_id')
+        indexes = [
+            models.Index(fields=['movement', 'product'], name='inv_item_move_prod_idx'),
+            # Replace the plain stockard indexes; the ledger check reads
+            # stockard ranges from these without touching the table
+            models.Index(fields=['to_stockard', 'product', 'quantity'], name='inv_item_to_ledger_idx'),
+            models.Index(fields=['from_stockard', 'product', 'quantity'], name='inv_item_from_ledger_idx'),
+            models.Index(fields=['posted_at'], name='inv_item_posted_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the line applied so a re-save only applies the change
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
     def clean(self):
-        if self.quantity <= 0:
+        # Stock availability is checked for the whole formset at once by
+        # StockMovementItemFormSet, and again when the deltas are applied
+        if self.quantity is not None and self.quantity <= 0:
             raise ValidationError(_('Quantity must be greater than zero'))
-        
-        if self.movement.movement_type == 'OUT' or self.movement.movement_type == 'TRANSFER':
-            if not self.product:
-                raise ValidationError(_('Product is required'))
-            
-            try:
-                stock = Stock.objects.get(
-                    product=self.product,
-                    stockard=self.from_stockard
-                )
-                if stock.quantity < self.quantity:
-                    raise ValidationError(_(
-                        'Not enough stock available. Only {} units available in stockard {}'
-                    ).format(stock.quantity, self.from_stockard))
-            except Stock.DoesNotExist:
-                raise ValidationError(_(
-                    'No stock available for this product in the selected stockard'
-                ))
-            
-        # Skip stockard validation since they will be created in save()
-        pass
 
     def save(self, *args, **kwargs):
-        # Find or create stockards based on product and warehouse
-        if self.movement.movement_type == 'IN':
-            # For inbound, find or create a stockard in to_warehouse
-            self.to_stockard = Stockard.objects.get_or_create(
-                warehouse=self.movement.to_warehouse,
-                name=f"{self.product.name} Stock"
-            )[0]
-        elif self.movement.movement_type == 'OUT':
-            # For outbound, find the stockard with available stock in from_warehouse
-            self.from_stockard = Stock.objects.filter(
-                product=self.product,
-                stockard__warehouse=self.movement.from_warehouse
-            ).order_by('stockard__name').first()
-            if not self.from_stockard:
-                raise ValidationError(_('No stock available for this product in the selected warehouse'))
-            self.from_stockard = self.from_stockard.stockard
-        elif self.movement.movement_type == 'TRANSFER':
-            # For transfer, find the stockard with available stock in from_warehouse
-            self.from_stockard = Stock.objects.filter(
-                product=self.product,
-                stockard__warehouse=self.movement.from_warehouse
-            ).order_by('stockard__name').first()
-            if not self.from_stockard:
-                raise ValidationError(_('No stock available for this product in the selected warehouse'))
-            self.from_stockard = self.from_stockard.stockard
-            
-            # Create or get a stockard for to_stockard in to_warehouse
-            self.to_stockard = Stockard.objects.get_or_create(
-                warehouse=self.movement.to_warehouse,
-                name=f"{self.product.name} Transfer Stock"
-            )[0]
-
-        # Update stock quantities
-        if self.movement.movement_type == 'IN':
-            stock, created = Stock.objects.get_or_create(
-                product=self.product,
-                stockard=self.to_stockard
-            )
-            stock.quantity += self.quantity
-            stock.save()
-        elif self.movement.movement_type == 'OUT':
-            stock = Stock.objects.get(
-                product=self.product,
-                stockard=self.from_stockard
-            )
-            stock.quantity -= self.quantity
-            stock.save()
-        elif self.movement.movement_type == 'TRANSFER':
-            from_stock = Stock.objects.get(
-                product=self.product,
-                stockard=self.from_stockard
-            )
-            to_stock, created = Stock.objects.get_or_create(
-                product=self.product,
-                stockard=self.to_stockard
-            )
-            from_stock.quantity -= self.quantity
-            to_stock.quantity += self.quantity
-            from_stock.save()
-            to_stock.save()
+        from .services import save_movement_items
 
-        super().save(*args, **kwargs)
+        # Stockards are picked from the movement, and only the difference to
+        # the last saved state is applied to the stock. A line split over
+        # several bins keeps the first and inserts the rest
+        with transaction.atomic(using=router.db_for_write(type(self))):
+            if self.pk is None:
+                save_movement_items(self.movement, created=[self], write=False)
+            else:
+                save_movement_items(self.movement, changed=[self], write=False)
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        from .services import save_movement_items
+
+        with transaction.atomic(using=router.db_for_write(type(self))):
+            save_movement_items(self.movement, deleted=[self], write=False)
+            return super().delete(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.product} - {self.quantity}"
+
+class StockLineRevision(models.Model):
+    """
+    The stock effect a movement line had in one warehouse from
+    ``posted_at`` until it was edited or deleted at ``superseded_at``, so
+    past stock can be replayed after lines change
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='+')
+    quantity = models.IntegerField(_('Quantity'), help_text=_('Negative when the line took stock out'))
+    posted_at = models.DateTimeField(_('Posted At'))
+    superseded_at = models.DateTimeField(_('Superseded At'), default=timezone.now)
+
+    class Meta:
+        verbose_name = _('Stock Line Revision')
+        verbose_name_plural = _('Stock Line Revisions')
+        indexes = [
+            models.Index(fields=['posted_at'], name='inv_revision_posted_idx'),
+            models.Index(fields=['superseded_at'], name='inv_revision_superseded_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product} in {self.warehouse}: {self.quantity}"
+
+class OutboxEvent(models.Model):
+    """
+    Work queued in the transaction that caused it, for the
+    ``process_outbox`` worker to run after commit.
+
+    Events of a movement are processed in id order per warehouse it
+    touches; see ``inventory.services.outbox``. Processed and failed events
+    are kept for reference.
+    """
+    STATUSES = [
+        ('PENDING', _('Pending')),
+        ('DONE', _('Done')),
+        ('FAILED', _('Failed')),
+    ]
+    kind = models.CharField(_('Kind'), max_length=50)
+    movement = models.ForeignKey(
+        StockMovement,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='outbox_events',
+        verbose_name=_('Movement')
+    )
+    payload = models.JSONField(_('Payload'), default=dict, blank=True)
+    status = models.CharField(_('Status'), max_length=10, choices=STATUSES, default='PENDING')
+    attempts = models.PositiveIntegerField(_('Attempts'), default=0)
+    available_at = models.DateTimeField(_('Available At'), default=timezone.now)
+    created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+    processed_at = models.DateTimeField(_('Processed At'), null=True, blank=True)
+    last_error = models.TextField(_('Last Error'), blank=True)
+
+    class Meta:
+        verbose_name = _('Outbox Event')
+        verbose_name_plural = _('Outbox Events')
+        ordering = ('-id',)
+        indexes = [
+            # Workers only walk the pending events, oldest first
+            models.Index(fields=['id'], condition=models.Q(status='PENDING'), name='inv_outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk}"
+
+class ArchivedStockMovement(models.Model):
+    """
+    A closed movement moved out of ``StockMovement`` by
+    ``archive_movements``, with its id, reference number and timestamps
+    unchanged. Read-only; the hot table only holds recent history.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    from_warehouse = models.ForeignKey(
+        Warehouse,
+        on_delete=models.CASCADE,
+        verbose_name=_('From Warehouse'),
+        related_name='+',
+        null=True,
+        blank=True
+    )
+    to_warehouse = models.ForeignKey(
+        Warehouse,
+        on_delete=models.CASCADE,
+        verbose_name=_('To Warehouse'),
+        related_name='+',
+        null=True,
+        blank=True
+    )
+    movement_type = models.CharField(
+        max_length=10,
+        choices=StockMovement.MOVEMENT_TYPES,
+        verbose_name=_('Movement Type')
+    )
+    reference_number = models.CharField(max_length=50, verbose_name=_('Reference Number'), unique=True)
+    notes = models.TextField(verbose_name=_('Notes'), blank=True)
+    created_at = models.DateTimeField(verbose_name=_('Created At'))
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='+',
+        verbose_name=_('Created By')
+    )
+    archived_at = models.DateTimeField(_('Archived At'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Archived Stock Movement')
+        verbose_name_plural = _('Archived Stock Movements')
+        ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='inv_archive_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.reference_number} - {self.get_movement_type_display()}"
+
+class ArchivedStockMovementItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    movement = models.ForeignKey(ArchivedStockMovement, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name=_('Product'))
+    from_stockard = models.ForeignKey(
+        Stockard,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('From Stockard'),
+        null=True,
+        blank=True,
+        db_index=False
+    )
+    to_stockard = models.ForeignKey(
+        Stockard,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('To Stockard'),
+        null=True,
+        blank=True,
+        db_index=False
+    )
+    quantity = models.IntegerField(verbose_name=_('Quantity'))
+    posted_at = models.DateTimeField(_('Posted At'))
+
+    class Meta:
+        verbose_name = _('Archived Stock Movement Item')
+        verbose_name_plural = _('Archived Stock Movement Items')
+        ordering = ('movement', 'product')
+        indexes = [
+            models.Index(fields=['movement', 'product'], name='inv_archive_item_move_idx'),
+            models.Index(fields=['posted_at'], name='inv_archive_item_posted_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product} - {self.quantity}"
+
+class ArchivedStockBalance(models.Model):
+    """
+    What the archived movement items added to or took from each stock row,
+    so the ledger check adds one row per stock row instead of reading the
+    archive
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    stockard = models.ForeignKey(Stockard, on_delete=models.CASCADE, related_name='+')
+    quantity = models.IntegerField(_('Quantity'), default=0)
+    updated_at = models.DateTimeField(_('Updated At'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('Archived Stock Balance')
+        verbose_name_plural = _('Archived Stock Balances')
+        unique_together = ['product', 'stockard']
+        indexes = [
+            # Stockard ranges, like the ledger indexes of the movement items
+            models.Index(fields=['stockard', 'product', 'quantity'], name='inv_archive_balance_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product} in {self.stockard}: {self.quantity}"
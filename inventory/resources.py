@@ -0,0 +1,363 @@
+from collections import defaultdict
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from import_export import fields, resources
+from import_export.widgets import ForeignKeyWidget
+from .models import Product, Stock, Stockard, StockMovement, StockMovementItem, Warehouse
+from .services import post_movements
+from .services.ledger import record_adjustments
+from .services.lookups import invalidate_product
+from .services.posting import resolve_stockards
+from .services.summary import update_summaries
+from .utils import generate_reference_number
+
+
+def column(dataset, name):
+    """
+    Return the distinct non-empty values of a dataset column
+    """
+    if name not in (dataset.headers or ()):
+        return set()
+    return {str(value).strip() for value in dataset[name] if value not in (None, '')}
+
+
+class CachedForeignKeyWidget(ForeignKeyWidget):
+    """
+    ForeignKeyWidget that resolves values from a cache the resource fills
+    once per chunk instead of querying once per row
+    """
+
+    def __init__(self, model, field='pk', **kwargs):
+        super().__init__(model, field, **kwargs)
+        self.cache = {}
+
+    def prime(self, values, create=False):
+        """
+        Load the objects matching ``values``; with ``create`` the missing
+        ones are created first. Duplicate values resolve to the oldest row.
+        """
+        self.cache = {}
+        for obj in self.get_queryset(None, None).filter(**{f'{self.field}__in': values}).order_by('-pk'):
+            self.cache[getattr(obj, self.field)] = obj
+        missing = values - self.cache.keys()
+        if create and missing:
+            created = self.model.objects.bulk_create([self.model(**{self.field: value}) for value in missing])
+            self.cache.update((getattr(obj, self.field), obj) for obj in created)
+
+    def clean(self, value, row=None, **kwargs):
+        if value in (None, ''):
+            return None
+        try:
+            return self.cache[str(value).strip()]
+        except KeyError:
+            raise ValueError(f'{self.model._meta.verbose_name} "{value}" does not exist')
+
+
+class StockardWidget(CachedForeignKeyWidget):
+    """
+    Resolve a stockard by its name and the row's ``warehouse`` column
+    """
+
+    def prime(self, pairs, create=False):
+        self.cache = {}
+        warehouses = Warehouse.objects.in_bulk({warehouse for warehouse, _name in pairs}, field_name='name')
+        names = defaultdict(set)
+        for warehouse, name in pairs:
+            if warehouse in warehouses:
+                names[warehouse].add(name)
+        pks = {}
+        for warehouse, stockard_names in names.items():
+            if create:
+                found = resolve_stockards(warehouses[warehouse].pk, stockard_names)
+            else:
+                found = dict(Stockard.objects.filter(
+                    warehouse=warehouses[warehouse], name__in=stockard_names
+                ).values_list('name', 'pk'))
+            pks.update(((warehouse, name), pk) for name, pk in found.items())
+        stockards = Stockard.objects.in_bulk(pks.values())
+        self.cache = {key: stockards[pk] for key, pk in pks.items()}
+
+    def clean(self, value, row=None, **kwargs):
+        if value in (None, ''):
+            return None
+        warehouse = str((row or {}).get('warehouse') or '').strip()
+        try:
+            return self.cache[warehouse, str(value).strip()]
+        except KeyError:
+            raise ValueError(f'Stockard "{value}" does not exist in warehouse "{warehouse}"')
+
+
+class ChunkedResourceMixin:
+    """
+    ModelResource support for importing a large file one chunk at a time.
+
+    ``prepare_chunk`` resolves everything a chunk refers to with a few
+    queries, filling the foreign key widget caches and returning the
+    existing instances keyed by ``instance_key``, so rows never query on
+    their own. A key repeated within a chunk updates the instance already
+    queued for creation: the last row wins, as it does across chunks.
+    """
+
+    def before_import(self, dataset, **kwargs):
+        super().before_import(dataset, **kwargs)
+        self.instances = self.prepare_chunk(dataset, create=self.writes(kwargs))
+
+    def prepare_chunk(self, dataset, create):
+        return {}
+
+    def row_key(self, row):
+        """
+        The key of the instance a row imports into: its cleaned import id
+        fields, with related objects by primary key
+        """
+        return self.id_key(self.fields[name].clean(row) for name in self.get_import_id_fields())
+
+    def instance_key(self, instance):
+        """
+        The key ``row_key`` gives the rows importing into ``instance``
+        """
+        return self.id_key(self.fields[name].get_value(instance) for name in self.get_import_id_fields())
+
+    def id_key(self, values):
+        key = tuple(getattr(value, 'pk', value) for value in values)
+        return key[0] if len(key) == 1 else key
+
+    def get_instance(self, instance_loader, row):
+        try:
+            return self.instances.get(self.row_key(row))
+        except (KeyError, ValueError, AttributeError):
+            # The row is reported as invalid when its fields are imported
+            return None
+
+    def save_instance(self, instance, is_create, row, **kwargs):
+        if instance.pk is None and not is_create:
+            # Still queued for creation, and already holding this row's values
+            self.before_save_instance(instance, row, **kwargs)
+            self.after_save_instance(instance, row, **kwargs)
+            return
+        super().save_instance(instance, is_create, row, **kwargs)
+        if is_create:
+            self.instances[self.instance_key(instance)] = instance
+
+    def before_save_instance(self, instance, row, **kwargs):
+        super().before_save_instance(instance, row, **kwargs)
+        # bulk_update does not call pre_save, so auto_now is set here
+        now = timezone.now()
+        for field in self.auto_now_fields():
+            setattr(instance, field, now)
+
+    def writes(self, kwargs):
+        """
+        Whether this import touches the database outside the bulk writes
+        """
+        return self._is_using_transactions(kwargs) or not self._is_dry_run(kwargs)
+
+    def auto_now_fields(self):
+        return [field.name for field in self._meta.model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+
+    def get_bulk_update_fields(self):
+        names = [name for name in super().get_bulk_update_fields() if self.fields[name].attribute]
+        return names + self.auto_now_fields()
+
+
+class ProductResource(ChunkedResourceMixin, resources.ModelResource):
+    class Meta:
+        model = Product
+        fields = ('name', 'description')
+        import_id_fields = ('name',)
+        use_bulk = True
+        batch_size = 1000
+        skip_diff = True
+
+    def prepare_chunk(self, dataset, create):
+        instances = {}
+        for product in Product.objects.filter(name__in=column(dataset, 'name')).order_by('-pk'):
+            instances[product.name] = product
+        return instances
+
+    def row_key(self, row):
+        return str(row['name']).strip()
+
+    def instance_key(self, instance):
+        return instance.name
+
+
+class StockResource(ChunkedResourceMixin, resources.ModelResource):
+    """
+    Set stock quantities from ``product``, ``warehouse``, ``stockard`` and
+    ``quantity`` columns. Missing products and stockards are created;
+    warehouses must already exist. The stock summaries are updated with the
+    difference to the previous quantities, which is also written to the
+    ledger as adjustment movements.
+    """
+    product = fields.Field('product', 'product', CachedForeignKeyWidget(Product, 'name'))
+    warehouse = fields.Field(column_name='warehouse')
+    stockard = fields.Field('stockard', 'stockard', StockardWidget(Stockard, 'name'))
+
+    class Meta:
+        model = Stock
+        fields = ('product', 'warehouse', 'stockard', 'quantity')
+        import_id_fields = ('product', 'stockard')
+        use_bulk = True
+        batch_size = 1000
+        skip_diff = True
+        # The stock read for each chunk is locked in the import transaction
+        use_transactions = True
+
+    def get_queryset(self):
+        return Stock.objects.select_related('product', 'stockard__warehouse')
+
+    def dehydrate_warehouse(self, stock):
+        return stock.stockard.warehouse.name
+
+    def prepare_chunk(self, dataset, create):
+        self.fields['product'].widget.prime(column(dataset, 'product'), create=create)
+        pairs = set()
+        if {'warehouse', 'stockard'} <= set(dataset.headers or ()):
+            pairs = {
+                (str(warehouse).strip(), str(name).strip())
+                for warehouse, name in zip(dataset['warehouse'], dataset['stockard'])
+                if warehouse not in (None, '') and name not in (None, '')
+            }
+        self.fields['stockard'].widget.prime(pairs, create=create)
+
+        self.deltas = defaultdict(int)
+        self.warehouses = {}
+        self.added = set()
+        product_ids = [product.pk for product in self.fields['product'].widget.cache.values()]
+        stockard_ids = [stockard.pk for stockard in self.fields['stockard'].widget.cache.values()]
+        # Locked until the import commits, so movements posted meanwhile
+        # wait instead of being overwritten by the quantities read here
+        stocks = Stock.objects.select_for_update().filter(
+            product_id__in=product_ids, stockard_id__in=stockard_ids
+        ).order_by('pk')
+        instances = {self.instance_key(stock): stock for stock in stocks}
+        self.quantities = {key: stock.quantity for key, stock in instances.items()}
+        return instances
+
+    def row_key(self, row):
+        return self.fields['product'].clean(row).pk, self.fields['stockard'].clean(row).pk
+
+    def instance_key(self, instance):
+        return instance.product_id, instance.stockard_id
+
+    def before_save_instance(self, instance, row, **kwargs):
+        super().before_save_instance(instance, row, **kwargs)
+        key = self.instance_key(instance)
+        if key not in self.quantities:
+            self.added.add(instance.product_id)
+        self.deltas[key] += instance.quantity - self.quantities.get(key, 0)
+        self.quantities[key] = instance.quantity
+        self.warehouses[instance.stockard_id] = instance.stockard.warehouse_id
+
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        if not self.writes(kwargs):
+            return
+        # Runs in the import transaction, which is rolled back on errors
+        deltas = {key: delta for key, delta in self.deltas.items() if delta}
+        update_summaries(deltas, self.warehouses)
+        user = kwargs.get('user')
+        record_adjustments(
+            deltas, self.warehouses, notes=_('Stock import'),
+            user=user if getattr(user, 'is_authenticated', False) else None
+        )
+        # New rows are bulk inserted without signals
+        for product_id in self.added:
+            invalidate_product(product_id)
+
+
+class StockMovementResource(ChunkedResourceMixin, resources.ModelResource):
+    """
+    Movement headers keyed by ``reference_number``. Rows without one get a
+    generated reference; existing movements only have their notes updated,
+    since their type and warehouses decided how the items were posted.
+    """
+    from_warehouse = fields.Field('from_warehouse', 'from_warehouse', CachedForeignKeyWidget(Warehouse, 'name'))
+    to_warehouse = fields.Field('to_warehouse', 'to_warehouse', CachedForeignKeyWidget(Warehouse, 'name'))
+
+    class Meta:
+        model = StockMovement
+        fields = ('reference_number', 'movement_type', 'from_warehouse', 'to_warehouse', 'notes', 'created_at')
+        import_id_fields = ('reference_number',)
+        readonly_fields = ('created_at',)
+        use_bulk = True
+        batch_size = 1000
+        skip_diff = True
+
+    def get_queryset(self):
+        return StockMovement.objects.select_related('from_warehouse', 'to_warehouse')
+
+    def prepare_chunk(self, dataset, create):
+        warehouses = column(dataset, 'from_warehouse') | column(dataset, 'to_warehouse')
+        self.fields['from_warehouse'].widget.prime(warehouses)
+        self.fields['to_warehouse'].widget.cache = self.fields['from_warehouse'].widget.cache
+        movements = StockMovement.objects.filter(reference_number__in=column(dataset, 'reference_number'))
+        return {movement.reference_number: movement for movement in movements}
+
+    def row_key(self, row):
+        return str(row['reference_number']).strip()
+
+    def instance_key(self, instance):
+        return instance.reference_number
+
+    def before_save_instance(self, instance, row, **kwargs):
+        super().before_save_instance(instance, row, **kwargs)
+        if instance.movement_type not in dict(StockMovement.MOVEMENT_TYPES):
+            raise ValidationError({'movement_type': _('Unknown movement type')})
+        if instance.movement_type in ('OUT', 'TRANSFER') and not instance.from_warehouse_id:
+            raise ValidationError({'from_warehouse': _('From Warehouse is required for this movement type')})
+        if instance.movement_type in ('IN', 'TRANSFER') and not instance.to_warehouse_id:
+            raise ValidationError({'to_warehouse': _('To Warehouse is required for this movement type')})
+        if instance.from_warehouse_id and instance.from_warehouse_id == instance.to_warehouse_id:
+            raise ValidationError(_('From Warehouse and To Warehouse must be different'))
+        if not instance.reference_number:
+            instance.reference_number = generate_reference_number()
+        if instance.pk is None and instance.created_by_id is None:
+            user = kwargs.get('user')
+            instance.created_by = user if getattr(user, 'is_authenticated', False) else None
+
+    def get_bulk_update_fields(self):
+        return ['notes']
+
+
+class StockMovementItemResource(ChunkedResourceMixin, resources.ModelResource):
+    """
+    Movement lines with ``reference_number``, ``product`` and ``quantity``
+    columns. Lines are always added, and each chunk posts them in file order
+    with ``post_movements``, so stock is checked and updated in bulk.
+    """
+    movement = fields.Field(
+        'movement', 'reference_number', CachedForeignKeyWidget(StockMovement, 'reference_number')
+    )
+    product = fields.Field('product', 'product', CachedForeignKeyWidget(Product, 'name'))
+
+    class Meta:
+        model = StockMovementItem
+        fields = ('movement', 'product', 'quantity')
+        import_id_fields = ('movement', 'product')
+        force_init_instance = True
+        # save_instance only collects the lines; this drops the per-row savepoints
+        use_bulk = True
+        skip_diff = True
+
+    def get_queryset(self):
+        return StockMovementItem.objects.select_related('movement', 'product')
+
+    def prepare_chunk(self, dataset, create):
+        self.fields['movement'].widget.prime(column(dataset, 'reference_number'))
+        self.fields['product'].widget.prime(column(dataset, 'product'))
+        self.lines = defaultdict(list)
+        return {}
+
+    def save_instance(self, instance, is_create, row, **kwargs):
+        self.before_save_instance(instance, row, **kwargs)
+        self.lines[instance.movement].append(instance)
+        self.after_save_instance(instance, row, **kwargs)
+
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        if not self.writes(kwargs) or result.has_errors():
+            return
+        post_movements(self.lines.items())
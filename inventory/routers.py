@@ -0,0 +1,88 @@
+"""
+Read-replica routing for the inventory app.
+
+Reads made under ``replica_reads()`` (admin changelists, exports and the
+stock API) go to the ``INVENTORY_REPLICA_DATABASE`` alias; every write,
+every read inside a transaction and every other read stays on the
+primary. A session that wrote is pinned to the primary for a while, see
+``ReplicaPinningMiddleware``.
+"""
+
+import contextvars
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_replica_reads = contextvars.ContextVar('inventory_replica_reads', default=False)
+_request_state = contextvars.ContextVar('inventory_request_state', default=None)
+
+
+class RequestState:
+    """
+    What the router knows of the current request: whether its session is
+    pinned to the primary and whether it has written
+    """
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def replica_alias():
+    alias = getattr(settings, 'INVENTORY_REPLICA_DATABASE', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+@contextmanager
+def replica_reads():
+    """
+    Let the inventory reads made in the block go to the replica
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def request_state(pinned=False):
+    state = RequestState(pinned)
+    token = _request_state.set(state)
+    try:
+        yield state
+    finally:
+        _request_state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Route the inventory reads allowed on the replica there, unless the
+    session is pinned, the request already wrote or the primary is in a
+    transaction, whose reads must see its own writes and locks
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'inventory' or not _replica_reads.get():
+            return None
+        alias = replica_alias()
+        state = _request_state.get()
+        if alias is None or (state is not None and (state.pinned or state.wrote)):
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and model._meta.app_label == 'inventory':
+            state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,144 @@
+from functools import reduce
+from operator import or_
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+# Text fields each search backend indexes, per model
+SEARCH_INDEXES = {
+    'inventory.Warehouse': ('name', 'description'),
+    'inventory.Stockard': ('name', 'description'),
+    'inventory.Product': ('name', 'description'),
+    'inventory.StockMovement': ('reference_number', 'notes'),
+}
+
+
+def indexed_fields(model):
+    return SEARCH_INDEXES.get(model._meta.label, ())
+
+
+class SearchBackend:
+    """
+    Match search words against the text fields of one model.
+
+    ``match`` returns a subquery of primary keys, so callers can filter on
+    it with ``__in`` instead of joining. The base backend uses ``icontains``
+    and needs nothing installed.
+    """
+    vendor = None
+
+    def install(self, schema_editor, apps=global_apps):
+        pass
+
+    def uninstall(self, schema_editor, apps=global_apps):
+        pass
+
+    def match(self, model, fields, word):
+        condition = reduce(or_, (Q(**{f'{field}__icontains': word}) for field in fields))
+        return model._default_manager.filter(condition).values('pk')
+
+
+class TrigramSearchBackend(SearchBackend):
+    """
+    PostgreSQL: ``icontains`` served by pg_trgm GIN indexes on ``UPPER(field)``,
+    the expression Django compares against
+    """
+    vendor = 'postgresql'
+
+    def index_name(self, model, field):
+        return f'{model._meta.db_table}_{field}_trgm'
+
+    def install(self, schema_editor, apps=global_apps):
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for label, fields in SEARCH_INDEXES.items():
+            model = apps.get_model(label)
+            table = schema_editor.quote_name(model._meta.db_table)
+            for field in fields:
+                column = schema_editor.quote_name(model._meta.get_field(field).column)
+                schema_editor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {schema_editor.quote_name(self.index_name(model, field))} '
+                    f'ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)'
+                )
+
+    def uninstall(self, schema_editor, apps=global_apps):
+        for label, fields in SEARCH_INDEXES.items():
+            model = apps.get_model(label)
+            for field in fields:
+                schema_editor.execute(f'DROP INDEX IF EXISTS {schema_editor.quote_name(self.index_name(model, field))}')
+
+
+class FTS5SearchBackend(SearchBackend):
+    """
+    SQLite: an external-content FTS5 table per model with the trigram
+    tokenizer, which matches substrings like ``icontains`` does. Triggers
+    keep it in sync with every insert, update and delete, including bulk
+    and raw SQL writes. Words shorter than a trigram fall back to
+    ``icontains``.
+
+    SQLite drops a table's triggers when a migration rebuilds it, so such
+    migrations must call ``install`` again; it is safe to repeat.
+    """
+    vendor = 'sqlite'
+    min_length = 3
+
+    def fts_table(self, model):
+        return f'{model._meta.db_table}_fts'
+
+    def install(self, schema_editor, apps=global_apps):
+        for label, fields in SEARCH_INDEXES.items():
+            model = apps.get_model(label)
+            table = model._meta.db_table
+            fts = self.fts_table(model)
+            pk = model._meta.pk.column
+            columns = [model._meta.get_field(field).column for field in fields]
+            names = ', '.join(columns)
+            new = ', '.join(f'new.{column}' for column in columns)
+            old = ', '.join(f'old.{column}' for column in columns)
+            delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.{pk}, {old});"
+            insert = f'INSERT INTO {fts}(rowid, {names}) VALUES (new.{pk}, {new});'
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table}', "
+                f"content_rowid='{pk}', tokenize='trigram')"
+            )
+            schema_editor.execute(f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END')
+            schema_editor.execute(f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN {delete} END')
+            schema_editor.execute(f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE ON {table} BEGIN {delete} {insert} END')
+            schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def uninstall(self, schema_editor, apps=global_apps):
+        for label in SEARCH_INDEXES:
+            fts = self.fts_table(apps.get_model(label))
+            for action in ('insert', 'delete', 'update'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts}_{action}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+    def match(self, model, fields, word):
+        if len(word) < self.min_length or not set(fields) <= set(indexed_fields(model)):
+            return super().match(model, fields, word)
+        columns = ' '.join(model._meta.get_field(field).column for field in fields)
+        phrase = word.replace('"', '""')
+        fts = self.fts_table(model)
+        return RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [f'{{{columns}}} : "{phrase}"'])
+
+
+BACKENDS = (TrigramSearchBackend, FTS5SearchBackend)
+
+
+def get_search_backend(using='default'):
+    """
+    Return the search backend for a database alias.
+
+    ``INVENTORY_SEARCH_BACKEND`` may name a backend class to use instead of
+    the one matching the database vendor.
+    """
+    path = getattr(settings, 'INVENTORY_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    vendor = connections[using].vendor
+    for backend in BACKENDS:
+        if backend.vendor == vendor:
+            return backend()
+    return SearchBackend()
@@ -0,0 +1,37 @@
+from .stock import (
+    InsufficientStock,
+    add_stock,
+    remove_stock,
+    remove_stock_bulk,
+    apply_stock_deltas,
+    apply_movement_item
+)
+from .outbox import enqueue, process_outbox
+from .posting import (
+    apost_movement, asave_movement_items, post_movement, post_movements, save_movement_items, unpost_movements
+)
+from .reservations import commit_reservations, expire_reservations, release_reservations, reserve
+from .snapshot import stock_as_of, take_snapshot
+
+__all__ = [
+    'InsufficientStock',
+    'add_stock',
+    'remove_stock',
+    'remove_stock_bulk',
+    'apply_stock_deltas',
+    'apply_movement_item',
+    'post_movement',
+    'apost_movement',
+    'post_movements',
+    'save_movement_items',
+    'asave_movement_items',
+    'unpost_movements',
+    'reserve',
+    'commit_reservations',
+    'release_reservations',
+    'expire_reservations',
+    'stock_as_of',
+    'take_snapshot',
+    'enqueue',
+    'process_outbox'
+]
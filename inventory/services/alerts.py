@@ -0,0 +1,120 @@
+import logging
+from django.conf import settings
+from django.core.mail import mail_admins
+from django.db import router, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from ..models import StockAlert, StockSummary
+
+logger = logging.getLogger(__name__)
+
+
+def crossing(old, new, reorder_point):
+    """
+    The alert kind for a quantity going from ``old`` to ``new``, or None
+    when it stays on the same side of ``reorder_point``
+    """
+    if reorder_point is None:
+        return None
+    if old >= reorder_point > new:
+        return 'LOW'
+    if new >= reorder_point > old:
+        return 'RECOVERED'
+    return None
+
+
+def record_crossings(changes):
+    """
+    Queue an alert for each ``(product_id, warehouse_id, old, new,
+    reorder_point)`` change that crosses its reorder point. Called by the
+    stock engine with the quantities before and after each change, so
+    shortages are found as they happen instead of by scanning.
+    """
+    alerts = [
+        StockAlert(
+            product_id=product_id, warehouse_id=warehouse_id, kind=kind, quantity=new, reorder_point=reorder_point
+        )
+        for product_id, warehouse_id, old, new, reorder_point in changes
+        if (kind := crossing(old, new, reorder_point))
+    ]
+    if alerts:
+        StockAlert.objects.bulk_create(alerts)
+    return alerts
+
+
+def set_reorder_point(product, warehouse, reorder_point):
+    """
+    Set the reorder point of ``product`` in ``warehouse``, or clear it with
+    None. A product already below its new reorder point is alerted at once,
+    and one back above it once the old one is cleared.
+    """
+    product_id = getattr(product, 'pk', product)
+    warehouse_id = getattr(warehouse, 'pk', warehouse)
+    with transaction.atomic(using=router.db_for_write(StockSummary)):
+        summary, _created = StockSummary.objects.select_for_update().get_or_create(
+            product_id=product_id, warehouse_id=warehouse_id
+        )
+        was_short, previous = summary.is_short, summary.reorder_point
+        StockSummary.objects.filter(pk=summary.pk).update(reorder_point=reorder_point)
+        summary.reorder_point = reorder_point
+        if summary.is_short != was_short:
+            StockAlert.objects.create(
+                product_id=product_id,
+                warehouse_id=warehouse_id,
+                kind='LOW' if summary.is_short else 'RECOVERED',
+                quantity=summary.quantity,
+                reorder_point=previous if reorder_point is None else reorder_point
+            )
+    return summary
+
+
+def open_shortages(warehouse=None):
+    """
+    The stock summaries below their reorder point, read through the
+    partial index that holds only those
+    """
+    queryset = StockSummary.objects.filter(quantity__lt=F('reorder_point'))
+    if warehouse is not None:
+        queryset = queryset.filter(warehouse=warehouse)
+    return queryset
+
+
+def mail_digest(alerts):
+    """
+    Mail the latest alert of each product and warehouse to ``ADMINS``
+    """
+    short = [alert for alert in alerts if alert.kind == 'LOW']
+    lines = [
+        f'{alert.get_kind_display()}: {alert.product.name} in {alert.warehouse.name}, '
+        f'{alert.quantity} of {alert.reorder_point}'
+        for alert in alerts
+    ]
+    logger.info('Stock alert digest: %d low, %d recovered', len(short), len(alerts) - len(short))
+    mail_admins(f'{len(short)} products below their reorder point', '\n'.join(lines))
+
+
+def send_digest(batch_size=10_000):
+    """
+    Hand the unsent alerts to ``INVENTORY_ALERT_DIGEST`` (a dotted path,
+    ``mail_digest`` by default) in one digest and mark them sent. Only the
+    latest alert of each product and warehouse is included, so a quantity
+    going back and forth is reported as where it ended. Returns how many
+    alerts were sent.
+    """
+    digest = import_string(getattr(settings, 'INVENTORY_ALERT_DIGEST', 'inventory.services.alerts.mail_digest'))
+    sent = 0
+    while True:
+        with transaction.atomic(using=router.db_for_write(StockAlert)):
+            alerts = list(
+                StockAlert.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+                    sent_at__isnull=True
+                ).select_related('product', 'warehouse').order_by('pk')[:batch_size]
+            )
+            latest = {(alert.product_id, alert.warehouse_id): alert for alert in alerts}
+            if latest:
+                digest(sorted(latest.values(), key=lambda alert: (alert.warehouse.name, alert.product.name)))
+                StockAlert.objects.filter(pk__in=[alert.pk for alert in alerts]).update(sent_at=timezone.now())
+        sent += len(alerts)
+        if len(alerts) < batch_size:
+            return sent
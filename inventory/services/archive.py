@@ -0,0 +1,114 @@
+import calendar
+from collections import defaultdict
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from ..models import (
+    ArchivedStockBalance, ArchivedStockMovement, ArchivedStockMovementItem, StockMovement, StockMovementItem
+)
+from .sql import batch_size as max_batch_size, increment
+
+
+def months_ago(months, now=None):
+    """
+    The same day and time ``months`` calendar months before ``now``,
+    clamped to the end of shorter months
+    """
+    now = now or timezone.now()
+    year, month = divmod(now.year * 12 + now.month - 1 - months, 12)
+    day = min(now.day, calendar.monthrange(year, month + 1)[1])
+    return now.replace(year=year, month=month + 1, day=day)
+
+
+def archive_horizon():
+    """
+    Movements created before this are archived, by default
+    ``INVENTORY_ARCHIVE_AFTER_MONTHS`` (12) months back
+    """
+    return months_ago(getattr(settings, 'INVENTORY_ARCHIVE_AFTER_MONTHS', 12))
+
+
+def closed_movements(before):
+    """
+    The movements created before ``before`` with no outbox work left, which
+    nothing will post to again
+    """
+    return StockMovement.objects.filter(created_at__lt=before).exclude(
+        outbox_events__status__in=['PENDING', 'FAILED']
+    )
+
+
+def copy_rows(source, target, key, ids, connection):
+    """
+    Copy the ``source`` rows whose ``key`` column is in ``ids`` into the
+    columns ``target`` shares with it, inside the database. Columns only
+    ``target`` has are timestamps set to now.
+    """
+    qn = connection.ops.quote_name
+    shared = {field.column for field in source._meta.concrete_fields}
+    columns = [field.column for field in target._meta.concrete_fields if field.column in shared]
+    stamped = [field.column for field in target._meta.concrete_fields if field.column not in shared]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {qn(target._meta.db_table)} ({", ".join(qn(column) for column in columns + stamped)}) '
+            f'SELECT {", ".join([qn(column) for column in columns] + ["%s"] * len(stamped))} '
+            f'FROM {qn(source._meta.db_table)} WHERE {qn(key)} IN ({", ".join(["%s"] * len(ids))})',
+            [timezone.now()] * len(stamped) + list(ids)
+        )
+
+
+def balance_deltas(ids):
+    """
+    What the items of movements ``ids`` added to each stock row, keyed by
+    ``(product_id, stockard_id)``
+    """
+    items = StockMovementItem.objects.filter(movement_id__in=ids).order_by()
+    deltas = defaultdict(int)
+    for side, sign in (('to_stockard', 1), ('from_stockard', -1)):
+        rows = items.filter(**{f'{side}__isnull': False}).values('product_id', f'{side}_id').annotate(
+            quantity=Sum('quantity')
+        )
+        for row in rows:
+            deltas[row['product_id'], row[f'{side}_id']] += sign * row['quantity']
+    return deltas
+
+
+def archive_movements(before=None, batch_size=1000, max_batches=None):
+    """
+    Move the closed movements created before ``before`` (the
+    ``archive_horizon()`` by default), oldest first, with their items into
+    the archive tables and return how many were moved.
+
+    Each batch is copied, added to ``ArchivedStockBalance`` and deleted
+    from the hot tables in its own transaction, so an interrupted run
+    leaves whole batches behind and simply carries on when run again, and
+    ``max_batches`` bounds one run. The hot tables, and their indexes, only
+    grow with the movements of the last months. Links from reservations
+    and finished outbox events to the moved movements are dropped.
+    """
+    before = before or archive_horizon()
+    using = router.db_for_write(StockMovement)
+    connection = connections[using]
+    batch_size = min(batch_size, max_batch_size(connection, 1))
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic(using=using):
+            ids = list(
+                closed_movements(before).select_for_update(skip_locked=True).order_by(
+                    'created_at', 'pk'
+                ).values_list('pk', flat=True)[:batch_size]
+            )
+            if ids:
+                deltas = balance_deltas(ids)
+                copy_rows(StockMovement, ArchivedStockMovement, 'id', ids, connection)
+                copy_rows(StockMovementItem, ArchivedStockMovementItem, 'movement_id', ids, connection)
+                increment(ArchivedStockBalance, ('product', 'stockard'), [
+                    (product_id, stockard_id, delta) for (product_id, stockard_id), delta in deltas.items() if delta
+                ])
+                StockMovement.objects.filter(pk__in=ids).delete()
+        archived += len(ids)
+        batches += 1
+        if len(ids) < batch_size:
+            break
+    return archived
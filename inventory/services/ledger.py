@@ -0,0 +1,171 @@
+from collections import defaultdict
+from django.db import connections, router, transaction
+from ..models import ArchivedStockBalance, Stock, StockMovement, StockMovementItem, Stockard
+from .sql import increment
+from .summary import update_summaries
+
+
+def find_drift(warehouse_id=None, stockards=None):
+    """
+    Return ``(product_id, stockard_id, expected, actual)`` for every stock
+    row whose quantity differs from the movement ledger.
+
+    The expected quantities and the ``Stock`` rows are diffed in one
+    grouped statement, so only drifted rows leave the database. Archived
+    movements count through their ``ArchivedStockBalance`` rows. A stock
+    row with no movements is expected to be empty, and ledger rows missing
+    from ``Stock`` come back with an ``actual`` of 0. ``warehouse_id`` and
+    a ``(low, high)`` stockard id range in ``stockards`` limit the pass to
+    part of the tables, read through the stockard-first indexes.
+    """
+    connection = connections[router.db_for_read(Stock)]
+    qn = connection.ops.quote_name
+    items = qn(StockMovementItem._meta.db_table)
+    stocks = qn(Stock._meta.db_table)
+    balances = qn(ArchivedStockBalance._meta.db_table)
+    stockard_table = qn(Stockard._meta.db_table)
+    item_opts, stock_opts = StockMovementItem._meta, Stock._meta
+    product = qn(item_opts.get_field('product').column)
+    quantity = qn(item_opts.get_field('quantity').column)
+    to_stockard = qn(item_opts.get_field('to_stockard').column)
+    from_stockard = qn(item_opts.get_field('from_stockard').column)
+    stock_product = qn(stock_opts.get_field('product').column)
+    stock_stockard = qn(stock_opts.get_field('stockard').column)
+    stock_quantity = qn(stock_opts.get_field('quantity').column)
+    balance_opts = ArchivedStockBalance._meta
+    balance_product = qn(balance_opts.get_field('product').column)
+    balance_stockard = qn(balance_opts.get_field('stockard').column)
+    balance_quantity = qn(balance_opts.get_field('quantity').column)
+    stockard_pk = qn(Stockard._meta.pk.column)
+    stockard_warehouse = qn(Stockard._meta.get_field('warehouse').column)
+
+    def where(stockard_column):
+        clauses = [f'{stockard_column} IS NOT NULL']
+        params = []
+        if warehouse_id is not None:
+            clauses.append(
+                f'{stockard_column} IN (SELECT {stockard_pk} FROM {stockard_table} WHERE {stockard_warehouse} = %s)'
+            )
+            params.append(warehouse_id)
+        if stockards is not None:
+            clauses.append(f'{stockard_column} >= %s AND {stockard_column} < %s')
+            params.extend(stockards)
+        return ' AND '.join(clauses), params
+
+    inbound, inbound_params = where(to_stockard)
+    outbound, outbound_params = where(from_stockard)
+    archived, archived_params = where(balance_stockard)
+    current, current_params = where(stock_stockard)
+    sql = (
+        f'SELECT product_id, stockard_id, SUM(expected), SUM(actual) FROM ('
+        f'SELECT {product} AS product_id, {to_stockard} AS stockard_id, '
+        f'{quantity} AS expected, 0 AS actual FROM {items} WHERE {inbound} '
+        f'UNION ALL '
+        f'SELECT {product}, {from_stockard}, -{quantity}, 0 FROM {items} WHERE {outbound} '
+        f'UNION ALL '
+        f'SELECT {balance_product}, {balance_stockard}, {balance_quantity}, 0 FROM {balances} WHERE {archived} '
+        f'UNION ALL '
+        f'SELECT {stock_product}, {stock_stockard}, 0, {stock_quantity} FROM {stocks} WHERE {current}'
+        f') ledger GROUP BY product_id, stockard_id HAVING SUM(expected) <> SUM(actual)'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, inbound_params + outbound_params + archived_params + current_params)
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def repair_drift(drift):
+    """
+    Bring the drifted stock rows from ``find_drift`` back in line with the
+    ledger, and the summaries with them.
+
+    The difference is added rather than the expected quantity set, so
+    movements posted since the check are kept.
+    """
+    deltas = {(product_id, stockard_id): expected - actual for product_id, stockard_id, expected, actual in drift}
+    with transaction.atomic(using=router.db_for_write(Stock)):
+        increment(Stock, ('product', 'stockard'), [
+            (product_id, stockard_id, delta) for (product_id, stockard_id), delta in deltas.items()
+        ])
+        update_summaries(deltas)
+
+
+def open_adjustments(using, notes, user):
+    """
+    The ``{(warehouse_id, movement_type): movement}`` adjustments written
+    earlier in the current transaction with the same notes and user, which
+    further adjustments add their lines to. Outside a transaction every
+    call writes its own movements.
+    """
+    connection = connections[using]
+    if not connection.in_atomic_block:
+        return {}
+    pending = getattr(connection, 'stock_adjustments', None)
+    if pending is None or not connection.run_on_commit:
+        # Nothing left from committed or rolled back transactions
+        pending = connection.stock_adjustments = {}
+    key = (tuple(connection.savepoint_ids), str(notes), getattr(user, 'pk', None))
+    entry = pending.get(key)
+    # Rolling back the transaction or savepoint drops the callback together
+    # with the movements written in it
+    if entry is not None and any(callback[1] is entry[1] for callback in connection.run_on_commit):
+        return entry[0]
+
+    movements = {}
+
+    def close():
+        if pending.get(key, (None, None))[1] is close:
+            del pending[key]
+    pending[key] = (movements, close)
+    transaction.on_commit(close, using=using)
+    return movements
+
+
+def record_adjustments(deltas, warehouses=None, notes='', user=None):
+    """
+    Write ``{(product_id, stockard_id): delta}`` stock changes made outside
+    movements, such as imports and direct edits of stock rows, to the
+    ledger and return the movements written to.
+
+    Each warehouse gets an inbound movement for the increases and an
+    outbound one for the decreases, with a line per stock row and the
+    stockard already set. Later adjustments in the same transaction with
+    the same notes and user add their lines to those movements, so an
+    admin save or an import leaves one pair per warehouse however many
+    rows it changed. The lines are inserted as applied, so the stock is
+    left as it is, ``find_drift`` agrees with it and ``repair_drift``
+    never reverts the change. ``warehouses`` maps stockard ids to their
+    warehouse ids where the caller knows them.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return []
+    warehouses = dict(warehouses or {})
+    missing = {stockard_id for _product_id, stockard_id in deltas} - warehouses.keys()
+    if missing:
+        warehouses.update(Stockard.objects.filter(pk__in=missing).values_list('pk', 'warehouse_id'))
+
+    lines = defaultdict(list)
+    for (product_id, stockard_id), delta in deltas.items():
+        if delta > 0:
+            item = StockMovementItem(product_id=product_id, to_stockard_id=stockard_id, quantity=delta)
+            lines[warehouses[stockard_id], 'IN'].append(item)
+        else:
+            item = StockMovementItem(product_id=product_id, from_stockard_id=stockard_id, quantity=-delta)
+            lines[warehouses[stockard_id], 'OUT'].append(item)
+    using = router.db_for_write(StockMovement)
+    # Looked up before the savepoint below, which would start a new batch
+    opened = open_adjustments(using, notes, user)
+    movements = []
+    with transaction.atomic(using=using):
+        for (warehouse_id, movement_type), items in lines.items():
+            movement = opened.get((warehouse_id, movement_type))
+            if movement is None:
+                side = 'to_warehouse_id' if movement_type == 'IN' else 'from_warehouse_id'
+                movement = opened[warehouse_id, movement_type] = StockMovement.objects.create(
+                    movement_type=movement_type, notes=str(notes), created_by=user, **{side: warehouse_id}
+                )
+            for item in items:
+                item.movement = movement
+            StockMovementItem.objects.bulk_create(items)
+            movements.append(movement)
+    return movements
@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+CACHE_PREFIX = 'inventory:stockard'
+
+
+class LookupCache:
+    """
+    Read-through cache for the stockard lookups of the stock engine.
+
+    A process-local LRU with a short TTL sits in front of a Django cache
+    backend shared between processes. Entries are keyed on
+    ``(product_id, warehouse_id, role)`` plus a generation per product and
+    per warehouse; the signals bump a generation to drop every entry that
+    mentions the object. Entries are only written once the transaction
+    that read them commits, so a rollback never leaves a stockard id
+    behind that does not exist.
+    """
+
+    def __init__(self, alias=None, timeout=None, local_ttl=None, max_size=None):
+        self.alias = alias or getattr(settings, 'INVENTORY_LOOKUP_CACHE', 'default')
+        self.timeout = timeout or getattr(settings, 'INVENTORY_LOOKUP_CACHE_TIMEOUT', 300)
+        self.local_ttl = local_ttl or getattr(settings, 'INVENTORY_LOOKUP_LOCAL_TTL', 30)
+        self.max_size = max_size or getattr(settings, 'INVENTORY_LOOKUP_LOCAL_SIZE', 10_000)
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+        self.local_hits = self.shared_hits = self.misses = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'local_size': len(self.local),
+            }
+
+    def reset_stats(self):
+        with self.lock:
+            self.local_hits = self.shared_hits = self.misses = 0
+
+    def clear_local(self):
+        with self.lock:
+            self.local.clear()
+
+    def _get_local(self, keys):
+        found = {}
+        now = time.monotonic()
+        with self.lock:
+            for key in keys:
+                entry = self.local.get(key)
+                if entry is None:
+                    continue
+                value, expires = entry
+                if expires < now:
+                    del self.local[key]
+                    continue
+                self.local.move_to_end(key)
+                found[key] = value
+        return found
+
+    def _set_local(self, mapping):
+        expires = time.monotonic() + self.local_ttl
+        with self.lock:
+            for key, value in mapping.items():
+                self.local[key] = (value, expires)
+                self.local.move_to_end(key)
+            while len(self.local) > self.max_size:
+                self.local.popitem(last=False)
+
+    def _get(self, keys, counted=True):
+        found = self._get_local(keys)
+        missing = [key for key in keys if key not in found]
+        shared = self.shared.get_many(missing) if missing else {}
+        if shared:
+            self._set_local(shared)
+        found.update(shared)
+        if counted:
+            with self.lock:
+                self.local_hits += len(keys) - len(missing)
+                self.shared_hits += len(shared)
+                self.misses += len(missing) - len(shared)
+        return found
+
+    # Generations
+
+    def generation_key(self, kind, pk):
+        return f'{CACHE_PREFIX}:{kind}:{pk}:generation'
+
+    def generations(self, kind, pks):
+        keys = {pk: self.generation_key(kind, pk) for pk in pks}
+        found = self._get(list(keys.values()), counted=False)
+        missing = [key for key in keys.values() if key not in found]
+        if missing:
+            # A fresh value rather than a counter restarting at 0, so an
+            # evicted generation never brings old entries back
+            for key in missing:
+                self.shared.add(key, time.time_ns(), None)
+            created = self.shared.get_many(missing)
+            self._set_local(created)
+            found.update(created)
+        return {pk: found.get(key, 0) for pk, key in keys.items()}
+
+    def bump(self, kind, pk):
+        """
+        Drop every entry mentioning product or warehouse ``pk``
+        """
+        key = self.generation_key(kind, pk)
+        value = time.time_ns()
+        self.shared.set(key, value, None)
+        self._set_local({key: value})
+
+    # Entries
+
+    def keys(self, pairs, role):
+        """
+        Map ``(product_id, warehouse_id)`` pairs to their entry keys
+        """
+        products = self.generations('product', {product_id for product_id, _warehouse_id in pairs})
+        warehouses = self.generations('warehouse', {warehouse_id for _product_id, warehouse_id in pairs})
+        return {
+            (product_id, warehouse_id): (
+                f'{CACHE_PREFIX}:{role}:{product_id}.{products[product_id]}:'
+                f'{warehouse_id}.{warehouses[warehouse_id]}'
+            )
+            for product_id, warehouse_id in pairs
+        }
+
+    def get_many(self, pairs, role, counted=True):
+        """
+        Return ``({pair: value}, {pair: key})`` for the cached ``pairs``
+        """
+        keys = self.keys(pairs, role)
+        found = self._get(list(keys.values()), counted)
+        return {pair: found[key] for pair, key in keys.items() if key in found}, keys
+
+    def set_many(self, mapping, keys, using=None):
+        """
+        Store ``{pair: value}`` under the keys ``get_many`` handed out once
+        the current transaction commits
+        """
+        values = {keys[pair]: value for pair, value in mapping.items()}
+        if not values:
+            return
+
+        def store():
+            self._set_local(values)
+            self.shared.set_many(values, self.timeout)
+        transaction.on_commit(store, using=using)
+
+
+stockard_cache = LookupCache()
+
+
+def invalidate(kind, pk, using=None):
+    # Again on commit, as another process may have re-read the old rows
+    # before this transaction's changes were visible
+    stockard_cache.bump(kind, pk)
+    transaction.on_commit(lambda: stockard_cache.bump(kind, pk), using=using)
+
+
+def invalidate_product(product_id, using=None):
+    invalidate('product', product_id, using)
+
+
+def invalidate_warehouse(warehouse_id, using=None):
+    invalidate('warehouse', warehouse_id, using)
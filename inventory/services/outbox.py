@@ -0,0 +1,238 @@
+import datetime
+import time
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from ..models import OutboxEvent, StockMovementItem, Warehouse
+from .posting import post_movements
+
+CHANNEL = 'inventory_outbox'
+
+HANDLERS = {
+    'movement.post': 'inventory.services.outbox.post_queued_lines',
+}
+
+
+def get_handler(kind):
+    """
+    Return the handler of an event kind, from ``INVENTORY_OUTBOX_HANDLERS``
+    (``{kind: dotted path}``) over the built-in ones, or None
+    """
+    handlers = {**HANDLERS, **getattr(settings, 'INVENTORY_OUTBOX_HANDLERS', {})}
+    return import_string(handlers[kind]) if handlers.get(kind) else None
+
+
+def enqueue(kind, movement=None, payload=None):
+    """
+    Queue an event in the current transaction, so it exists if and only if
+    the transaction commits. Idle PostgreSQL workers are woken on commit.
+    """
+    event = OutboxEvent.objects.create(kind=kind, movement=movement, payload=payload or {})
+    connection = connections[router.db_for_write(OutboxEvent)]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'NOTIFY {CHANNEL}')
+    return event
+
+
+def queued_posts(movement):
+    """
+    The pending posts of other movements through the warehouses
+    ``movement`` touches
+    """
+    warehouses = {movement.from_warehouse_id, movement.to_warehouse_id} - {None}
+    return OutboxEvent.objects.filter(
+        Q(movement__from_warehouse__in=warehouses) | Q(movement__to_warehouse__in=warehouses),
+        kind='movement.post',
+        status='PENDING'
+    ).exclude(movement=movement)
+
+
+def is_queued(movement):
+    """
+    Whether lines of ``movement`` are waiting to be posted
+    """
+    if getattr(settings, 'INVENTORY_DEFERRED_POSTING_LINES', None) is None:
+        return False
+    return OutboxEvent.objects.filter(movement=movement, kind='movement.post', status='PENDING').exists()
+
+
+def should_defer(movement, items):
+    """
+    Whether new lines of ``movement`` are posted by the worker rather than
+    in the request: when there are at least
+    ``INVENTORY_DEFERRED_POSTING_LINES`` of them (off when unset), or when
+    posts through the same warehouses are already queued, which they must
+    not overtake
+    """
+    threshold = getattr(settings, 'INVENTORY_DEFERRED_POSTING_LINES', None)
+    if threshold is None:
+        return False
+    return len(items) >= threshold or queued_posts(movement).exists()
+
+
+def defer_post(movement, items):
+    """
+    Queue unsaved ``StockMovementItem`` instances of a saved ``movement``
+    for ``post_movement`` to post after commit
+    """
+    return enqueue('movement.post', movement, {'lines': [[item.product_id, item.quantity] for item in items]})
+
+
+def post_queued_lines(events):
+    post_movements([
+        (event.movement, [
+            StockMovementItem(product_id=product_id, quantity=quantity)
+            for product_id, quantity in event.payload['lines']
+        ])
+        for event in events
+    ])
+
+
+def event_warehouses(event):
+    if event.movement_id is None:
+        return set()
+    return {event.movement.from_warehouse_id, event.movement.to_warehouse_id} - {None}
+
+
+def claim(batch_size, window, now, using):
+    """
+    Lock the warehouses of the oldest pending events and return the ids of
+    up to ``batch_size`` events whose warehouses this worker now holds.
+
+    An event is passed over, and so is every later event sharing a
+    warehouse with it, when another worker holds one of its warehouses or
+    it waits for a retry, so no event of a warehouse runs ahead of an older
+    one. The locks are ``FOR NO KEY UPDATE SKIP LOCKED`` and last until the
+    caller's transaction ends; without row locks (SQLite) writers are
+    serialized by the database anyway.
+    """
+    connection = connections[using]
+    pending = OutboxEvent.objects.filter(status='PENDING').order_by('pk').values_list(
+        'pk', 'available_at', 'movement__from_warehouse_id', 'movement__to_warehouse_id'
+    )[:window]
+    claimed, blocked, taken = set(), set(), []
+    for pk, available_at, *warehouses in pending:
+        warehouses = set(warehouses) - {None}
+        if warehouses & blocked or available_at > now:
+            blocked |= warehouses
+            continue
+        wanted = warehouses - claimed
+        if wanted:
+            locked = set(
+                Warehouse.objects.select_for_update(
+                    skip_locked=True, no_key=connection.features.has_select_for_no_key_update
+                ).filter(pk__in=wanted).values_list('pk', flat=True)
+            )
+            claimed |= locked
+            if locked != wanted:
+                blocked |= warehouses
+                continue
+        taken.append(pk)
+        if len(taken) == batch_size:
+            break
+    return taken
+
+
+def run_events(events, using):
+    """
+    Hand ``events`` of one kind to their handler in a savepoint and return
+    the error, or None
+    """
+    handler = get_handler(events[0].kind)
+    if handler is None:
+        return LookupError(f'No handler for {events[0].kind!r} events')
+    try:
+        with transaction.atomic(using=using):
+            handler(events)
+    except Exception as exc:
+        return exc
+    return None
+
+
+def record_error(event, error, now):
+    event.attempts += 1
+    event.last_error = '; '.join(getattr(error, 'messages', None) or [f'{type(error).__name__}: {error}'])
+    permanent = isinstance(error, (ValidationError, ObjectDoesNotExist, LookupError))
+    if permanent or event.attempts >= getattr(settings, 'INVENTORY_OUTBOX_MAX_ATTEMPTS', 5):
+        event.status = 'FAILED'
+        event.processed_at = now
+    else:
+        event.available_at = now + datetime.timedelta(seconds=2 ** event.attempts)
+
+
+def process_outbox(batch_size=100, window=None, now=None):
+    """
+    Run one batch of pending events in a transaction and return how many
+    were processed or failed for good.
+
+    Consecutive events of the same kind are handed to their handler
+    together in one savepoint, and one by one when that fails. Validation
+    errors fail an event at once; other errors retry it with a back-off,
+    up to ``INVENTORY_OUTBOX_MAX_ATTEMPTS`` (5) attempts, and hold back the
+    later events of its warehouses meanwhile. Safe to run from many
+    processes at once.
+    """
+    now = now or timezone.now()
+    using = router.db_for_write(OutboxEvent)
+    with transaction.atomic(using=using):
+        taken = claim(batch_size, window or batch_size * 10, now, using)
+        # Read again under the locks: another worker may have got there first
+        events = list(
+            OutboxEvent.objects.filter(pk__in=taken, status='PENDING').select_related('movement').order_by('pk')
+        )
+        runs = []
+        for event in events:
+            if runs and runs[-1][0].kind == event.kind:
+                runs[-1].append(event)
+            else:
+                runs.append([event])
+
+        done, failed, held = [], [], set()
+        for run in runs:
+            run = [event for event in run if not event_warehouses(event) & held]
+            if len(run) > 1 and run_events(run, using) is None:
+                done += run
+                continue
+            for event in run:
+                if event_warehouses(event) & held:
+                    continue
+                error = run_events([event], using)
+                if error is None:
+                    done.append(event)
+                    continue
+                record_error(event, error, now)
+                failed.append(event)
+                if event.status == 'PENDING':
+                    held |= event_warehouses(event)
+
+        for event in done:
+            event.status = 'DONE'
+            event.attempts += 1
+            event.processed_at = now
+        OutboxEvent.objects.bulk_update(
+            done + failed, ['status', 'attempts', 'available_at', 'processed_at', 'last_error']
+        )
+    return len(done) + sum(event.status == 'FAILED' for event in failed)
+
+
+def wait_for_events(timeout):
+    """
+    Sleep until an event is queued or ``timeout`` seconds pass. PostgreSQL
+    with psycopg 3.2 or later is woken by ``enqueue``'s NOTIFY; elsewhere
+    this simply polls.
+    """
+    connection = connections[router.db_for_write(OutboxEvent)]
+    if connection.vendor == 'postgresql':
+        connection.ensure_connection()
+        notifies = getattr(connection.connection, 'notifies', None)
+        if callable(notifies):
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            for _notify in notifies(timeout=timeout, stop_after=1):
+                pass
+            return
+    time.sleep(timeout)
@@ -0,0 +1,130 @@
+from collections import namedtuple
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+from ..models import Stock
+from .stock import InsufficientStock
+
+Bin = namedtuple('Bin', ('stockard_id', 'name', 'quantity', 'created_at'))
+
+
+def load_bins(warehouse_id, product_ids):
+    """
+    Return ``{product_id: [Bin, ...]}`` with the stockards holding each
+    product in a warehouse, read with one query
+    """
+    bins = {}
+    rows = Stock.objects.filter(
+        product_id__in=product_ids,
+        stockard__warehouse_id=warehouse_id,
+        quantity__gt=0
+    ).order_by().values_list('product_id', 'stockard_id', 'stockard__name', 'quantity', 'created_at')
+    for product_id, *row in rows:
+        bins.setdefault(product_id, []).append(Bin(*row))
+    return bins
+
+
+class PickStrategy:
+    """
+    Decide which bins an outbound line draws from.
+
+    ``allocate`` takes the product's bins that still hold stock and the
+    quantity to pick, and returns ``(stockard_id, quantity)`` picks adding
+    up to it. The default fills bins in the order ``order`` returns.
+    """
+    def order(self, bins):
+        return bins
+
+    def allocate(self, bins, quantity):
+        if sum(bin.quantity for bin in bins) < quantity:
+            raise shortage(bins, quantity)
+        picks = []
+        for bin in self.order(bins):
+            take = min(bin.quantity, quantity)
+            picks.append((bin.stockard_id, take))
+            quantity -= take
+            if not quantity:
+                break
+        return picks
+
+
+class NameOrderStrategy(PickStrategy):
+    """
+    Bins in name order, as stock was always picked, spilling into the next
+    bin instead of failing
+    """
+    def order(self, bins):
+        return sorted(bins, key=lambda bin: (bin.name, bin.stockard_id))
+
+
+class LargestFirstStrategy(PickStrategy):
+    """
+    The fullest bins first, emptying few bins per pick
+    """
+    def order(self, bins):
+        return sorted(bins, key=lambda bin: (-bin.quantity, bin.name, bin.stockard_id))
+
+
+class FifoStrategy(PickStrategy):
+    """
+    The bins first stocked with the product first, so old stock leaves
+    before new
+    """
+    def order(self, bins):
+        return sorted(bins, key=lambda bin: (bin.created_at, bin.stockard_id))
+
+
+class FewestBinsStrategy(PickStrategy):
+    """
+    As few bins as possible, and of those the smallest that covers what is
+    left, so the fullest bins are kept for large picks
+    """
+    def allocate(self, bins, quantity):
+        if sum(bin.quantity for bin in bins) < quantity:
+            raise shortage(bins, quantity)
+        # The k largest bins hold the most any k bins can, so the fewest
+        # bins are the largest ones up to the last, which can be smaller
+        ordered = sorted(bins, key=lambda bin: (-bin.quantity, bin.name, bin.stockard_id))
+        picks = []
+        for index, bin in enumerate(ordered):
+            if bin.quantity >= quantity:
+                last = min(
+                    (candidate for candidate in ordered[index:] if candidate.quantity >= quantity),
+                    key=lambda candidate: (candidate.quantity, candidate.name, candidate.stockard_id)
+                )
+                picks.append((last.stockard_id, quantity))
+                return picks
+            picks.append((bin.stockard_id, bin.quantity))
+            quantity -= bin.quantity
+        return picks
+
+
+def shortage(bins, quantity):
+    if not bins:
+        return InsufficientStock(_('No stock available for this product in the selected warehouse'))
+    return InsufficientStock(_('Not enough stock available. Only {} units can be taken').format(
+        sum(bin.quantity for bin in bins)
+    ))
+
+
+STRATEGIES = {
+    'name': NameOrderStrategy,
+    'largest': LargestFirstStrategy,
+    'fifo': FifoStrategy,
+    'fewest': FewestBinsStrategy,
+}
+
+
+def get_pick_strategy(strategy=None):
+    """
+    Return a pick strategy from a ``PickStrategy`` instance, one of the
+    names in ``STRATEGIES`` or a dotted path to a class.
+
+    Defaults to ``INVENTORY_PICK_STRATEGY``, or name order.
+    """
+    if isinstance(strategy, PickStrategy):
+        return strategy
+    strategy = strategy or getattr(settings, 'INVENTORY_PICK_STRATEGY', 'name')
+    if strategy in STRATEGIES:
+        return STRATEGIES[strategy]()
+    return import_string(strategy)()
@@ -0,0 +1,343 @@
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from django.db import router, transaction
+from django.utils import timezone
+from ..models import Product, StockLineRevision, StockMovementItem, Stockard
+from .lookups import stockard_cache
+from .picking import get_pick_strategy, load_bins
+from .stock import apply_stock_deltas
+
+# What a line's stock effect depends on
+ITEM_STATE = ('product_id', 'from_stockard_id', 'to_stockard_id', 'quantity')
+
+
+def resolve_stockards(warehouse_id, names):
+    """
+    Return a ``{name: stockard_id}`` map for ``names`` in a warehouse,
+    creating the missing stockards with a single bulk insert
+    """
+    found = dict(
+        Stockard.objects.filter(warehouse_id=warehouse_id, name__in=names).values_list('name', 'pk')
+    )
+    missing = [name for name in names if name not in found]
+    if missing:
+        Stockard.objects.bulk_create(
+            [Stockard(warehouse_id=warehouse_id, name=name) for name in missing],
+            ignore_conflicts=True
+        )
+        found.update(
+            Stockard.objects.filter(warehouse_id=warehouse_id, name__in=missing).values_list('name', 'pk')
+        )
+    return found
+
+
+def post_movement(movement, items, strategy=None):
+    """
+    Post unsaved ``StockMovementItem`` instances for a saved ``movement``.
+
+    Stockards are resolved for all lines at once, the stock deltas are
+    applied with batched conditional updates and upserts, and the items are
+    inserted with ``bulk_create``, all in one transaction. The query count
+    does not grow with the number of lines, only with the number of batches.
+    Outbound lines are split over as many bins as ``strategy`` picks, see
+    ``get_pick_strategy``.
+    """
+    return post_movements([(movement, items)], strategy)
+
+
+async def apost_movement(movement, items, strategy=None):
+    """
+    ``post_movement`` for async code. The whole posting is one call into
+    the request's sync thread, which holds its database connection, so the
+    transaction and the stock checks never straddle threads.
+    """
+    return await sync_to_async(post_movement)(movement, items, strategy)
+
+
+def post_movements(lines, strategy=None):
+    """
+    Post ``(movement, items)`` pairs in order, as ``post_movement`` would one
+    by one, but with the queries shared between consecutive movements.
+
+    A batch is cut before a movement that would remove stock from a product
+    and warehouse the batch adds to, or the other way round, so every stock
+    check sees the same quantities as it would posting one at a time.
+    """
+    lines = [(movement, list(items)) for movement, items in lines]
+    lines = [(movement, items) for movement, items in lines if items]
+    if not lines:
+        return []
+
+    products = Product.objects.in_bulk({item.product_id for _movement, items in lines for item in items})
+    created = []
+    with transaction.atomic(using=router.db_for_write(StockMovementItem)):
+        batch = []
+        added, removed = set(), set()
+        for movement, items in lines:
+            adds, removes = set(), set()
+            for item in items:
+                if movement.movement_type in ('OUT', 'TRANSFER'):
+                    removes.add((item.product_id, movement.from_warehouse_id))
+                if movement.movement_type in ('IN', 'TRANSFER'):
+                    adds.add((item.product_id, movement.to_warehouse_id))
+            if batch and (removes & added or adds & removed):
+                created += _post_batch(batch, products, strategy)
+                batch = []
+                added, removed = set(), set()
+            batch.append((movement, items))
+            added |= adds
+            removed |= removes
+        created += _post_batch(batch, products, strategy)
+    return created
+
+
+def _post_batch(lines, products, strategy=None):
+    deltas = defaultdict(int)
+    warehouses = {}
+    created = _route(lines, products, deltas, warehouses, strategy)
+    apply_stock_deltas(deltas, warehouses)
+    return StockMovementItem.objects.bulk_create(created)
+
+
+def _route(lines, products, deltas, warehouses, strategy=None):
+    """
+    Pick the stockards of new lines, add their stock effect to ``deltas``
+    and return the lines, with a line split in one item per source bin
+    """
+    using = router.db_for_write(StockMovementItem)
+    issues = defaultdict(set)
+    receipts = defaultdict(set)
+    for movement, items in lines:
+        if movement.movement_type in ('OUT', 'TRANSFER'):
+            issues[movement.from_warehouse_id].update(item.product_id for item in items)
+        if movement.movement_type in ('IN', 'TRANSFER'):
+            receipts[movement.to_warehouse_id, movement.movement_type].update(item.product_id for item in items)
+
+    # Bin quantities change with every pick, so sources are read fresh
+    bins = {}
+    for warehouse_id, product_ids in issues.items():
+        bins.update(
+            ((warehouse_id, product_id), product_bins)
+            for product_id, product_bins in load_bins(warehouse_id, product_ids).items()
+        )
+    strategy = get_pick_strategy(strategy)
+
+    destinations = {}
+    for (warehouse_id, movement_type), product_ids in receipts.items():
+        pairs = {(product_id, warehouse_id) for product_id in product_ids}
+        found, keys = stockard_cache.get_many(pairs, movement_type)
+        missing = [product_id for product_id, _warehouse_id in pairs - found.keys()]
+        if missing:
+            suffix = 'Stock' if movement_type == 'IN' else 'Transfer Stock'
+            names = {product_id: f"{products[product_id].name} {suffix}" for product_id in missing}
+            resolved = resolve_stockards(warehouse_id, set(names.values()))
+            fetched = {(product_id, warehouse_id): resolved[name] for product_id, name in names.items()}
+            stockard_cache.set_many(fetched, keys, using)
+            found.update(fetched)
+        destinations.update(
+            ((warehouse_id, movement_type, product_id), stockard_id) for (product_id, _w), stockard_id in found.items()
+        )
+
+    routed = []
+    now = timezone.now()
+    for movement, items in lines:
+        movement_type = movement.movement_type
+        for item in items:
+            item.movement = movement
+            item.product = products[item.product_id]
+            item.from_stockard_id = item.to_stockard_id = None
+            if movement_type in ('IN', 'TRANSFER'):
+                item.to_stockard_id = destinations[movement.to_warehouse_id, movement_type, item.product_id]
+                warehouses[item.to_stockard_id] = movement.to_warehouse_id
+            parts = [item]
+            if movement_type in ('OUT', 'TRANSFER'):
+                key = movement.from_warehouse_id, item.product_id
+                picks = strategy.allocate(bins.get(key, []), item.quantity)
+                parts = [item] + [
+                    StockMovementItem(
+                        movement=movement, product=item.product, quantity=quantity, to_stockard_id=item.to_stockard_id
+                    )
+                    for _stockard_id, quantity in picks[1:]
+                ]
+                taken = dict(picks)
+                for part, (stockard_id, quantity) in zip(parts, picks):
+                    part.from_stockard_id = stockard_id
+                    part.quantity = quantity
+                    warehouses[stockard_id] = movement.from_warehouse_id
+                # Later lines of the batch pick from what is left
+                bins[key] = [
+                    bin._replace(quantity=bin.quantity - taken.get(bin.stockard_id, 0))
+                    for bin in bins.get(key, []) if bin.quantity > taken.get(bin.stockard_id, 0)
+                ]
+            for part in parts:
+                part.posted_at = now
+                add_effect(deltas, item_state(part))
+            routed += parts
+    return routed
+
+
+def item_state(item):
+    return tuple(getattr(item, field) for field in ITEM_STATE)
+
+
+def add_effect(deltas, state, sign=1):
+    """
+    Add the stock effect of a line in ``ITEM_STATE`` form to ``deltas``
+    """
+    product_id, from_stockard_id, to_stockard_id, quantity = state
+    if from_stockard_id is not None:
+        deltas[product_id, from_stockard_id] -= sign * quantity
+    if to_stockard_id is not None:
+        deltas[product_id, to_stockard_id] += sign * quantity
+
+
+def loaded_states(items):
+    """
+    Return ``{pk: (state, posted_at)}`` with the persisted state of saved
+    lines and when it was applied, read from what ``from_db`` remembered
+    or, failing that, with one query
+    """
+    fields = ITEM_STATE + ('posted_at',)
+    states = {}
+    missing = []
+    for item in items:
+        loaded = getattr(item, '_loaded_values', None)
+        if loaded is not None and all(field in loaded for field in fields):
+            states[item.pk] = tuple(loaded[field] for field in ITEM_STATE), loaded['posted_at']
+        else:
+            missing.append(item.pk)
+    if missing:
+        for pk, *state, posted_at in StockMovementItem.objects.filter(pk__in=missing).values_list('pk', *fields):
+            states[pk] = tuple(state), posted_at
+    return states
+
+
+def revisions(state, posted_at, superseded_at, warehouses):
+    """
+    The ``StockLineRevision`` rows recording what a line in ``state`` added
+    to or took from the warehouses of its stockards, looked up in
+    ``warehouses``, between ``posted_at`` and ``superseded_at``
+    """
+    product_id, from_stockard_id, to_stockard_id, quantity = state
+    effects = []
+    if from_stockard_id is not None:
+        effects.append((warehouses[from_stockard_id], -quantity))
+    if to_stockard_id is not None:
+        effects.append((warehouses[to_stockard_id], quantity))
+    return [
+        StockLineRevision(
+            product_id=product_id, warehouse_id=warehouse_id, quantity=quantity,
+            posted_at=posted_at, superseded_at=superseded_at
+        )
+        for warehouse_id, quantity in effects
+    ]
+
+
+def save_movement_items(movement, created=(), changed=(), deleted=(), strategy=None, write=True):
+    """
+    Write the new, edited and deleted lines of ``movement`` and apply only
+    their net stock effect.
+
+    Edited and deleted lines first reverse what they applied when they
+    were last saved; an edited line keeps its stockards unless its product
+    changed or, for an outbound line, its quantity grew, when it is picked
+    again from every bin after handing its units back. New and re-routed
+    lines may be split over several bins, see ``post_movement``. The
+    combined deltas are applied in one batch, so re-saving a line never
+    counts it twice, and the query count does not grow with the number of
+    lines.
+
+    What an edited or deleted line applied until now is kept as
+    ``StockLineRevision`` rows and the line's ``posted_at`` moves to now,
+    so ``stock_as_of`` replays the change when it happened.
+
+    With ``write=False`` the given lines are left for the caller to save
+    or delete, as ``StockMovementItem.save()`` and ``delete()`` do through
+    ``Model.save()`` and ``Model.delete()``; lines split off them are
+    still inserted.
+    """
+    created, changed, deleted = list(created), list(changed), list(deleted)
+    if not (created or changed or deleted):
+        return []
+
+    states = loaded_states(changed + deleted)
+    given = {id(item) for item in created}
+    now = timezone.now()
+    deltas = defaultdict(int)
+    returned = defaultdict(int)
+    # Where the saved lines applied their stock, whatever the movement says now
+    stockards = {stockard_id for state, _posted_at in states.values() for stockard_id in state[1:3]} - {None}
+    warehouses = dict(Stockard.objects.filter(pk__in=stockards).values_list('pk', 'warehouse_id')) if stockards else {}
+    rerouted = []
+    superseded = []
+    for item in deleted:
+        state, posted_at = states[item.pk]
+        add_effect(deltas, state, -1)
+        superseded += revisions(state, posted_at, now, warehouses)
+    for item in changed:
+        state, posted_at = states[item.pk]
+        product_id, from_stockard_id, to_stockard_id, quantity = old = state
+        if item.product_id != product_id or (from_stockard_id is not None and item.quantity > quantity):
+            rerouted.append(item)
+            if from_stockard_id is not None:
+                # Back in the bin before picking, so the pick can use them
+                returned[product_id, from_stockard_id] += quantity
+                old = product_id, None, to_stockard_id, quantity
+        else:
+            item.from_stockard_id, item.to_stockard_id = from_stockard_id, to_stockard_id
+            add_effect(deltas, item_state(item))
+        add_effect(deltas, old, -1)
+        if item_state(item) != state or item in rerouted:
+            superseded += revisions(state, posted_at, now, warehouses)
+            item.posted_at = now
+        else:
+            item.posted_at = posted_at
+
+    with transaction.atomic(using=router.db_for_write(StockMovementItem)):
+        if returned:
+            apply_stock_deltas(returned, warehouses)
+        if created or rerouted:
+            products = Product.objects.in_bulk({item.product_id for item in created + rerouted})
+            routed = _route([(movement, created + rerouted)], products, deltas, warehouses, strategy)
+            created = [item for item in routed if item.pk is None]
+        apply_stock_deltas(deltas, warehouses)
+        if deleted and write:
+            StockMovementItem.objects.filter(pk__in=[item.pk for item in deleted]).delete()
+        if changed and write:
+            StockMovementItem.objects.bulk_update(
+                changed, ['product', 'from_stockard', 'to_stockard', 'quantity', 'posted_at']
+            )
+        inserted = created if write else [item for item in created if id(item) not in given]
+        StockMovementItem.objects.bulk_create(inserted)
+        if superseded:
+            StockLineRevision.objects.bulk_create(superseded)
+
+    for item in changed + created:
+        item._loaded_values = dict(zip(ITEM_STATE, item_state(item)), posted_at=item.posted_at)
+    return created
+
+
+def unpost_movements(movements):
+    """
+    Hand back the stock the lines of ``movements`` applied, as deleting
+    each line would, before the movements are deleted with their lines.
+    ``StockMovement.delete()`` and the movement admin's bulk delete call
+    this; archiving deletes movements without it, as their stock stays.
+    """
+    movements = list(movements)
+    lines = defaultdict(list)
+    for item in StockMovementItem.objects.filter(movement__in=[movement.pk for movement in movements]).order_by():
+        lines[item.movement_id].append(item)
+    with transaction.atomic(using=router.db_for_write(StockMovementItem)):
+        for movement in movements:
+            if lines[movement.pk]:
+                save_movement_items(movement, deleted=lines[movement.pk], write=False)
+
+
+async def asave_movement_items(movement, created=(), changed=(), deleted=(), strategy=None):
+    """
+    ``save_movement_items`` for async code, in one call for the same
+    reason as ``apost_movement``. ``StockMovementItem.asave()`` and
+    ``adelete()`` also end up here through ``save()`` and ``delete()``.
+    """
+    return await sync_to_async(save_movement_items)(movement, created, changed, deleted, strategy)
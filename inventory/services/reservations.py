@@ -0,0 +1,190 @@
+import datetime
+from collections import defaultdict
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from ..models import StockMovementItem, StockReservation, StockSummary
+from .posting import post_movement
+from .sql import batch_size
+from .stock import InsufficientStock
+
+
+def adjust_reserved(amounts, hold=False):
+    """
+    Add ``{(product_id, warehouse_id): amount}`` to the reserved quantities
+    of the stock summaries with batched ``UPDATE ... CASE`` statements.
+
+    With ``hold`` a row only takes its amount while the unreserved quantity
+    covers it; if fewer rows are affected than requested InsufficientStock
+    is raised, as in ``remove_stock_bulk``, so the caller's transaction
+    rolls back.
+    """
+    pairs = [(key, amount) for key, amount in amounts.items() if amount]
+    if not pairs:
+        return
+    connection = connections[router.db_for_write(StockSummary)]
+    qn = connection.ops.quote_name
+    opts = StockSummary._meta
+    table = qn(opts.db_table)
+    product = qn(opts.get_field('product').column)
+    warehouse = qn(opts.get_field('warehouse').column)
+    quantity = qn(opts.get_field('quantity').column)
+    reserved = qn(opts.get_field('reserved_quantity').column)
+    updated_at = opts.get_field('updated_at')
+    now = updated_at.get_db_prep_save(timezone.now(), connection)
+
+    size = batch_size(connection, 8)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pairs), size):
+            batch = pairs[start:start + size]
+            case = 'CASE %s END' % ' '.join(
+                [f'WHEN {product} = %s AND {warehouse} = %s THEN %s'] * len(batch)
+            )
+            case_params = [value for (product_id, warehouse_id), amount in batch
+                           for value in (product_id, warehouse_id, amount)]
+            product_ids = list({product_id for (product_id, _warehouse_id), _amount in batch})
+            warehouse_ids = list({warehouse_id for (_product_id, warehouse_id), _amount in batch})
+            sql = (
+                f'UPDATE {table} SET {reserved} = {reserved} + {case}, {qn(updated_at.column)} = %s '
+                f'WHERE {product} IN ({", ".join(["%s"] * len(product_ids))}) '
+                f'AND {warehouse} IN ({", ".join(["%s"] * len(warehouse_ids))})'
+            )
+            params = case_params + [now] + product_ids + warehouse_ids + case_params
+            # Rows of the product and warehouse cross product outside the
+            # requested pairs get a NULL amount and must not match
+            if hold:
+                sql += f' AND {quantity} - {reserved} >= {case}'
+            else:
+                sql += f' AND {case} IS NOT NULL'
+            cursor.execute(sql, params)
+            if hold and cursor.rowcount != len(batch):
+                raise InsufficientStock(_(
+                    'Not enough unreserved stock to hold {} of the requested items'
+                ).format(len(batch) - cursor.rowcount))
+
+
+def reserve(warehouse, lines, ttl=None, reference=''):
+    """
+    Hold ``(product, quantity)`` lines, or a ``{product: quantity}`` map, in
+    ``warehouse`` and return one ``StockReservation`` per product.
+
+    The holds expire after ``ttl`` seconds (``INVENTORY_RESERVATION_TTL``,
+    15 minutes by default). Availability is checked and the quantities
+    held by the same conditional UPDATE, so nothing is locked beyond that
+    statement and concurrent holds can never take more than is in stock.
+    Raises InsufficientStock when a line cannot be covered; then nothing is
+    held.
+    """
+    warehouse_id = getattr(warehouse, 'pk', warehouse)
+    quantities = defaultdict(int)
+    for product, quantity in (lines.items() if isinstance(lines, dict) else lines):
+        if quantity <= 0:
+            raise ValidationError(_('Reserved quantities must be positive'))
+        quantities[getattr(product, 'pk', product)] += quantity
+    if ttl is None:
+        ttl = getattr(settings, 'INVENTORY_RESERVATION_TTL', 15 * 60)
+    expires_at = timezone.now() + datetime.timedelta(seconds=ttl)
+
+    with transaction.atomic(using=router.db_for_write(StockReservation)):
+        holds = {(product_id, warehouse_id): quantity for product_id, quantity in quantities.items()}
+        adjust_reserved(holds, hold=True)
+        return StockReservation.objects.bulk_create([
+            StockReservation(
+                product_id=product_id,
+                warehouse_id=warehouse_id,
+                quantity=quantity,
+                reference=reference,
+                expires_at=expires_at
+            )
+            for product_id, quantity in quantities.items()
+        ])
+
+
+def close_reservations(rows, status, movement=None, now=None):
+    """
+    End the active holds in ``rows``, ``(pk, product_id, warehouse_id,
+    quantity)`` tuples read under lock, and give their units back
+    """
+    if not rows:
+        return
+    closed = StockReservation.objects.filter(pk__in=[row[0] for row in rows], status='ACTIVE').update(
+        status=status, closed_at=now or timezone.now(), movement=movement
+    )
+    if closed != len(rows):
+        # Only without row locks, where another transaction got there first
+        raise ValidationError(_('Some of the reservations were closed concurrently; try again'))
+    released = defaultdict(int)
+    for _pk, product_id, warehouse_id, quantity in rows:
+        released[product_id, warehouse_id] -= quantity
+    adjust_reserved(released)
+
+
+def locked_active(queryset):
+    return list(
+        queryset.select_for_update().filter(status='ACTIVE').order_by('pk').values_list(
+            'pk', 'product_id', 'warehouse_id', 'quantity'
+        )
+    )
+
+
+def release_reservations(reservations):
+    """
+    Release the holds among ``reservations`` (instances or ids) that are
+    still active and return how many were released
+    """
+    pks = [getattr(reservation, 'pk', reservation) for reservation in reservations]
+    with transaction.atomic(using=router.db_for_write(StockReservation)):
+        rows = locked_active(StockReservation.objects.filter(pk__in=pks))
+        close_reservations(rows, 'RELEASED')
+    return len(rows)
+
+
+def commit_reservations(reservations, movement):
+    """
+    Post the holds in ``reservations`` as the lines of the saved OUT or
+    TRANSFER ``movement`` and return the created items.
+
+    The holds are ended and their units issued in one transaction, so the
+    stock they kept aside is exactly what the movement takes. Every hold
+    must still be active, unexpired and in the movement's source
+    warehouse.
+    """
+    pks = [getattr(reservation, 'pk', reservation) for reservation in reservations]
+    now = timezone.now()
+    with transaction.atomic(using=router.db_for_write(StockReservation)):
+        rows = locked_active(StockReservation.objects.filter(pk__in=pks, expires_at__gt=now))
+        if len(rows) != len(set(pks)):
+            raise ValidationError(_('Some of the reservations have expired or are no longer active'))
+        if movement.movement_type not in ('OUT', 'TRANSFER') or any(
+            warehouse_id != movement.from_warehouse_id for _pk, _product_id, warehouse_id, _quantity in rows
+        ):
+            raise ValidationError(_('Reservations can only be committed into movements out of their warehouse'))
+        close_reservations(rows, 'COMMITTED', movement, now)
+        return post_movement(movement, [
+            StockMovementItem(product_id=product_id, quantity=quantity)
+            for _pk, product_id, _warehouse_id, quantity in rows
+        ])
+
+
+def expire_reservations(now=None, batch_size=1000):
+    """
+    Expire the active holds past their ``expires_at`` in batches of
+    ``batch_size``, each in its own short transaction, and return how many
+    expired. Rows another sweeper holds are skipped where the database
+    supports it.
+    """
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        with transaction.atomic(using=router.db_for_write(StockReservation)):
+            rows = list(
+                StockReservation.objects.select_for_update(skip_locked=True).filter(
+                    status='ACTIVE', expires_at__lte=now
+                ).order_by('expires_at').values_list('pk', 'product_id', 'warehouse_id', 'quantity')[:batch_size]
+            )
+            close_reservations(rows, 'EXPIRED', now=now)
+        expired += len(rows)
+        if len(rows) < batch_size:
+            return expired
@@ -0,0 +1,129 @@
+import datetime
+from collections import defaultdict
+from itertools import islice
+from django.db import router, transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+from ..models import (
+    ArchivedStockMovementItem, StockLineRevision, StockMovementItem, StockSnapshot, StockSummary
+)
+
+
+def cutoff(when):
+    """
+    Return the instant ``when`` stands for: a date means the close of that
+    day in the current time zone
+    """
+    if isinstance(when, datetime.datetime):
+        return when if timezone.is_aware(when) else timezone.make_aware(when)
+    next_day = datetime.datetime.combine(when + datetime.timedelta(days=1), datetime.time.min)
+    return timezone.make_aware(next_day)
+
+
+def ledger_deltas(start, end, warehouse=None, product=None):
+    """
+    Sum the movement items posted in ``[start, end)`` into signed deltas
+    keyed by ``(product_id, warehouse_id)``, the warehouse being that of the
+    stockard each line moved stock in or out of. ``start`` may be None to
+    replay from the beginning. Items are replayed by their ``posted_at``,
+    so lines posted late or edited after ``start`` count from when they
+    took effect, and the ``StockLineRevision`` rows of edited and deleted
+    lines add what those lines applied before and take it back when they
+    changed. Archived items and the revisions are read in the same
+    statements, through their ``posted_at`` indexes.
+    """
+    def window(queryset, field):
+        queryset = queryset.filter(**{f'{field}__lt': end})
+        if start is not None:
+            queryset = queryset.filter(**{f'{field}__gte': start})
+        if product is not None:
+            queryset = queryset.filter(product=product)
+        return queryset.order_by()
+
+    def summed(model, side):
+        items = window(model.objects.filter(**{f'{side}__isnull': False}), 'posted_at')
+        if warehouse is not None:
+            items = items.filter(**{f'{side}__warehouse': warehouse})
+        return items.values('product_id', f'{side}__warehouse_id').annotate(quantity=Sum('quantity'))
+
+    def revised(field, sign):
+        revisions = window(StockLineRevision.objects.all(), field)
+        if warehouse is not None:
+            revisions = revisions.filter(warehouse=warehouse)
+        return revisions.values('product_id', 'warehouse_id').annotate(quantity=Sum(F('quantity') * sign))
+
+    deltas = defaultdict(int)
+    for side, sign in (('to_stockard', 1), ('from_stockard', -1)):
+        rows = summed(StockMovementItem, side).union(summed(ArchivedStockMovementItem, side), all=True)
+        if sign == 1:
+            # Revisions carry their own sign and ride along with the receipts
+            rows = rows.union(revised('posted_at', 1), revised('superseded_at', -1), all=True)
+        for row in rows:
+            deltas[row['product_id'], row[f'{side}__warehouse_id']] += sign * row['quantity']
+    return deltas
+
+
+def stock_as_of(when, warehouse=None, product=None):
+    """
+    Return ``{(product_id, warehouse_id): quantity}`` as it stood at
+    ``when``, a datetime or a date (meaning that day's close), optionally
+    for one warehouse and/or product.
+
+    Starts from the latest snapshot taken at or before ``when`` and applies
+    only the lines posted, edited or deleted since, so the cost follows the
+    number of changes after the snapshot rather than the whole ledger. Stock
+    imports and direct edits of ``Stock`` reach the ledger as adjustment
+    movements, so they are replayed like any other line.
+    """
+    end = cutoff(when)
+    taken_at = StockSnapshot.objects.filter(taken_at__lte=end).aggregate(latest=Max('taken_at'))['latest']
+
+    quantities = defaultdict(int)
+    if taken_at is not None:
+        snapshot = StockSnapshot.objects.filter(taken_at=taken_at)
+        if warehouse is not None:
+            snapshot = snapshot.filter(warehouse=warehouse)
+        if product is not None:
+            snapshot = snapshot.filter(product=product)
+        quantities.update(
+            ((product_id, warehouse_id), quantity)
+            for product_id, warehouse_id, quantity in snapshot.values_list('product_id', 'warehouse_id', 'quantity')
+        )
+    for key, delta in ledger_deltas(taken_at, end, warehouse, product).items():
+        quantities[key] += delta
+    return {key: quantity for key, quantity in quantities.items() if quantity}
+
+
+def take_snapshot(at=None, period='DAY'):
+    """
+    Write a snapshot of every warehouse's stock and return the number of
+    rows written. Without ``at`` the current summaries are copied; with it
+    the quantities are rebuilt with ``stock_as_of``. A snapshot already
+    taken at the same instant is replaced.
+    """
+    with transaction.atomic(using=router.db_for_write(StockSnapshot)):
+        if at is None:
+            taken_at = timezone.now()
+            rows = StockSummary.objects.exclude(quantity=0).values_list(
+                'product_id', 'warehouse_id', 'quantity'
+            ).iterator(chunk_size=1000)
+        else:
+            taken_at = cutoff(at)
+            rows = [(product_id, warehouse_id, quantity)
+                    for (product_id, warehouse_id), quantity in stock_as_of(taken_at).items()]
+        StockSnapshot.objects.filter(taken_at=taken_at).delete()
+        rows = iter(rows)
+        written = 0
+        while batch := list(islice(rows, 1000)):
+            StockSnapshot.objects.bulk_create([
+                StockSnapshot(
+                    product_id=product_id,
+                    warehouse_id=warehouse_id,
+                    quantity=quantity,
+                    taken_at=taken_at,
+                    period=period
+                )
+                for product_id, warehouse_id, quantity in batch
+            ])
+            written += len(batch)
+    return written
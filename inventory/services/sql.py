@@ -0,0 +1,70 @@
+from django.db import connections, router
+from django.utils import timezone
+
+
+def increment(model, key_fields, rows, value_field='quantity', returning=()):
+    """
+    Add values to ``model`` rows with batched additive upserts.
+
+    ``rows`` is a list of tuples holding the ``key_fields`` values followed by
+    the amount to add. Missing rows are inserted, existing rows are updated
+    in place with ``value = value + excluded.value``, so nothing is read
+    before it is written.
+
+    With ``returning`` field names, returns those columns of the upserted
+    rows as read by the same statements, or None when the database cannot
+    return rows from an upsert.
+    """
+    if not rows:
+        return [] if returning else None
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    opts = model._meta
+    table = qn(opts.db_table)
+    now = timezone.now()
+
+    fields = [opts.get_field(name) for name in key_fields]
+    value = opts.get_field(value_field)
+    timestamps = [
+        field for field in opts.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    columns = [field.column for field in fields] + [value.column] + [field.column for field in timestamps]
+
+    placeholders = '(%s)' % ', '.join(['%s'] * len(columns))
+    updates = [f'{qn(value.column)} = {table}.{qn(value.column)} + EXCLUDED.{qn(value.column)}']
+    updates += [
+        f'{qn(field.column)} = EXCLUDED.{qn(field.column)}'
+        for field in timestamps if getattr(field, 'auto_now', False)
+    ]
+    returned = None
+    suffix = ''
+    if returning and connection.features.can_return_rows_from_bulk_insert:
+        returned = []
+        suffix = ' RETURNING ' + ', '.join(qn(opts.get_field(name).column) for name in returning)
+    size = batch_size(connection, len(columns))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), size):
+            batch = rows[start:start + size]
+            params = []
+            for row in batch:
+                for field, raw in zip(fields + [value], row):
+                    params.append(field.get_db_prep_save(raw, connection))
+                for field in timestamps:
+                    params.append(field.get_db_prep_save(now, connection))
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(qn(c) for c in columns)}) '
+                f'VALUES {", ".join([placeholders] * len(batch))} '
+                f'ON CONFLICT ({", ".join(qn(field.column) for field in fields)}) '
+                f'DO UPDATE SET {", ".join(updates)}{suffix}',
+                params
+            )
+            if returned is not None:
+                returned += cursor.fetchall()
+    return returned
+
+
+def batch_size(connection, params_per_row):
+    max_params = connection.features.max_query_params or 2 ** 15
+    return max(1, max_params // params_per_row)
@@ -0,0 +1,132 @@
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from ..models import Stock
+from .sql import batch_size, increment
+from .summary import over_reserved, update_summaries
+
+
+class InsufficientStock(ValidationError):
+    """
+    Raised when an outbound delta would take a stock row below zero
+    """
+
+
+def add_stock(product_id, stockard_id, quantity, warehouse_id=None):
+    """
+    Add ``quantity`` units to a stock row, creating the row if needed
+    """
+    with transaction.atomic(using=router.db_for_write(Stock)):
+        increment(Stock, ('product', 'stockard'), [(product_id, stockard_id, quantity)])
+        update_summaries(
+            {(product_id, stockard_id): quantity},
+            {stockard_id: warehouse_id} if warehouse_id else None
+        )
+
+
+def remove_stock(product_id, stockard_id, quantity, warehouse_id=None):
+    """
+    Remove ``quantity`` units from a stock row with one conditional UPDATE.
+
+    Insufficient stock is detected from the affected-row count, so no
+    separate SELECT is needed.
+    """
+    with transaction.atomic(using=router.db_for_write(Stock)):
+        updated = Stock.objects.filter(
+            product_id=product_id,
+            stockard_id=stockard_id,
+            quantity__gte=quantity
+        ).update(quantity=F('quantity') - quantity, updated_at=timezone.now())
+        if not updated:
+            raise InsufficientStock(_(
+                'Not enough stock available to remove {} units from the selected stockard'
+            ).format(quantity))
+        update_summaries(
+            {(product_id, stockard_id): -quantity},
+            {stockard_id: warehouse_id} if warehouse_id else None
+        )
+
+
+def remove_stock_bulk(rows):
+    """
+    Remove quantities from many stock rows with batched conditional UPDATEs.
+
+    ``rows`` maps ``(product_id, stockard_id)`` to the number of units to
+    remove. Each batch is a single ``UPDATE ... CASE`` statement; if fewer
+    rows are affected than requested, at least one row lacked stock and
+    InsufficientStock is raised so the caller's transaction rolls back.
+    """
+    pairs = list(rows.items())
+    if not pairs:
+        return
+    connection = connections[router.db_for_write(Stock)]
+    qn = connection.ops.quote_name
+    opts = Stock._meta
+    table = qn(opts.db_table)
+    product = qn(opts.get_field('product').column)
+    stockard = qn(opts.get_field('stockard').column)
+    quantity = qn(opts.get_field('quantity').column)
+    updated_at = opts.get_field('updated_at')
+    now = updated_at.get_db_prep_save(timezone.now(), connection)
+
+    # Each pair binds its key in the WHERE clause and in both CASE expressions
+    size = batch_size(connection, 8)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pairs), size):
+            batch = pairs[start:start + size]
+            case = 'CASE %s END' % ' '.join(
+                [f'WHEN {product} = %s AND {stockard} = %s THEN %s'] * len(batch)
+            )
+            case_params = [value for (product_id, stockard_id), amount in batch
+                           for value in (product_id, stockard_id, amount)]
+            product_ids = list({product_id for (product_id, _stockard_id), _amount in batch})
+            stockard_ids = list({stockard_id for (_product_id, stockard_id), _amount in batch})
+            # Rows outside the requested pairs get a NULL amount and never match
+            cursor.execute(
+                f'UPDATE {table} SET {quantity} = {quantity} - {case}, {qn(updated_at.column)} = %s '
+                f'WHERE {product} IN ({", ".join(["%s"] * len(product_ids))}) '
+                f'AND {stockard} IN ({", ".join(["%s"] * len(stockard_ids))}) '
+                f'AND {quantity} >= {case}',
+                case_params + [now] + product_ids + stockard_ids + case_params
+            )
+            if cursor.rowcount != len(batch):
+                raise InsufficientStock(_(
+                    'Not enough stock available for {} of the requested items'
+                ).format(len(batch) - cursor.rowcount))
+
+
+def apply_stock_deltas(deltas, warehouses=None):
+    """
+    Apply signed deltas keyed by ``(product_id, stockard_id)`` in batches.
+
+    ``warehouses`` optionally maps stockard ids to their warehouse ids so
+    the stock summaries can be updated without looking them up. Units held
+    by stock reservations cannot be taken out.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    with transaction.atomic(using=router.db_for_write(Stock)):
+        remove_stock_bulk({key: -delta for key, delta in deltas.items() if delta < 0})
+        increment(Stock, ('product', 'stockard'), [
+            (product_id, stockard_id, delta)
+            for (product_id, stockard_id), delta in deltas.items() if delta > 0
+        ])
+        per_warehouse = update_summaries(deltas, warehouses)
+        short = over_reserved(key for key, delta in per_warehouse.items() if delta < 0)
+        if short:
+            raise InsufficientStock(_(
+                'Not enough unreserved stock available for {} of the requested items'
+            ).format(len(short)))
+
+
+def apply_movement_item(item):
+    """
+    Apply the stock effect of a single movement item
+    """
+    movement = item.movement
+    with transaction.atomic(using=router.db_for_write(Stock)):
+        if movement.movement_type in ('OUT', 'TRANSFER'):
+            remove_stock(item.product_id, item.from_stockard_id, item.quantity, movement.from_warehouse_id)
+        if movement.movement_type in ('IN', 'TRANSFER'):
+            add_stock(item.product_id, item.to_stockard_id, item.quantity, movement.to_warehouse_id)
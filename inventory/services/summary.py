@@ -0,0 +1,83 @@
+from collections import defaultdict
+from django.db.models import F, Sum
+from ..models import ProductStockTotal, Stockard, StockSummary
+from .alerts import record_crossings
+from .sql import increment
+
+
+def update_summaries(deltas, warehouses=None):
+    """
+    Fold stock deltas keyed by ``(product_id, stockard_id)`` into the
+    per-warehouse ``StockSummary`` rows and the per-product totals.
+
+    Stockards missing from the optional ``warehouses`` map are resolved with
+    one query. Summaries crossing their reorder point queue a
+    ``StockAlert``, found from the quantities the upsert returns. Must run
+    in the same transaction as the stock change. Returns the deltas by
+    ``(product_id, warehouse_id)``.
+    """
+    warehouses = dict(warehouses or {})
+    missing = {stockard_id for _product_id, stockard_id in deltas if stockard_id not in warehouses}
+    if missing:
+        warehouses.update(Stockard.objects.filter(pk__in=missing).values_list('pk', 'warehouse_id'))
+
+    per_warehouse = defaultdict(int)
+    per_product = defaultdict(int)
+    for (product_id, stockard_id), delta in deltas.items():
+        per_warehouse[product_id, warehouses[stockard_id]] += delta
+        per_product[product_id] += delta
+
+    rows = increment(StockSummary, ('product', 'warehouse'), [
+        (product_id, warehouse_id, delta)
+        for (product_id, warehouse_id), delta in per_warehouse.items() if delta
+    ], returning=('product', 'warehouse', 'quantity', 'reorder_point'))
+    if rows is None:
+        rows = StockSummary.objects.filter(
+            product_id__in={product_id for product_id, _warehouse_id in per_warehouse},
+            warehouse_id__in={warehouse_id for _product_id, warehouse_id in per_warehouse},
+            reorder_point__isnull=False
+        ).values_list('product_id', 'warehouse_id', 'quantity', 'reorder_point')
+    record_crossings([
+        (product_id, warehouse_id, quantity - per_warehouse[product_id, warehouse_id], quantity, reorder_point)
+        for product_id, warehouse_id, quantity, reorder_point in rows
+        if reorder_point is not None and (product_id, warehouse_id) in per_warehouse
+    ])
+    increment(ProductStockTotal, ('product',), [
+        (product_id, delta) for product_id, delta in per_product.items() if delta
+    ])
+    return per_warehouse
+
+
+def over_reserved(pairs):
+    """
+    Return those of the ``(product_id, warehouse_id)`` pairs left holding
+    less than their active reservations
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return []
+    rows = StockSummary.objects.filter(
+        product_id__in={product_id for product_id, _warehouse_id in pairs},
+        warehouse_id__in={warehouse_id for _product_id, warehouse_id in pairs},
+        quantity__lt=F('reserved_quantity')
+    ).values_list('product_id', 'warehouse_id')
+    return [row for row in rows if row in pairs]
+
+
+def on_hand(product, warehouse=None):
+    """
+    Return the quantity of ``product`` held in ``warehouse``, or in all
+    warehouses, from the precomputed summaries
+    """
+    if warehouse is None:
+        queryset = ProductStockTotal.objects.filter(product=product)
+    else:
+        queryset = StockSummary.objects.filter(product=product, warehouse=warehouse)
+    return queryset.values_list('quantity', flat=True).first() or 0
+
+
+def summarize(stocks):
+    """
+    Aggregate a ``Stock`` queryset into per-(product, warehouse) rows
+    """
+    return stocks.order_by().values('product_id', 'stockard__warehouse_id').annotate(quantity=Sum('quantity'))
@@ -0,0 +1,107 @@
+from collections import defaultdict
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from .admin.autocomplete import invalidate as invalidate_autocomplete
+from .models import Product, Stock, Stockard, StockMovement, Warehouse
+from .services.ledger import record_adjustments
+from .services.lookups import invalidate_product, invalidate_warehouse
+from .services.outbox import enqueue, get_handler
+from .services.summary import update_summaries
+
+STOCK_KEYS = ('product_id', 'stockard_id', 'quantity')
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def invalidate_stock_lookups(sender, instance, raw=False, using=None, **kwargs):
+    # Adding, moving or removing a stock row can change the stockard a
+    # product is issued from. Connected ahead of summarize_saved_stock,
+    # which moves _loaded_values on to the saved state
+    if raw:
+        return
+    invalidate_product(instance.product_id, using)
+    loaded = getattr(instance, '_loaded_values', {})
+    if loaded.get('product_id') not in (None, instance.product_id):
+        invalidate_product(loaded['product_id'], using)
+
+
+@receiver(post_save, sender=Stock)
+def summarize_saved_stock(sender, instance, created, raw, **kwargs):
+    # The stock engine writes with UPDATE statements; this only sees direct
+    # edits such as the Stock and Stockard admin forms, which go to the
+    # ledger as adjustments so they are not taken for drift
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if not created and not all(key in loaded for key in STOCK_KEYS):
+        return
+    deltas = defaultdict(int)
+    if not created:
+        deltas[loaded['product_id'], loaded['stockard_id']] -= loaded['quantity']
+    deltas[instance.product_id, instance.stockard_id] += instance.quantity
+    update_summaries(deltas)
+    record_adjustments(deltas, notes=_('Stock edited directly'))
+    instance._loaded_values = {key: getattr(instance, key) for key in STOCK_KEYS}
+
+
+@receiver(post_delete, sender=Stock)
+def summarize_deleted_stock(sender, instance, origin=None, **kwargs):
+    # Product cascades take the product's summaries with them, and
+    # stockard and warehouse cascades are summarized before they run, by
+    # summarize_deleted_stockard
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is not Stock:
+        return
+    deltas = {(instance.product_id, instance.stockard_id): -instance.quantity}
+    update_summaries(deltas)
+    record_adjustments(deltas, notes=_('Stock deleted directly'))
+
+
+@receiver(pre_delete, sender=Stockard)
+def summarize_deleted_stockard(sender, instance, **kwargs):
+    # The stock rows cascade away with the stockard, or its warehouse, which
+    # sends this for each of its stockards; take them out of the summaries
+    # and product totals while they can still be read. Their ledger lines
+    # cascade too, so nothing is left to drift
+    stocks = Stock.objects.filter(stockard=instance).exclude(quantity=0)
+    update_summaries({
+        (product_id, stockard_id): -quantity
+        for product_id, stockard_id, quantity in stocks.values_list('product_id', 'stockard_id', 'quantity')
+    })
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Stockard)
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Stockard)
+@receiver(post_delete, sender=Warehouse)
+def invalidate_autocomplete_results(sender, **kwargs):
+    invalidate_autocomplete(sender)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_lookups(sender, instance, raw=False, using=None, **kwargs):
+    # Receipt stockards are named after the product
+    if not raw:
+        invalidate_product(instance.pk, using)
+
+
+@receiver(post_save, sender=Stockard)
+@receiver(post_delete, sender=Stockard)
+@receiver(post_save, sender=Warehouse)
+@receiver(post_delete, sender=Warehouse)
+def invalidate_warehouse_lookups(sender, instance, raw=False, using=None, **kwargs):
+    if not raw:
+        invalidate_warehouse(instance.warehouse_id if sender is Stockard else instance.pk, using)
+
+
+@receiver(post_save, sender=StockMovement)
+def queue_saved_movement(sender, instance, created, raw=False, **kwargs):
+    # Notifications and other follow-up work run in the outbox worker, off
+    # the request; nothing is queued until a handler is configured
+    if not raw and get_handler('movement.saved'):
+        enqueue('movement.saved', instance, {'created': created})
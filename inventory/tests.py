@@ -1,3 +1,1466 @@
-from django.test import TestCase
+import contextlib
+import csv
+import datetime
+import io
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import unittest
+import zipfile
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core import mail
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, connections, router, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from core.log import BoundedQueueHandler, SamplingFilter, queue_handler
+from .db import configure_connection
+from .imports import stream_import
+from .models import (
+    ArchivedStockBalance, ArchivedStockMovement, ArchivedStockMovementItem, OutboxEvent, ProductStockTotal,
+    ReferenceSequence, Warehouse, Stockard, Product, Stock, StockAlert, StockMovement, StockMovementItem,
+    StockReservation, StockSnapshot, StockSummary
+)
+from .routers import replica_reads
+from .resources import StockMovementItemResource, StockMovementResource, StockResource
+from .services import (
+    InsufficientStock, add_stock, apost_movement, apply_stock_deltas, commit_reservations, expire_reservations,
+    post_movement, release_reservations, remove_stock, remove_stock_bulk, reserve, stock_as_of, take_snapshot
+)
+from .services.archive import archive_movements
+from .services.alerts import open_shortages, send_digest, set_reorder_point
+from .services.ledger import find_drift, repair_drift
+from .services.lookups import stockard_cache
+from .services.outbox import defer_post, process_outbox
+from .services.picking import PickStrategy
+from .utils import ReferenceAllocator
 
-# Create your tests here.
+
+class ReferenceAllocatorTests(TestCase):
+    """
+    Leased reference blocks are never handed out twice
+    """
+
+    def test_rolled_back_lease_is_dropped(self):
+        allocator = ReferenceAllocator(block_size=10)
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                self.assertEqual(allocator.next_value('T'), 1)
+                raise DatabaseError('rolled back')
+        # The lease went with the rollback, so the block is leased again
+        # rather than served on from memory
+        with transaction.atomic():
+            self.assertEqual(allocator.next_value('T'), 1)
+            self.assertEqual(allocator.next_value('T'), 2)
+        self.assertEqual(ReferenceSequence.objects.get(prefix='T').last_value, 10)
+
+
+class StockUpdateTests(TestCase):
+    """
+    Conditional stock updates never take a row below zero, and a shortfall
+    on any row of a batch leaves every row as it was
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        main = Warehouse.objects.create(name='Main')
+        cls.stockard = Stockard.objects.create(warehouse=main, name='A1')
+        cls.bolt = Product.objects.create(name='Bolt')
+        cls.nut = Product.objects.create(name='Nut')
+        add_stock(cls.bolt.pk, cls.stockard.pk, 5)
+        add_stock(cls.nut.pk, cls.stockard.pk, 2)
+
+    def quantities(self):
+        stock = dict(Stock.objects.values_list('product__name', 'quantity'))
+        return stock, dict(StockSummary.objects.values_list('product__name', 'quantity'))
+
+    def test_remove_stock(self):
+        remove_stock(self.bolt.pk, self.stockard.pk, 3)
+        with self.assertRaises(InsufficientStock):
+            remove_stock(self.bolt.pk, self.stockard.pk, 3)
+        self.assertEqual(self.quantities(), ({'Bolt': 2, 'Nut': 2}, {'Bolt': 2, 'Nut': 2}))
+
+    def test_shortfall_rolls_back_every_row(self):
+        before = self.quantities()
+        # Bolt has enough, so the CASE update changes its row before the
+        # affected-row count gives the nut away
+        with self.assertRaises(InsufficientStock), transaction.atomic():
+            remove_stock_bulk({(self.bolt.pk, self.stockard.pk): 4, (self.nut.pk, self.stockard.pk): 3})
+        self.assertEqual(self.quantities(), before)
+        with self.assertRaises(InsufficientStock):
+            apply_stock_deltas({(self.bolt.pk, self.stockard.pk): -4, (self.nut.pk, self.stockard.pk): -3})
+        self.assertEqual(self.quantities(), before)
+
+        remove_stock_bulk({(self.bolt.pk, self.stockard.pk): 4, (self.nut.pk, self.stockard.pk): 2})
+        self.assertEqual(dict(Stock.objects.values_list('product__name', 'quantity')), {'Bolt': 1, 'Nut': 0})
+
+
+class PostMovementTests(TestCase):
+    """
+    Posting a movement costs the same number of queries whatever its
+    number of lines
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Warehouse.objects.create(name='Main')
+        cls.products = Product.objects.bulk_create([Product(name=f'P{number}') for number in range(51)])
+
+    def post(self, movement_type, products):
+        warehouses = {'to_warehouse' if movement_type == 'IN' else 'from_warehouse': self.main}
+        movement = StockMovement.objects.create(movement_type=movement_type, **warehouses)
+        with CaptureQueriesContext(connection) as queries:
+            post_movement(movement, [StockMovementItem(product=product, quantity=2) for product in products])
+        return len(queries)
+
+    def test_query_count_does_not_follow_lines(self):
+        one, fifty = self.products[:1], self.products[1:51]
+        self.assertEqual(self.post('IN', one), self.post('IN', fifty))
+        self.assertEqual(self.post('OUT', one), self.post('OUT', fifty))
+        self.assertEqual(StockMovementItem.objects.filter(movement__movement_type='OUT').count(), 51)
+        self.assertEqual(set(StockSummary.objects.values_list('quantity', flat=True)), {0})
+
+
+class RebuildStockSummaryTests(TestCase):
+    """
+    Rebuilding the summaries brings them back to the stock rows, keeping
+    reorder points and reservations
+    """
+
+    def test_drifted_summaries_are_rebuilt(self):
+        main, spare = Warehouse.objects.create(name='Main'), Warehouse.objects.create(name='Spare')
+        bolt, nut = Product.objects.create(name='Bolt'), Product.objects.create(name='Nut')
+        for warehouse, product, quantity in ((main, bolt, 5), (spare, bolt, 3), (main, nut, 4)):
+            movement = StockMovement.objects.create(movement_type='IN', to_warehouse=warehouse)
+            post_movement(movement, [StockMovementItem(product=product, quantity=quantity)])
+        set_reorder_point(bolt, spare, 2)
+        reserve(main, {nut: 1})
+        expected = list(StockSummary.objects.order_by('pk').values_list(
+            'product_id', 'warehouse_id', 'quantity', 'reserved_quantity', 'reorder_point'
+        ))
+        totals = dict(ProductStockTotal.objects.values_list('product_id', 'quantity'))
+
+        # Drift the summaries behind the stock engine's back
+        StockSummary.objects.filter(product=bolt, warehouse=main).update(quantity=50)
+        StockSummary.objects.filter(product=nut).delete()
+        StockSummary.objects.create(product=nut, warehouse=spare, quantity=7)
+        ProductStockTotal.objects.filter(product=bolt).update(quantity=1)
+
+        call_command('rebuild_stock_summary', chunk_size=1, stdout=io.StringIO())
+        rebuilt = StockSummary.objects.order_by('product_id', 'warehouse_id').values_list(
+            'product_id', 'warehouse_id', 'quantity', 'reserved_quantity', 'reorder_point'
+        )
+        self.assertEqual(list(rebuilt), sorted(expected))
+        self.assertEqual(dict(ProductStockTotal.objects.values_list('product_id', 'quantity')), totals)
+
+
+class AdminQueryBudgetTests(TestCase):
+    """
+    Every changelist and change view must stay within a fixed query budget,
+    however many rows it shows
+    """
+    budget = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        cls.source = Warehouse.objects.create(name='Source')
+        cls.target = Warehouse.objects.create(name='Target')
+        cls.stockard = Stockard.objects.create(warehouse=cls.source, name='Bin A')
+        cls.product = Product.objects.create(name='Product')
+        cls.movement = StockMovement.objects.create(
+            movement_type='TRANSFER',
+            from_warehouse=cls.source,
+            to_warehouse=cls.target,
+            created_by=cls.user
+        )
+        now = timezone.now()
+        cls.reservation = StockReservation.objects.create(
+            product=cls.product, warehouse=cls.source, quantity=1, expires_at=now, movement=cls.movement
+        )
+        cls.snapshot = StockSnapshot.objects.create(product=cls.product, warehouse=cls.source, quantity=1, taken_at=now)
+        cls.alert = StockAlert.objects.create(
+            product=cls.product, warehouse=cls.source, kind='LOW', quantity=1, reorder_point=2
+        )
+        cls.event = OutboxEvent.objects.create(kind='movement.saved', movement=cls.movement)
+        cls.archived = ArchivedStockMovement.objects.create(
+            id=10 ** 6, movement_type='TRANSFER', from_warehouse=cls.source, to_warehouse=cls.target,
+            reference_number='ARCHIVED', created_at=now, created_by=cls.user
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.rows = 0
+
+    def add_rows(self, count):
+        start = self.rows
+        self.rows += count
+        products = Product.objects.bulk_create(
+            [Product(name=f'Product {i}') for i in range(start, self.rows)]
+        )
+        stockards = Stockard.objects.bulk_create(
+            [Stockard(warehouse=self.source, name=f'Bin {i}') for i in range(start, self.rows)]
+        )
+        Stock.objects.bulk_create([
+            Stock(product=product, stockard=stockard, quantity=10)
+            for product, stockard in zip(products, stockards)
+        ])
+        Stock.objects.bulk_create([
+            Stock(product=product, stockard=self.stockard, quantity=10) for product in products
+        ])
+        Stock.objects.bulk_create([
+            Stock(product=self.product, stockard=stockard, quantity=10) for stockard in stockards
+        ])
+        StockSummary.objects.bulk_create([
+            StockSummary(product=product, warehouse=self.source, quantity=10) for product in products
+        ])
+        movements = StockMovement.objects.bulk_create([
+            StockMovement(
+                movement_type='TRANSFER',
+                from_warehouse=self.source,
+                to_warehouse=self.target,
+                reference_number=f'TEST-{i}',
+                created_by=self.user
+            )
+            for i in range(start, self.rows)
+        ])
+        StockMovementItem.objects.bulk_create([
+            StockMovementItem(
+                movement=self.movement,
+                product=product,
+                from_stockard=stockard,
+                to_stockard=self.stockard,
+                quantity=1
+            )
+            for product, stockard in zip(products, stockards)
+        ])
+        now = timezone.now()
+        StockReservation.objects.bulk_create([
+            StockReservation(
+                product=product, warehouse=self.source, quantity=1, reference=f'Order {product.pk}', expires_at=now,
+                movement=movement
+            )
+            for product, movement in zip(products, movements)
+        ])
+        StockSnapshot.objects.bulk_create([
+            StockSnapshot(product=product, warehouse=self.source, quantity=10, taken_at=now) for product in products
+        ])
+        StockAlert.objects.bulk_create([
+            StockAlert(product=product, warehouse=self.source, kind='LOW', quantity=1, reorder_point=2)
+            for product in products
+        ])
+        OutboxEvent.objects.bulk_create([
+            OutboxEvent(kind='movement.saved', movement=movement) for movement in movements
+        ])
+        archived = ArchivedStockMovement.objects.bulk_create([
+            ArchivedStockMovement(
+                id=movement.pk, movement_type='TRANSFER', from_warehouse=self.source, to_warehouse=self.target,
+                reference_number=f'ARCHIVED-{movement.pk}', created_at=now, created_by=self.user
+            )
+            for movement in movements
+        ])
+        ArchivedStockMovementItem.objects.bulk_create([
+            ArchivedStockMovementItem(
+                id=movement.pk, movement=self.archived, product=product, from_stockard=stockard,
+                to_stockard=self.stockard, quantity=1, posted_at=now
+            )
+            for product, stockard, movement in zip(products, stockards, archived)
+        ])
+        return movements
+
+    def assertWithinBudget(self, url):
+        # Warm the content type and permission caches first
+        self.client.get(url)
+        counts = []
+        for rows in (2, 20):
+            self.add_rows(rows)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        self.assertLessEqual(counts[-1], self.budget, f'{url} ran {counts[-1]} queries')
+        self.assertEqual(counts[0], counts[1], f'{url} query count grows with rows: {counts}')
+
+    def test_changelists(self):
+        for model in (
+            Warehouse, Stockard, Product, Stock, StockMovement, StockSummary, StockReservation, StockSnapshot,
+            StockAlert, OutboxEvent, ArchivedStockMovement
+        ):
+            with self.subTest(model=model._meta.model_name):
+                self.assertWithinBudget(reverse(f'admin:inventory_{model._meta.model_name}_changelist'))
+
+    def test_change_views(self):
+        stock = Stock.objects.create(product=self.product, stockard=Stockard.objects.create(
+            warehouse=self.target, name='Bin B'
+        ))
+        for obj in (
+            self.source, self.stockard, self.product, stock, self.movement, self.reservation, self.snapshot,
+            self.alert, self.event, self.archived
+        ):
+            with self.subTest(model=obj._meta.model_name):
+                self.assertWithinBudget(
+                    reverse(f'admin:inventory_{obj._meta.model_name}_change', args=[obj.pk])
+                )
+
+
+class PrefixAutocompleteTests(TestCase):
+    """
+    Autocomplete pages through every match, from the cache for the first
+    pages and from the database past them
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        Product.objects.bulk_create([Product(name=f'Bolt {i:03}') for i in range(130)] + [Product(name='Nut')])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_every_page(self):
+        names = []
+        page = 0
+        more = True
+        while more:
+            page += 1
+            response = self.client.get(reverse('admin:autocomplete'), {
+                'term': 'bolt', 'app_label': 'inventory', 'model_name': 'stock', 'field_name': 'product', 'page': page
+            })
+            names += [result['text'] for result in response.json()['results']]
+            more = response.json()['pagination']['more']
+        self.assertEqual(page, 7)
+        self.assertEqual(names, [f'Bolt {i:03}' for i in range(130)])
+
+    def test_terms_match_as_the_key_folds_them(self):
+        Product.objects.bulk_create([Product(name=name) for name in ('Éclair', 'Ecru', 'Bolt-M4', 'Boltz')])
+
+        def search(term):
+            response = self.client.get(reverse('admin:autocomplete'), {
+                'term': term, 'app_label': 'inventory', 'model_name': 'stock', 'field_name': 'product'
+            })
+            return [result['text'] for result in response.json()['results']]
+        # An upper-case letter the database does not fold is still found
+        self.assertIn('Éclair', search('Éc'))
+        self.assertEqual(search('EC'), ['Ecru'])
+        self.assertEqual(search('bolt-'), ['Bolt-M4'])
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Paging through a changelist reaches every row once, whatever it is
+    sorted by
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        main = Warehouse.objects.create(name='Main')
+        stockard = Stockard.objects.create(warehouse=main, name='Bin')
+        # Product names sort the other way round from their ids
+        products = Product.objects.bulk_create([Product(name=f'Product {999 - i}') for i in range(150)])
+        Stock.objects.bulk_create([Stock(product=product, stockard=stockard, quantity=1) for product in products])
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                movement_type='TRANSFER' if i % 2 else 'IN', from_warehouse=main if i % 2 else None,
+                to_warehouse=stockard.warehouse if not i % 2 else Warehouse.objects.get_or_create(name='Spare')[0],
+                reference_number=f'MOVE-{i}'
+            )
+            for i in range(150)
+        ])
+
+    def walk(self, model, **params):
+        url = reverse(f'admin:inventory_{model._meta.model_name}_changelist')
+        self.client.force_login(self.user)
+        response = self.client.get(url, params)
+        seen = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            changelist = response.context['cl']
+            seen += [row.pk for row in changelist.result_list]
+            if hasattr(changelist, 'next_url'):
+                if not changelist.next_url:
+                    return seen
+                response = self.client.get(url + changelist.next_url)
+            elif changelist.page_num < changelist.paginator.num_pages:
+                response = self.client.get(url, {**params, 'p': changelist.page_num + 1})
+            else:
+                return seen
+
+    def test_every_row_once(self):
+        # By product, which sorts by name, and by the nullable from_warehouse
+        cases = (
+            (Stock, {}), (Stock, {'o': '1'}), (StockMovement, {}), (StockMovement, {'o': '3'}),
+            (StockMovement, {'o': '-3'}),
+        )
+        for model, params in cases:
+            with self.subTest(model=model.__name__, **params):
+                seen = self.walk(model, **params)
+                self.assertEqual(len(seen), 150)
+                self.assertEqual(set(seen), set(model.objects.values_list('pk', flat=True)))
+
+
+class SearchBackendTests(TestCase):
+    """
+    Changelist searches through the search backend find the same rows as
+    Django's icontains search
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        warehouse = Warehouse.objects.create(name='North Depot')
+        stockard = Stockard.objects.create(warehouse=warehouse, name='Cold Room')
+        widget = Product.objects.create(name='Blue Widget', description='Boxed')
+        gadget = Product.objects.create(name='Gadget')
+        Stock.objects.bulk_create([
+            Stock(product=widget, stockard=stockard, quantity=5),
+            Stock(product=gadget, stockard=stockard, quantity=5),
+        ])
+        cls.movement = StockMovement.objects.create(
+            movement_type='IN', to_warehouse=warehouse, notes='Urgent delivery', created_by=cls.user
+        )
+        StockMovementItem.objects.bulk_create([
+            StockMovementItem(movement=cls.movement, product=widget, to_stockard=stockard, quantity=1),
+            StockMovementItem(movement=cls.movement, product=gadget, to_stockard=stockard, quantity=1),
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def search(self, model, term):
+        response = self.client.get(reverse(f'admin:inventory_{model._meta.model_name}_changelist'), {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return sorted(obj.pk for obj in response.context['cl'].result_list)
+
+    def test_stock_search(self):
+        for term, expected in (('widget', 1), ('cold', 2), ('north gadget', 1), ('ox', 1), ('missing', 0)):
+            with self.subTest(term=term):
+                self.assertEqual(len(self.search(Stock, term)), expected)
+
+    def test_renamed_rows_are_found(self):
+        Product.objects.filter(name='Gadget').update(name='Sprocket')
+        self.assertEqual(len(self.search(Stock, 'sprocket')), 1)
+        self.assertEqual(self.search(Stock, 'gadget'), [])
+
+    def test_movement_search(self):
+        # Matching two items still lists the movement once
+        self.assertEqual(self.search(StockMovement, 'e'), [self.movement.pk])
+        self.assertEqual(self.search(StockMovement, 'urgent widget'), [self.movement.pk])
+        self.assertEqual(self.search(StockMovement, self.movement.reference_number), [self.movement.pk])
+
+
+class ChunkedImportTests(TestCase):
+    """
+    Streaming imports give the same stock and summaries as posting the rows
+    one at a time
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.warehouse = Warehouse.objects.create(name='Main')
+
+    def run_import(self, resource, csv):
+        results = [result for _start, result in stream_import(resource, io.BytesIO(csv.encode()), chunk_size=2)]
+        return [error.error for result in results for error in result.base_errors]
+
+    def test_stock_import(self):
+        errors = self.run_import(StockResource(), (
+            'product,warehouse,stockard,quantity\n'
+            'Bolt,Main,A1,5\n'
+            'Bolt,Main,A1,7\n'
+            'Nut,Main,A2,3\n'
+        ))
+        self.assertEqual(errors, [])
+        self.assertEqual(Stock.objects.get(product__name='Bolt', stockard__name='A1').quantity, 7)
+        self.run_import(StockResource(), 'product,warehouse,stockard,quantity\nBolt,Main,A1,2\n')
+        self.assertEqual(
+            dict(StockSummary.objects.values_list('product__name', 'quantity')), {'Bolt': 2, 'Nut': 3}
+        )
+        # Imported quantities reach the ledger as adjustments, not drift
+        self.assertEqual(find_drift(), [])
+        self.assertEqual(
+            sorted(StockMovement.objects.filter(notes='Stock import').values_list('movement_type', flat=True)),
+            ['IN', 'IN', 'OUT']
+        )
+
+    @unittest.skipUnless(connection.features.has_select_for_update, 'Needs SELECT ... FOR UPDATE')
+    def test_stock_import_locks_rows(self):
+        csv = 'product,warehouse,stockard,quantity\nBolt,Main,A1,5\n'
+        self.run_import(StockResource(), csv)
+        with CaptureQueriesContext(connection) as queries:
+            self.run_import(StockResource(), csv)
+        stock_reads = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT') and 'FROM "inventory_stock"' in query['sql']
+        ]
+        self.assertTrue(stock_reads)
+        self.assertIn('FOR UPDATE', stock_reads[0])
+
+    def test_rows_keep_file_numbers(self):
+        chunks = list(stream_import(StockResource(), io.BytesIO((
+            'product,warehouse,stockard,quantity\n'
+            'Bolt,Main,A1,5\n'
+            '\n'
+            ',,,\n'
+            'Nut,Nowhere,A2,3\n'
+        ).encode()), chunk_size=2))
+        self.assertEqual([numbers for numbers, _result in chunks], [[2], [5]])
+        invalid = [numbers[row.number - 1] for numbers, result in chunks for row in result.invalid_rows]
+        self.assertEqual(invalid, [5])
+
+    def test_movement_items_post_in_order(self):
+        Product.objects.create(name='Bolt')
+        self.run_import(StockMovementResource(), (
+            'reference_number,movement_type,from_warehouse,to_warehouse\n'
+            'R1,IN,,Main\n'
+            'R2,OUT,Main,\n'
+            'R3,OUT,Main,\n'
+        ))
+        # R2 issues what R1 received in the same chunk
+        errors = self.run_import(StockMovementItemResource(), (
+            'reference_number,product,quantity\n'
+            'R1,Bolt,4\n'
+            'R2,Bolt,3\n'
+        ))
+        self.assertEqual(errors, [])
+        self.assertEqual(StockSummary.objects.get().quantity, 1)
+
+        errors = self.run_import(StockMovementItemResource(), 'reference_number,product,quantity\nR3,Bolt,2\n')
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(StockSummary.objects.get().quantity, 1)
+        self.assertFalse(StockMovementItem.objects.filter(movement__reference_number='R3').exists())
+
+
+class StreamingExportTests(TestCase):
+    """
+    The export actions stream every selected row as CSV or XLSX
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        warehouse = Warehouse.objects.create(name='Main')
+        stockard = Stockard.objects.create(warehouse=warehouse, name='A1')
+        products = Product.objects.bulk_create([Product(name=f'Bolt, size {i}') for i in range(5)])
+        Stock.objects.bulk_create([Stock(product=product, stockard=stockard, quantity=3) for product in products])
+        movement = StockMovement.objects.create(movement_type='IN', to_warehouse=warehouse)
+        StockMovementItem.objects.bulk_create([
+            StockMovementItem(movement=movement, product=product, to_stockard=stockard, quantity=1)
+            for product in products
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def export(self, model, action):
+        response = self.client.post(reverse(f'admin:inventory_{model._meta.model_name}_changelist'), {
+            'action': action, 'select_across': '1', 'index': '0',
+            '_selected_action': list(model.objects.values_list('pk', flat=True)),
+        })
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self.export(Stock, 'export_csv').decode('utf-8-sig'))))
+        self.assertEqual(rows[0], ['product', 'warehouse', 'stockard', 'quantity', 'updated_at'])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][:4], ['Bolt, size 0', 'Main', 'A1', '3'])
+        # The exported columns import back through StockResource
+        results = stream_import(StockResource(), io.BytesIO(self.export(Stock, 'export_csv')))
+        self.assertFalse(any(result.has_errors() for _start, result in results))
+
+    def test_xlsx(self):
+        archive = zipfile.ZipFile(io.BytesIO(self.export(StockMovement, 'export_xlsx')))
+        self.assertIsNone(archive.testzip())
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 6)
+        self.assertIn('Bolt, size 4', sheet)
+
+
+class StockAsOfTests(TestCase):
+    """
+    Point-in-time stock matches a full replay of the ledger, with or
+    without snapshots in between
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Warehouse.objects.create(name='Main')
+        cls.spare = Warehouse.objects.create(name='Spare')
+        cls.bolt = Product.objects.create(name='Bolt')
+        cls.start = timezone.now() - datetime.timedelta(days=10)
+
+    def move(self, day, movement_type, quantity, from_warehouse=None, to_warehouse=None):
+        movement = StockMovement.objects.create(
+            movement_type=movement_type, from_warehouse=from_warehouse, to_warehouse=to_warehouse
+        )
+        post_movement(movement, [StockMovementItem(product=self.bolt, quantity=quantity)])
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=self.start + datetime.timedelta(days=day))
+        StockMovementItem.objects.filter(movement=movement).update(posted_at=self.start + datetime.timedelta(days=day))
+        return movement
+
+    def day(self, day):
+        return self.start + datetime.timedelta(days=day, hours=12)
+
+    def test_replay_with_and_without_snapshots(self):
+        self.move(0, 'IN', 10, to_warehouse=self.main)
+        self.move(2, 'TRANSFER', 4, from_warehouse=self.main, to_warehouse=self.spare)
+        self.move(4, 'OUT', 1, from_warehouse=self.spare)
+        main, spare = (self.bolt.pk, self.main.pk), (self.bolt.pk, self.spare.pk)
+        expected = {
+            1: {main: 10},
+            3: {main: 6, spare: 4},
+            5: {main: 6, spare: 3},
+        }
+        replayed = {day: stock_as_of(self.day(day)) for day in expected}
+        self.assertEqual(replayed, expected)
+
+        take_snapshot(self.day(1))
+        take_snapshot(period='DAY')
+        self.assertEqual({day: stock_as_of(self.day(day)) for day in expected}, expected)
+        self.assertEqual(stock_as_of(self.day(3), warehouse=self.spare), {spare: 4})
+        self.assertEqual(stock_as_of(self.day(-1)), {})
+        # The current snapshot answers on its own
+        self.assertEqual(stock_as_of(timezone.now()), {main: 6, spare: 3})
+
+    def test_query_count_does_not_follow_history(self):
+        for day in range(5):
+            self.move(day, 'IN', 1, to_warehouse=self.main)
+        take_snapshot(self.day(4))
+        with self.assertNumQueries(4):
+            self.assertEqual(stock_as_of(self.day(4)), {(self.bolt.pk, self.main.pk): 5})
+
+    def test_lines_changed_after_snapshot(self):
+        receipt = self.move(0, 'IN', 10, to_warehouse=self.main)
+        transfer = self.move(1, 'TRANSFER', 4, from_warehouse=self.main, to_warehouse=self.spare)
+        issue = self.move(2, 'OUT', 1, from_warehouse=self.spare)
+        take_snapshot(self.day(3))
+        before = timezone.now()
+
+        # Old movements edited, emptied and posted to after the snapshot
+        line = receipt.items.get()
+        line.quantity = 12
+        line.save()
+        issue.items.get().delete()
+        post_movement(transfer, [StockMovementItem(product=self.bolt, quantity=2)])
+        main, spare = (self.bolt.pk, self.main.pk), (self.bolt.pk, self.spare.pk)
+        current = dict(
+            ((product_id, warehouse_id), quantity)
+            for product_id, warehouse_id, quantity in StockSummary.objects.values_list(
+                'product_id', 'warehouse_id', 'quantity'
+            )
+        )
+        self.assertEqual(current, {main: 6, spare: 6})
+        self.assertEqual(stock_as_of(timezone.now()), current)
+        self.assertEqual(stock_as_of(before), {main: 6, spare: 3})
+        self.assertEqual(stock_as_of(self.day(1)), {main: 6, spare: 4})
+
+    def test_header_warehouse_changed_after_posting(self):
+        receipt = self.move(0, 'IN', 4, to_warehouse=self.main)
+        self.move(1, 'OUT', 3, from_warehouse=self.main)
+        # The lines stay in the stockards they were posted to
+        StockMovement.objects.filter(pk=receipt.pk).update(to_warehouse=self.spare)
+        main = (self.bolt.pk, self.main.pk)
+        self.assertEqual(stock_as_of(timezone.now()), {main: 1})
+
+        line = StockMovementItem.objects.get(movement=receipt)
+        line.quantity = 5
+        line.save()
+        summary = dict(
+            ((product_id, warehouse_id), quantity)
+            for product_id, warehouse_id, quantity in StockSummary.objects.values_list(
+                'product_id', 'warehouse_id', 'quantity'
+            )
+        )
+        self.assertEqual(stock_as_of(timezone.now()), summary)
+
+
+class StockLedgerTests(TestCase):
+    """
+    Stock drifted from the movement ledger is found and repaired together
+    with the summaries
+    """
+
+    def test_find_and_repair_drift(self):
+        main = Warehouse.objects.create(name='Main')
+        bolt = Product.objects.create(name='Bolt')
+        movement = StockMovement.objects.create(movement_type='IN', to_warehouse=main)
+        post_movement(movement, [StockMovementItem(product=bolt, quantity=5)])
+        self.assertEqual(find_drift(), [])
+
+        # Direct edits are written to the ledger as adjustments
+        stock = Stock.objects.get()
+        stock.quantity = 8
+        stock.save()
+        orphan = Stockard.objects.create(warehouse=main, name='Loose')
+        Stock.objects.create(product=bolt, stockard=orphan, quantity=2)
+        self.assertEqual(find_drift(), [])
+        adjustments = StockMovementItem.objects.filter(movement__notes='Stock edited directly')
+        self.assertEqual(
+            sorted(adjustments.values_list('to_stockard', 'quantity')), [(stock.stockard_id, 3), (orphan.pk, 2)]
+        )
+
+        # Ledger lines changed behind the stock engine's back
+        StockMovementItem.objects.filter(movement=movement).update(quantity=4)
+        adjustments.filter(to_stockard=orphan).delete()
+        drift = sorted(find_drift())
+        self.assertEqual(drift, [(bolt.pk, stock.stockard_id, 7, 8), (bolt.pk, orphan.pk, 0, 2)])
+        self.assertEqual(find_drift(warehouse_id=main.pk, stockards=(orphan.pk, orphan.pk + 1)), [drift[1]])
+
+        repair_drift(drift)
+        self.assertEqual(find_drift(), [])
+        self.assertEqual(StockSummary.objects.get().quantity, 7)
+
+    def test_adjustments_share_movements_per_transaction(self):
+        main = Warehouse.objects.create(name='Main')
+        bolt = Product.objects.create(name='Bolt')
+        stockards = [Stockard.objects.create(warehouse=main, name=f'S{number}') for number in range(3)]
+        adjustments = StockMovement.objects.filter(notes='Stock edited directly')
+        with transaction.atomic():
+            stocks = [Stock.objects.create(product=bolt, stockard=stockard, quantity=2) for stockard in stockards]
+            stocks[0].quantity = 1
+            stocks[0].save()
+        self.assertEqual(sorted(adjustments.values_list('movement_type', flat=True)), ['IN', 'OUT'])
+
+        stocks[1].quantity = 3
+        stocks[1].save()
+        with contextlib.suppress(DatabaseError), transaction.atomic():
+            stocks[2].quantity = 5
+            stocks[2].save()
+            raise DatabaseError
+        stocks[0].quantity = 4
+        stocks[0].save()
+        # The rolled back savepoint got its own movement, which went with it
+        self.assertEqual(adjustments.count(), 3)
+        latest = adjustments.latest('pk')
+        self.assertEqual(sorted(latest.items.values_list('to_stockard', 'quantity')), [
+            (stockards[0].pk, 3), (stockards[1].pk, 1)
+        ])
+        self.assertEqual(find_drift(), [])
+
+    def test_deleted_stockards_and_warehouses(self):
+        main, spare = Warehouse.objects.create(name='Main'), Warehouse.objects.create(name='Spare')
+        bolt = Product.objects.create(name='Bolt')
+        for warehouse, quantity in ((main, 5), (spare, 3)):
+            movement = StockMovement.objects.create(movement_type='IN', to_warehouse=warehouse)
+            post_movement(movement, [StockMovementItem(product=bolt, quantity=quantity)])
+        loose = Stockard.objects.create(warehouse=main, name='Loose')
+        Stock.objects.create(product=bolt, stockard=loose, quantity=2)
+
+        loose.delete()
+        self.assertEqual(StockSummary.objects.get(warehouse=main).quantity, 5)
+        spare.delete()
+        self.assertEqual(list(StockSummary.objects.values_list('warehouse', 'quantity')), [(main.pk, 5)])
+        self.assertEqual(ProductStockTotal.objects.get(product=bolt).quantity, 5)
+        self.assertEqual(find_drift(), [])
+
+
+class EmptyBinsStrategy(PickStrategy):
+    def allocate(self, bins, quantity):
+        return super().allocate([], quantity)
+
+
+class MovementItemEditTests(TestCase):
+    """
+    Re-saving, editing and deleting movement lines applies only the net
+    change in stock
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        cls.main = Warehouse.objects.create(name='Main')
+        cls.bolt = Product.objects.create(name='Bolt')
+        receipt = StockMovement.objects.create(movement_type='IN', to_warehouse=cls.main)
+        post_movement(receipt, [StockMovementItem(product=cls.bolt, quantity=10)])
+
+    def on_hand(self):
+        return StockSummary.objects.get(product=self.bolt, warehouse=self.main).quantity
+
+    def test_resave_and_delete(self):
+        item = StockMovementItem.objects.get()
+        item.save()
+        self.assertEqual(self.on_hand(), 10)
+        item.quantity = 4
+        item.save()
+        item.save()
+        self.assertEqual(Stock.objects.get().quantity, 4)
+        self.assertEqual(self.on_hand(), 4)
+        self.assertEqual(StockMovementItem.objects.get().delete(), (1, {'inventory.StockMovementItem': 1}))
+        self.assertEqual(self.on_hand(), 0)
+        self.assertFalse(StockMovementItem.objects.exists())
+
+    def test_delete_movements(self):
+        issue = StockMovement.objects.create(movement_type='OUT', from_warehouse=self.main)
+        post_movement(issue, [StockMovementItem(product=self.bolt, quantity=4)])
+        self.assertEqual(self.on_hand(), 6)
+        _deleted, counts = issue.delete()
+        self.assertEqual(counts['inventory.StockMovementItem'], 1)
+        self.assertEqual(self.on_hand(), 10)
+
+        # The changelist's bulk delete action
+        self.client.force_login(self.user)
+        self.client.post(reverse('admin:inventory_stockmovement_changelist'), {
+            'action': 'delete_selected', '_selected_action': [StockMovement.objects.get().pk], 'post': 'yes'
+        })
+        self.assertFalse(StockMovement.objects.exists())
+        self.assertEqual(self.on_hand(), 0)
+        self.assertEqual(find_drift(), [])
+
+    def post_lines(self, movement, lines):
+        self.client.force_login(self.user)
+        existing = list(movement.items.order_by('pk')) if movement.pk else []
+        data = {
+            'movement_type': 'OUT', 'from_warehouse': self.main.pk, 'to_warehouse': '',
+            'reference_number': movement.reference_number, 'notes': '',
+            'items-TOTAL_FORMS': len(lines), 'items-INITIAL_FORMS': len(existing),
+            'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000, '_save': 'Save',
+        }
+        for index, (quantity, delete) in enumerate(lines):
+            data.update({
+                f'items-{index}-id': existing[index].pk if index < len(existing) else '',
+                f'items-{index}-product': self.bolt.pk,
+                f'items-{index}-quantity': quantity,
+            })
+            if delete:
+                data[f'items-{index}-DELETE'] = 'on'
+        if movement.pk:
+            url = reverse('admin:inventory_stockmovement_change', args=[movement.pk])
+        else:
+            url = reverse('admin:inventory_stockmovement_add')
+        return self.client.post(url, data)
+
+    def test_admin_edits(self):
+        movement = StockMovement(reference_number='OUT-1')
+        self.assertEqual(self.post_lines(movement, [(3, False)]).status_code, 302)
+        self.assertEqual(self.on_hand(), 7)
+        movement = StockMovement.objects.get(reference_number='OUT-1')
+
+        self.assertEqual(self.post_lines(movement, [(5, False)]).status_code, 302)
+        self.assertEqual(self.on_hand(), 5)
+        # Only 5 more can come out on top of the 5 already taken
+        response = self.post_lines(movement, [(5, False), (6, False)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.on_hand(), 5)
+
+        self.assertEqual(self.post_lines(movement, [(5, True)]).status_code, 302)
+        self.assertEqual(self.on_hand(), 10)
+        self.assertEqual(Stock.objects.get().quantity, 10)
+
+    @override_settings(INVENTORY_PICK_STRATEGY='inventory.tests.EmptyBinsStrategy')
+    def test_admin_pick_shortage(self):
+        # The formset check passes, but the pick finds nothing
+        response = self.post_lines(StockMovement(reference_number='OUT-1'), [(3, False)])
+        self.assertContains(response, 'No stock available for this product')
+        self.assertFalse(StockMovement.objects.filter(reference_number='OUT-1').exists())
+        self.assertEqual(self.on_hand(), 10)
+
+
+class StockardLookupCacheTests(TestCase):
+    """
+    Posting reads stockards through the lookup cache, which the signals
+    invalidate
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Warehouse.objects.create(name='Main')
+        cls.bolt = Product.objects.create(name='Bolt')
+
+    def setUp(self):
+        stockard_cache.reset_stats()
+
+    def tearDown(self):
+        # Entries outlive the rolled back rows whose ids they hold
+        stockard_cache.clear_local()
+        cache.clear()
+
+    def post(self, movement_type, quantity):
+        movement = StockMovement.objects.create(
+            movement_type=movement_type,
+            from_warehouse=self.main if movement_type == 'OUT' else None,
+            to_warehouse=self.main if movement_type == 'IN' else None
+        )
+        # Entries are stored once the posting transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            post_movement(movement, [StockMovementItem(product=self.bolt, quantity=quantity)])
+
+    def test_hits_and_invalidation(self):
+        self.post('IN', 10)
+        self.assertEqual(stockard_cache.stats()['misses'], 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.post('IN', 5)
+        self.assertEqual(stockard_cache.stats()['local_hits'], 1)
+        self.assertFalse([query for query in queries if 'inventory_stockard' in query['sql']])
+
+        # Renamed and deleted stockards are not handed out again
+        stockard = Stockard.objects.get()
+        stockard.name = 'Bolt Old'
+        stockard.save()
+        self.post('IN', 1)
+        self.assertEqual(Stock.objects.get(stockard__name='Bolt Stock').quantity, 1)
+        Stockard.objects.get(name='Bolt Stock').delete()
+        self.post('IN', 2)
+        self.assertEqual(Stock.objects.get(stockard__name='Bolt Stock').quantity, 2)
+        self.assertEqual(Stock.objects.get(stockard=stockard).quantity, 15)
+
+
+@override_settings(INVENTORY_API_TOKEN='secret', INVENTORY_API_MAX_PRODUCTS=3)
+class StockAvailabilityApiTests(TestCase):
+    """
+    The availability API reads the summaries and supports revalidation
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Warehouse.objects.create(name='Main')
+        cls.annex = Warehouse.objects.create(name='Annex')
+        cls.bolt = Product.objects.create(name='Bolt')
+        cls.nut = Product.objects.create(name='Nut')
+        for warehouse, quantity in ((cls.main, 10), (cls.annex, 4)):
+            receipt = StockMovement.objects.create(movement_type='IN', to_warehouse=warehouse)
+            post_movement(receipt, [StockMovementItem(product=cls.bolt, quantity=quantity)])
+
+    def get(self, headers=None, token='secret', **params):
+        url = reverse('inventory:stock-availability')
+        headers = dict(headers or {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        return self.client.get(url, params, headers=headers)
+
+    def test_availability(self):
+        self.assertEqual(self.get(token=None, products=self.bolt.pk).status_code, 403)
+        self.assertEqual(self.get(token='wrong', products=self.bolt.pk).status_code, 403)
+        self.assertEqual(self.get(products='1,2,3,4').status_code, 400)
+        self.assertEqual(self.get(products='bolt').status_code, 400)
+
+        with self.assertNumQueries(2):
+            response = self.get(products=f'{self.bolt.pk},{self.nut.pk}')
+        self.assertEqual(response.json()['products'], [
+            {
+                'id': self.bolt.pk, 'on_hand': 14, 'available': 14,
+                'warehouses': {str(self.main.pk): 10, str(self.annex.pk): 4}
+            },
+            {'id': self.nut.pk, 'on_hand': 0, 'available': 0, 'warehouses': {}},
+        ])
+        response = self.get(products=self.bolt.pk, warehouses=self.annex.pk)
+        self.assertEqual(response.json()['products'][0]['on_hand'], 4)
+
+    def test_revalidation(self):
+        response = self.get(products=self.bolt.pk)
+        etag = response.headers['ETag']
+        self.assertIn('Last-Modified', response.headers)
+        with self.assertNumQueries(1):
+            response = self.get({'If-None-Match': etag}, products=self.bolt.pk)
+        self.assertEqual(response.status_code, 304)
+
+        issue = StockMovement.objects.create(movement_type='OUT', from_warehouse=self.main)
+        post_movement(issue, [StockMovementItem(product=self.bolt, quantity=3)])
+        response = self.get({'If-None-Match': etag}, products=self.bolt.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.json()['products'][0]['on_hand'], 11)
+
+
+@override_settings(INVENTORY_API_TOKEN='secret')
+class AsyncStockApiTests(TestCase):
+    """
+    The API views and movement writes run from async code
+    """
+
+    async def test_post_and_read_movement(self):
+        main = await Warehouse.objects.acreate(name='Main')
+        bolt = await Product.objects.acreate(name='Bolt')
+        receipt = await StockMovement.objects.acreate(movement_type='IN', to_warehouse=main, reference_number='IN-1')
+        await apost_movement(receipt, [StockMovementItem(product=bolt, quantity=10)])
+        item = await StockMovementItem.objects.aget()
+        item.quantity = 6
+        await item.asave()
+
+        headers = {'Authorization': 'Bearer secret'}
+        url = reverse('inventory:movement-status', args=['IN-1'])
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response.json()['lines'], [{'product': bolt.pk, 'quantity': 6}])
+        response = await self.async_client.get(
+            reverse('inventory:stock-availability'), {'products': bolt.pk}, headers=headers
+        )
+        self.assertEqual(response.json()['products'][0]['on_hand'], 6)
+        response = await self.async_client.get(reverse('inventory:movement-status', args=['IN-2']), headers=headers)
+        self.assertEqual(response.status_code, 404)
+
+
+class StockReservationTests(TestCase):
+    """
+    Reservations hold stock against other movements until committed,
+    released or expired
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Warehouse.objects.create(name='Main')
+        cls.bolt = Product.objects.create(name='Bolt')
+        receipt = StockMovement.objects.create(movement_type='IN', to_warehouse=cls.main)
+        post_movement(receipt, [StockMovementItem(product=cls.bolt, quantity=10)])
+
+    def summary(self):
+        return StockSummary.objects.get(product=self.bolt, warehouse=self.main)
+
+    def issue(self, quantity):
+        movement = StockMovement.objects.create(movement_type='OUT', from_warehouse=self.main)
+        post_movement(movement, [StockMovementItem(product=self.bolt, quantity=quantity)])
+        return movement
+
+    def test_reserve_commit_release(self):
+        with self.assertNumQueries(4):
+            held, = reserve(self.main, {self.bolt: 6}, reference='order-1')
+        self.assertEqual(self.summary().available_quantity, 4)
+        with self.assertRaises(InsufficientStock):
+            reserve(self.main, {self.bolt: 5})
+        # Other movements cannot issue the held units
+        with self.assertRaises(InsufficientStock):
+            self.issue(5)
+        self.issue(4)
+
+        movement = StockMovement.objects.create(movement_type='OUT', from_warehouse=self.main)
+        commit_reservations([held], movement)
+        summary = self.summary()
+        self.assertEqual((summary.quantity, summary.reserved_quantity), (0, 0))
+        self.assertEqual(movement.items.get().quantity, 6)
+        with self.assertRaises(ValidationError):
+            commit_reservations([held], movement)
+
+        receipt = StockMovement.objects.create(movement_type='IN', to_warehouse=self.main)
+        post_movement(receipt, [StockMovementItem(product=self.bolt, quantity=3)])
+        held, = reserve(self.main, {self.bolt: 3})
+        self.assertEqual(release_reservations([held]), 1)
+        self.assertEqual(release_reservations([held]), 0)
+        self.assertEqual(self.summary().reserved_quantity, 0)
+
+    def test_expiry(self):
+        reserve(self.main, {self.bolt: 2}, ttl=60)
+        reserve(self.main, {self.bolt: 3}, ttl=-1)
+        reserve(self.main, {self.bolt: 4}, ttl=-1)
+        self.assertEqual(expire_reservations(batch_size=1), 2)
+        self.assertEqual(self.summary().reserved_quantity, 2)
+        self.assertEqual(StockReservation.objects.filter(status='EXPIRED').count(), 2)
+        later = timezone.now() + datetime.timedelta(minutes=2)
+        self.assertEqual(expire_reservations(later), 1)
+        self.assertEqual(self.summary().reserved_quantity, 0)
+
+    def test_release_and_expire_across_warehouses(self):
+        spare = Warehouse.objects.create(name='Spare')
+        nut = Product.objects.create(name='Nut')
+        receipt = StockMovement.objects.create(movement_type='IN', to_warehouse=spare)
+        post_movement(receipt, [StockMovementItem(product=self.bolt, quantity=5), StockMovementItem(product=nut, quantity=5)])
+        # Bolt in Main and Nut in Spare: Bolt in Spare is in the cross
+        # product of the two but not held
+        bolt_main, = reserve(self.main, {self.bolt: 2})
+        nut_spare, = reserve(spare, {nut: 3})
+        self.assertEqual(release_reservations([bolt_main, nut_spare]), 2)
+        reserve(self.main, {self.bolt: 2}, ttl=-1)
+        reserve(spare, {nut: 3}, ttl=-1)
+        self.assertEqual(expire_reservations(), 2)
+        self.assertEqual(
+            sorted(StockSummary.objects.values_list('product__name', 'warehouse__name', 'reserved_quantity')),
+            [('Bolt', 'Main', 0), ('Bolt', 'Spare', 0), ('Nut', 'Spare', 0)]
+        )
+
+
+class PickAllocationTests(TestCase):
+    """
+    Outbound lines are split over the bins a pick strategy chooses
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Warehouse.objects.create(name='Main')
+        cls.bolt = Product.objects.create(name='Bolt')
+        now = timezone.now()
+        cls.bins = {}
+        for name, quantity in (('A', 0), ('B', 5), ('C', 20), ('D', 8)):
+            stockard = Stockard.objects.create(warehouse=cls.main, name=name)
+            Stock.objects.create(product=cls.bolt, stockard=stockard, quantity=quantity)
+            cls.bins[name] = stockard
+        # D was stocked first, then C, B and A
+        for age, name in enumerate('DCBA'):
+            Stock.objects.filter(stockard=cls.bins[name]).update(created_at=now - datetime.timedelta(days=10 - age))
+
+    def pick(self, strategy, *quantities, queries=None):
+        movement = StockMovement.objects.create(movement_type='OUT', from_warehouse=self.main)
+        with self.assertNumQueries(queries) if queries is not None else contextlib.nullcontext():
+            post_movement(
+                movement, [StockMovementItem(product=self.bolt, quantity=quantity) for quantity in quantities],
+                strategy=strategy
+            )
+        return sorted(movement.items.values_list('from_stockard__name', 'quantity'))
+
+    def test_strategies(self):
+        # The smallest bin that covers the line rather than the fullest
+        self.assertEqual(self.pick('fewest', 3), [('B', 3)])
+        self.assertEqual(self.pick('name', 10), [('B', 2), ('C', 8)])
+        self.assertEqual(self.pick('largest', 4), [('C', 4)])
+        self.assertEqual(self.pick('fifo', 10), [('C', 2), ('D', 8)])
+        self.assertEqual(Stock.objects.get(stockard=self.bins['C']).quantity, 6)
+
+    def test_lines_share_bins(self):
+        picks = self.pick('largest', 15, 18, queries=11)
+        self.assertEqual(picks, [('B', 5), ('C', 5), ('C', 15), ('D', 8)])
+        self.assertFalse(Stock.objects.filter(quantity__gt=0).exists())
+        with self.assertRaises(InsufficientStock):
+            self.pick('name', 1)
+
+    def test_grown_line_is_picked_again(self):
+        self.assertEqual(self.pick('largest', 15), [('C', 15)])
+        item = StockMovementItem.objects.get(movement__movement_type='OUT')
+        item.quantity = 25
+        item.save()
+        # C's 15 units went back before the line was picked in name order
+        picks = sorted(item.movement.items.values_list('from_stockard__name', 'quantity'))
+        self.assertEqual(picks, [('B', 5), ('C', 20)])
+        stock = dict(Stock.objects.values_list('stockard__name', 'quantity'))
+        self.assertEqual(stock, {'A': 0, 'B': 0, 'C': 0, 'D': 8})
+        self.assertEqual(StockSummary.objects.get().quantity, 8)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite connection tuning')
+class SqliteConnectionTests(TestCase):
+    """
+    New SQLite connections get the PRAGMAs of INVENTORY_SQLITE_PRAGMAS
+    """
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        # Test cases run in a transaction, where the journal and sync
+        # settings are locked
+        busy_timeout = self.pragma('busy_timeout')
+        self.addCleanup(connection.cursor().execute, f'PRAGMA busy_timeout = {busy_timeout}')
+        with override_settings(INVENTORY_SQLITE_PRAGMAS={'busy_timeout': 1234}):
+            configure_connection(sender=type(connection), connection=connection)
+        self.assertEqual(self.pragma('busy_timeout'), 1234)
+
+
+@unittest.skipUnless('replica' in settings.DATABASES, 'Set DJANGO_DB_REPLICA_NAME to test replica routing')
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Changelists, exports and the stock API read from the replica until the
+    session writes. The test replica is a second, empty database, so rows
+    only on the primary show where a read went.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(user)
+        self.bolt = Product.objects.create(name='Bolt')
+        receipt = StockMovement.objects.create(movement_type='IN', to_warehouse=Warehouse.objects.create(name='Main'))
+        post_movement(receipt, [StockMovementItem(product=self.bolt, quantity=5)])
+
+    def test_reads_until_write(self):
+        changelist = reverse('admin:inventory_stock_changelist')
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertNotContains(self.client.get(changelist), 'Bolt')
+        self.assertTrue(any('inventory_stock' in query['sql'] for query in replica.captured_queries))
+        export = self.client.post(changelist, {
+            'action': 'export_csv', '_selected_action': list(Stock.objects.values_list('pk', flat=True)),
+        })
+        self.assertEqual(len(list(csv.reader(io.StringIO(b''.join(export.streaming_content).decode('utf-8-sig'))))), 1)
+        availability = self.client.get(reverse('inventory:stock-availability'), {'products': self.bolt.pk})
+        self.assertEqual(availability.json()['products'][0]['on_hand'], 0)
+
+        # A write pins the session to the primary
+        self.client.post(reverse('admin:inventory_warehouse_add'), {'name': 'Annex', 'description': ''})
+        self.assertContains(self.client.get(changelist), 'Bolt')
+        availability = self.client.get(reverse('inventory:stock-availability'), {'products': self.bolt.pk})
+        self.assertEqual(availability.json()['products'][0]['on_hand'], 5)
+
+    def test_transactions_read_primary(self):
+        self.assertEqual(router.db_for_read(Stock), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Stock), 'replica')
+            self.assertEqual(router.db_for_read(get_user_model()), 'default')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Stock), 'default')
+
+
+def failing_post(events):
+    raise DatabaseError('database is locked')
+
+
+class OutboxTests(TestCase):
+    """
+    Deferred posts are queued with the movement and posted by the outbox
+    worker in order per warehouse
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        cls.main = Warehouse.objects.create(name='Main')
+        cls.bolt = Product.objects.create(name='Bolt')
+
+    def on_hand(self):
+        return StockSummary.objects.filter(product=self.bolt, warehouse=self.main).values_list(
+            'quantity', flat=True
+        ).first() or 0
+
+    def post_receipt(self, reference_number, quantities, movement=None):
+        self.client.force_login(self.user)
+        data = {
+            'movement_type': 'IN', 'from_warehouse': '', 'to_warehouse': self.main.pk,
+            'reference_number': reference_number, 'notes': '',
+            'items-TOTAL_FORMS': len(quantities), 'items-INITIAL_FORMS': 0,
+            'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000, '_save': 'Save',
+        }
+        for index, quantity in enumerate(quantities):
+            data.update({f'items-{index}-product': self.bolt.pk, f'items-{index}-quantity': quantity})
+        if movement:
+            url = reverse('admin:inventory_stockmovement_change', args=[movement.pk])
+        else:
+            url = reverse('admin:inventory_stockmovement_add')
+        return self.client.post(url, data)
+
+    @override_settings(INVENTORY_DEFERRED_POSTING_LINES=2)
+    def test_deferred_admin_posts(self):
+        self.assertEqual(self.post_receipt('IN-1', [3]).status_code, 302)
+        self.assertEqual(self.on_hand(), 3)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+        self.assertEqual(self.post_receipt('IN-2', [2, 2]).status_code, 302)
+        # Small, but queued behind IN-2
+        self.assertEqual(self.post_receipt('IN-3', [1]).status_code, 302)
+        self.assertEqual(self.on_hand(), 3)
+        queued = StockMovement.objects.get(reference_number='IN-2')
+        self.assertFalse(queued.items.exists())
+        self.assertEqual(self.post_receipt('IN-2', [1], movement=queued).status_code, 200)
+
+        self.assertEqual(process_outbox(), 2)
+        self.assertEqual(self.on_hand(), 8)
+        self.assertEqual(queued.items.count(), 2)
+        self.assertEqual(set(OutboxEvent.objects.values_list('status', flat=True)), {'DONE'})
+
+    def test_order_and_retries(self):
+        receipt = StockMovement.objects.create(movement_type='IN', to_warehouse=self.main)
+        issue = StockMovement.objects.create(movement_type='OUT', from_warehouse=self.main)
+        first = defer_post(receipt, [StockMovementItem(product=self.bolt, quantity=5)])
+        second = defer_post(issue, [StockMovementItem(product=self.bolt, quantity=5)])
+
+        with override_settings(INVENTORY_OUTBOX_HANDLERS={'movement.post': 'inventory.tests.failing_post'}):
+            self.assertEqual(process_outbox(), 0)
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts, first.last_error), ('PENDING', 1, 'DatabaseError: database is locked'))
+        # The issue waits for the receipt's retry
+        self.assertEqual(process_outbox(), 0)
+        self.assertEqual(OutboxEvent.objects.get(pk=second.pk).attempts, 0)
+
+        self.assertEqual(process_outbox(now=timezone.now() + datetime.timedelta(minutes=1)), 2)
+        self.assertEqual(self.on_hand(), 0)
+        self.assertEqual(issue.items.get().quantity, 5)
+
+        failed = defer_post(issue, [StockMovementItem(product=self.bolt, quantity=1)])
+        self.assertEqual(process_outbox(), 1)
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, 'FAILED')
+        self.assertIn('No stock available', failed.last_error)
+
+
+class StockAlertTests(TestCase):
+    """
+    Crossing a reorder point is detected as the stock changes and sent
+    out in a digest
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.main = Warehouse.objects.create(name='Main')
+        cls.bolt = Product.objects.create(name='Bolt')
+        cls.nut = Product.objects.create(name='Nut')
+        receipt = StockMovement.objects.create(movement_type='IN', to_warehouse=cls.main)
+        post_movement(receipt, [
+            StockMovementItem(product=cls.bolt, quantity=10), StockMovementItem(product=cls.nut, quantity=10)
+        ])
+
+    def move(self, movement_type, quantity, product=None):
+        warehouses = {'IN': {'to_warehouse': self.main}, 'OUT': {'from_warehouse': self.main}}[movement_type]
+        movement = StockMovement.objects.create(movement_type=movement_type, **warehouses)
+        post_movement(movement, [StockMovementItem(product=product or self.bolt, quantity=quantity)])
+
+    def alerts(self):
+        return list(StockAlert.objects.order_by('pk').values_list('product__name', 'kind', 'quantity', 'reorder_point'))
+
+    def test_crossings(self):
+        set_reorder_point(self.bolt, self.main, 5)
+        self.move('OUT', 5)
+        self.assertEqual(self.alerts(), [])
+        self.move('OUT', 1)
+        self.move('OUT', 2)
+        self.move('IN', 2, product=self.nut)
+        self.assertEqual(self.alerts(), [('Bolt', 'LOW', 4, 5)])
+        with self.assertNumQueries(1):
+            self.assertEqual([summary.product_id for summary in open_shortages(self.main)], [self.bolt.pk])
+        self.move('IN', 3)
+        self.assertEqual(self.alerts()[1:], [('Bolt', 'RECOVERED', 5, 5)])
+        self.assertFalse(open_shortages().exists())
+
+        # Raising the point above the stock alerts at once; clearing it recovers
+        set_reorder_point(self.nut, self.main, 20)
+        set_reorder_point(self.nut, self.main, None)
+        self.assertEqual(self.alerts()[2:], [('Nut', 'LOW', 12, 20), ('Nut', 'RECOVERED', 12, 20)])
+
+    @override_settings(ADMINS=[('Stock', 'stock@example.com')])
+    def test_digest(self):
+        set_reorder_point(self.bolt, self.main, 5)
+        set_reorder_point(self.nut, self.main, 5)
+        self.move('OUT', 6)
+        self.move('IN', 1)
+        self.move('OUT', 2)
+        self.move('OUT', 8, product=self.nut)
+        self.assertEqual(send_digest(), 4)
+        message, = mail.outbox
+        self.assertIn('2 products below their reorder point', message.subject)
+        self.assertEqual(message.body.splitlines(), [
+            'Below reorder point: Bolt in Main, 3 of 5', 'Below reorder point: Nut in Main, 2 of 5'
+        ])
+        self.assertEqual(send_digest(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(StockAlert.objects.filter(sent_at__isnull=True).exists())
+
+
+@override_settings(INVENTORY_API_TOKEN='secret')
+class MovementArchiveTests(TestCase):
+    """
+    Closed movements past the horizon move to the archive tables without
+    changing the ledger, point-in-time stock or the admin filters
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        cls.main = Warehouse.objects.create(name='Main')
+        cls.spare = Warehouse.objects.create(name='Spare')
+        cls.bolt = Product.objects.create(name='Bolt')
+        cls.now = timezone.now()
+
+    def move(self, days_ago, movement_type, quantity, **warehouses):
+        movement = StockMovement.objects.create(movement_type=movement_type, **warehouses)
+        post_movement(movement, [StockMovementItem(product=self.bolt, quantity=quantity)])
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=self.now - datetime.timedelta(days=days_ago))
+        StockMovementItem.objects.filter(movement=movement).update(posted_at=self.now - datetime.timedelta(days=days_ago))
+        return movement
+
+    def test_archive_movements(self):
+        old = [
+            self.move(400, 'IN', 10, to_warehouse=self.main),
+            self.move(390, 'TRANSFER', 4, from_warehouse=self.main, to_warehouse=self.spare),
+            self.move(380, 'OUT', 1, from_warehouse=self.spare),
+        ]
+        queued = self.move(370, 'IN', 2, to_warehouse=self.main)
+        defer_post(queued, [StockMovementItem(product=self.bolt, quantity=1)])
+        recent = self.move(10, 'OUT', 3, from_warehouse=self.main)
+        history = {days: stock_as_of(self.now - datetime.timedelta(days=days)) for days in (395, 385, 375, 5)}
+        horizon = self.now - datetime.timedelta(days=365)
+
+        # One movement per batch, stopped after the first and resumed
+        self.assertEqual(archive_movements(horizon, batch_size=1, max_batches=1), 1)
+        self.assertEqual(archive_movements(horizon, batch_size=1), 2)
+        self.assertEqual(archive_movements(horizon), 0)
+        self.assertEqual(set(StockMovement.objects.values_list('pk', flat=True)), {queued.pk, recent.pk})
+        archived = ArchivedStockMovement.objects.get(pk=old[1].pk)
+        self.assertEqual(archived.reference_number, old[1].reference_number)
+        self.assertEqual(archived.created_at, self.now - datetime.timedelta(days=390))
+        self.assertEqual(list(archived.items.values_list('product', 'quantity')), [(self.bolt.pk, 4)])
+        self.assertEqual(sorted(ArchivedStockBalance.objects.values_list('quantity', flat=True)), [3, 6])
+
+        self.assertEqual(find_drift(), [])
+        self.assertEqual({days: stock_as_of(self.now - datetime.timedelta(days=days)) for days in history}, history)
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('inventory:movement-status', args=[old[0].reference_number]), headers={'Authorization': 'Bearer secret'}
+        )
+        self.assertEqual(response.json()['quantity'], 10)
+
+    def test_admin_archive_filter(self):
+        self.move(400, 'IN', 10, to_warehouse=self.main)
+        archive_movements(self.now - datetime.timedelta(days=365))
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('admin:inventory_stockmovement_changelist'), {'movement_type__exact': 'IN', 'tier': 'archive'}
+        )
+        archive = reverse('admin:inventory_archivedstockmovement_changelist')
+        self.assertRedirects(response, f'{archive}?movement_type__exact=IN')
+        archived = ArchivedStockMovement.objects.get()
+        self.assertEqual(self.client.get(archive, {'movement_type__exact': 'IN'}).context['cl'].result_list, [archived])
+        change = reverse('admin:inventory_archivedstockmovement_change', args=[archived.pk])
+        self.assertContains(self.client.get(change), 'Bolt')
+        self.assertEqual(self.client.get(reverse('admin:inventory_stockmovement_changelist')).context['cl'].result_count, 0)
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class LoggingTests(SimpleTestCase):
+    """
+    The queued logging pipeline drops and counts records instead of
+    blocking, samples chatty loggers, and keeps writing after a fork
+    """
+
+    def record(self, message, level=logging.INFO):
+        return logging.LogRecord('test', level, __file__, 0, message, (), None)
+
+    def test_full_queue_drops_and_counts(self):
+        target = RecordingHandler()
+        records = queue.Queue(2)
+        listener = logging.handlers.QueueListener(records, target)
+        handler = BoundedQueueHandler(records, listener)
+        for number in range(5):
+            handler.handle(self.record(f'record {number}'))
+        self.assertEqual(handler.dropped, 3)
+
+        listener.start()
+        handler.close()
+        self.assertEqual(
+            target.messages, ['record 0', 'record 1', 'Dropped 3 log records, the log queue was full']
+        )
+
+    def test_sampling_filter(self):
+        self.assertFalse(SamplingFilter(0).filter(self.record('query')))
+        self.assertTrue(SamplingFilter(0).filter(self.record('slow', logging.WARNING)))
+        self.assertTrue(SamplingFilter('1').filter(self.record('query')))
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'Needs fork')
+    def test_forked_child_keeps_logging(self):
+        for name, expected in (('shared.log', {'shared.log': ['parent', 'child']}), ('own.{pid}.log', None)):
+            with self.subTest(name=name), tempfile.TemporaryDirectory() as directory:
+                handler = queue_handler(os.path.join(directory, name))
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                handler.handle(self.record('parent'))
+                pid = os.fork()
+                if pid == 0:
+                    handler.handle(self.record('child'))
+                    handler.close()
+                    os._exit(0)
+                os.waitpid(pid, 0)
+                handler.close()
+                written = {}
+                for file in os.listdir(directory):
+                    with open(os.path.join(directory, file)) as log:
+                        written[file] = log.read().split()
+                expected = expected or {f'own.{os.getpid()}.log': ['parent'], f'own.{pid}.log': ['child']}
+                self.assertEqual(written, expected)
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = 'inventory'
+
+urlpatterns = [
+    path('stock/availability/', views.stock_availability, name='stock-availability'),
+    path('movements/<str:reference_number>/', views.movement_status, name='movement-status'),
+]
@@ -1,30 +1,99 @@
-from datetime import datetime
+import os
+import threading
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
 from django.utils import timezone
-from .models import StockMovement
+
+
+class ReferenceAllocator:
+    """
+    Hand out sequence numbers per prefix from blocks leased in the database.
+
+    Each thread leases ``block_size`` numbers at a time with one atomic
+    increment of the prefix's ``ReferenceSequence`` row and serves the block
+    from memory, so the common case issues no query. Numbers left in a block
+    when a process exits are simply skipped.
+    """
+
+    def __init__(self, block_size=100):
+        self.block_size = block_size
+        self.local = threading.local()
+
+    def next_value(self, prefix):
+        leases = self._leases()
+        lease = leases.get(prefix)
+        if lease is None or not lease.usable():
+            lease = leases[prefix] = self._lease(prefix)
+        value = lease.next
+        lease.next += 1
+        return value
+
+    def _leases(self):
+        # Forked workers must not reuse the blocks leased by their parent
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.pid = os.getpid()
+            self.local.leases = {}
+        return self.local.leases
+
+    def _lease(self, prefix):
+        from .models import ReferenceSequence
+
+        using = router.db_for_write(ReferenceSequence)
+        with transaction.atomic(using=using):
+            sequences = ReferenceSequence.objects.using(using).filter(prefix=prefix)
+            if not sequences.update(last_value=F('last_value') + self.block_size):
+                ReferenceSequence.objects.using(using).bulk_create(
+                    [ReferenceSequence(prefix=prefix)], ignore_conflicts=True
+                )
+                sequences.update(last_value=F('last_value') + self.block_size)
+            end = sequences.values_list('last_value', flat=True).get()
+        return Lease(end - self.block_size + 1, end, connections[using])
+
+
+class Lease:
+    """
+    A block of sequence numbers reserved by one thread.
+
+    A block leased inside an outer transaction only becomes durable when
+    that transaction commits; until then it may only be used while the
+    transaction, or savepoint, that leased it is still open, since a
+    rollback would hand it out again.
+    """
+
+    def __init__(self, start, end, connection):
+        self.next = start
+        self.end = end
+        self.connection = connection
+        self.pending = connection.in_atomic_block
+        if self.pending:
+            transaction.on_commit(self.confirm, using=connection.alias)
+
+    def confirm(self):
+        self.pending = False
+
+    def usable(self):
+        if self.next > self.end:
+            return False
+        if not self.pending:
+            return True
+        # Rolling back the lease also discards its on_commit callback, so
+        # the block is only usable while the callback is still queued
+        return any(entry[1] == self.confirm for entry in self.connection.run_on_commit)
+
+
+reference_allocator = ReferenceAllocator(
+    block_size=getattr(settings, 'INVENTORY_REFERENCE_BLOCK_SIZE', 100)
+)
+
 
 def generate_reference_number():
     """
-    Generate a unique reference number in the format INV-YYYYDDMM-four digit
+    Generate a unique reference number in the format INV-YYYYDDMM-NNNN
     """
-    # Get current date
-    now = timezone.now()
-    
     # Format date as YYYYDDMM
-    date_part = now.strftime('%Y%d%m')
-    
-    # Get the last 4 digits of the timestamp
-    # This ensures uniqueness by using microseconds
-    timestamp = now.timestamp()
-    unique_part = str(int(timestamp * 1000))[-4:]
-    
-    no_ref =  f'INV-{date_part}-{unique_part}'
-    
-    sm = StockMovement.objects.filter(reference_number=no_ref).first()
-    
-    if sm is not None:
-        unique_part = str(int(timestamp * 1000))[-4:]
-    
-        no_ref =  f'INV-{date_part}-{unique_part}'
-    
-    
-    return no_ref
+    date_part = timezone.now().strftime('%Y%d%m')
+    prefix = f'INV-{date_part}'
+
+    # The sequence is per day and grows past four digits when needed
+    return f'{prefix}-{reference_allocator.next_value(prefix):04d}'
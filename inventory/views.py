@@ -1,3 +1,152 @@
-from django.shortcuts import render
+import hashlib
+import hmac
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.translation import gettext as _
+from django.views.decorators.http import require_safe
+from .models import (
+    ArchivedStockMovement, ArchivedStockMovementItem, StockMovement, StockMovementItem, StockSummary
+)
+from .routers import replica_reads
 
-# Create your views here.
+
+def parse_ids(value):
+    """
+    Return the ids in a comma separated query parameter, in order and
+    without duplicates, or None when one is not a positive integer
+    """
+    ids = {}
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.isdigit() or int(part) < 1:
+            return None
+        ids.setdefault(int(part), None)
+    return list(ids)
+
+
+async def has_api_access(request):
+    token = getattr(settings, 'INVENTORY_API_TOKEN', None)
+    if token:
+        scheme, _space, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+            return True
+    user = await request.auser()
+    return user.is_authenticated and await user.ahas_perm('inventory.view_stock')
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def summaries(product_ids, warehouse_ids=None):
+    queryset = StockSummary.objects.filter(product_id__in=product_ids)
+    if warehouse_ids:
+        queryset = queryset.filter(warehouse_id__in=warehouse_ids)
+    return queryset.order_by()
+
+
+@require_safe
+async def stock_availability(request):
+    """
+    On-hand quantities of up to ``INVENTORY_API_MAX_PRODUCTS`` products, by
+    warehouse, as JSON.
+
+    ``?products=1,2,3`` lists the products and the optional
+    ``&warehouses=4,5`` limits the warehouses counted. Quantities come from
+    the stock summaries with one query; products without stock, or unknown,
+    are reported with 0. ``available`` leaves out units held by stock
+    reservations. The ETag and Last-Modified headers follow the
+    number of summary rows and their latest update, read with one aggregate
+    query, so a client revalidating with If-None-Match or If-Modified-Since
+    gets a 304 without the rows being read while nothing changed. Both are
+    read from the replica when one is configured.
+    """
+    if not await has_api_access(request):
+        return error(_('Authentication required'), status=403)
+
+    product_ids = parse_ids(request.GET.get('products', ''))
+    warehouse_ids = parse_ids(request.GET.get('warehouses', ''))
+    limit = getattr(settings, 'INVENTORY_API_MAX_PRODUCTS', 1000)
+    if not product_ids or warehouse_ids is None:
+        return error(_('"products" must list product ids, and "warehouses" warehouse ids, separated by commas'))
+    if len(product_ids) > limit:
+        return error(_('At most %(limit)d products can be requested at once') % {'limit': limit})
+
+    with replica_reads():
+        # Validators first: a revalidation that matches never reads the rows
+        queryset = summaries(product_ids, warehouse_ids)
+        state = await queryset.aaggregate(rows=Count('pk'), updated_at=Max('updated_at'))
+        updated_at = state['updated_at']
+        state = f'{state["rows"]}:{updated_at.isoformat() if updated_at else ""}'
+        etag = '"%s"' % hashlib.md5(state.encode(), usedforsecurity=False).hexdigest()
+        last_modified = int(updated_at.timestamp()) if updated_at else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            warehouses = {product_id: {} for product_id in product_ids}
+            reserved = dict.fromkeys(product_ids, 0)
+            # values() rather than values_list(): the latter runs its query
+            # outside the thread aiterator() hands the fetching to
+            rows = queryset.values('product_id', 'warehouse_id', 'quantity', 'reserved_quantity')
+            async for row in rows.aiterator(chunk_size=2000):
+                if row['quantity']:
+                    warehouses[row['product_id']][str(row['warehouse_id'])] = row['quantity']
+                reserved[row['product_id']] += row['reserved_quantity']
+            response = JsonResponse({
+                'products': [
+                    {
+                        'id': product_id,
+                        'on_hand': sum(by_warehouse.values()),
+                        'available': sum(by_warehouse.values()) - reserved[product_id],
+                        'warehouses': by_warehouse
+                    }
+                    for product_id, by_warehouse in warehouses.items()
+                ]
+            })
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    # Stock levels are per client and change at any time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@require_safe
+async def movement_status(request, reference_number):
+    """
+    A movement's type, warehouses and posted lines, by reference number
+    """
+    if not await has_api_access(request):
+        return error(_('Authentication required'), status=403)
+    fields = 'pk', 'reference_number', 'movement_type', 'from_warehouse_id', 'to_warehouse_id', 'created_at'
+    with replica_reads():
+        # Recent movements first; older ones may have been archived
+        for movement_model, item_model in (
+            (StockMovement, StockMovementItem), (ArchivedStockMovement, ArchivedStockMovementItem)
+        ):
+            movement = await movement_model.objects.values(*fields).filter(reference_number=reference_number).afirst()
+            if movement is not None:
+                break
+        else:
+            return error(_('No movement with this reference number'), status=404)
+
+        items = item_model.objects.filter(movement_id=movement['pk']).order_by('pk')
+        lines = [
+            {'product': row['product_id'], 'quantity': row['quantity']}
+            async for row in items.values('product_id', 'quantity').aiterator()
+        ]
+    return JsonResponse({
+        'reference_number': movement['reference_number'],
+        'movement_type': movement['movement_type'],
+        'from_warehouse': movement['from_warehouse_id'],
+        'to_warehouse': movement['to_warehouse_id'],
+        'created_at': movement['created_at'],
+        'posted': bool(lines),
+        'quantity': sum(line['quantity'] for line in lines),
+        'lines': lines,
+    })